@@ -26,6 +26,11 @@
     handle.write("<<<local>>>\nP intelmq-statistics ")
     stats = []
     for key in db.keys():
+        if db.type(key) == b'hash':
+            # latency histograms: <bot-id>.latency.<kind>
+            for field, value in sorted(db.hgetall(key).items()):
+                stats.append("%s.%s=%s" % (key.decode(), field.decode(), value.decode()))
+            continue
         value = db.get(key)
         if value is None:
             value = '0'
@@ -8,17 +8,40 @@
 
 @author: sebastian
 """
-import psycopg2
+import codecs
 import sys
-from psycopg2.extras import DictCursor
-from publicsuffixlist import PublicSuffixList
+
+import psycopg2
+from psycopg2.extras import DictCursor, execute_batch
+
+from intelmq.bots.experts.domain_suffix._lib import DEFAULT_CACHE_SIZE, SuffixLookup
 from .common import create_parser
 
+try:
+    from publicsuffixlist import PublicSuffixList
+except ImportError:
+    from intelmq.bots.experts.domain_suffix._lib import PublicSuffixList
+    BUNDLED_LIST = False
+else:
+    BUNDLED_LIST = True
+
 
 def eventdb_apply(host, port,
                   database, username, password,
                   table, dry_run, where,
-                  filename):
+                  filename, batch_size=1000, cache_size=DEFAULT_CACHE_SIZE):
+    if filename:
+        with codecs.open(filename, encoding='UTF-8') as handle:
+            psl = PublicSuffixList(source=handle, only_icann=True)
+    elif BUNDLED_LIST:
+        psl = PublicSuffixList(only_icann=True)
+    else:
+        print("Error: Python module 'publicsuffixlist' is needed if no public suffix list file is given, "
+              "but not available.", file=sys.stderr)
+        return 2
+    # the same memoized lookups as used by the domain suffix expert
+    lookup = SuffixLookup(psl, cache_size=cache_size)
+
     if password:
         password = input('Password for user %r on %r: ' % (username, host))
     where = 'AND ' + where if where else ''
@@ -27,7 +50,8 @@ def eventdb_apply(host, port,
                             password=password,
                             database=database,
                             host=host, port=port)
-    cur1 = con1.cursor(cursor_factory=DictCursor)
+    # server-side cursor, the rows are fetched in batches
+    cur1 = con1.cursor(name='apply_domain_suffix', cursor_factory=DictCursor)
     con2 = psycopg2.connect(user=username,
                             password=password,
                             database=database,
@@ -42,25 +66,46 @@ def eventdb_apply(host, port,
                  {where}
                  '''.format(table=table, where=where))
 
-    psl = PublicSuffixList(only_icann=True)
+    statements = {}
+    for space in ('source', 'destination'):
+        statements[space] = ('UPDATE {table} SET "{space}.domain_suffix" = %s WHERE id = %s'
+                             ''.format(table=table, space=space))
 
     counter = 0
-    for row in cur1:
-        counter += 1
-        if row['source.fqdn']:
-            cur2.execute('update events set "source.domain_suffix" = %s where id = %s', (psl.publicsuffix(row['source.fqdn'].encode('idna').decode()), row['id']))
-
-        if row['destination.fqdn']:
-            cur2.execute('update events set "destination.domain_suffix" = %s where id = %s', (psl.publicsuffix(row['destination.fqdn'].encode('idna').decode()), row['id']))
+    while True:
+        rows = cur1.fetchmany(batch_size)
+        if not rows:
+            break
+        counter += len(rows)
+        for space in ('source', 'destination'):
+            rows_space = [row for row in rows if row[space + '.fqdn']]
+            suffixes = lookup.publicsuffixes(row[space + '.fqdn'].encode('idna').decode() for row in rows_space)
+            parameters = [(suffix, row['id']) for suffix, row in zip(suffixes, rows_space)]
+            if dry_run:
+                for parameter in parameters:
+                    print(cur2.mogrify(statements[space], parameter).decode())
+            elif parameters:
+                execute_batch(cur2, statements[space], parameters, page_size=batch_size)
+    con1.close()
     con2.commit()
     print("Changed %d rows" % counter)
+    return 0
 
 
 def main():
     parser = create_parser(name='eventdb',
-                           description='Apply the mapping to an existing EventDB.')
-    args = parser.parse_args()
-    return eventdb_apply(**vars(args).copy())
+                           description='Apply the public domain suffix to an existing EventDB. '
+                                       'The public suffix list given with --filename is used, '
+                                       'otherwise the one bundled with the publicsuffixlist library.')
+    parser.add_argument('--batch-size', '-b', type=int, default=1000,
+                        help='Number of rows fetched and updated at once, default: 1000')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help='Number of domains for which the suffix is remembered, '
+                             'default: %d' % DEFAULT_CACHE_SIZE)
+    args = vars(parser.parse_args()).copy()
+    # only used by the mapping script
+    del args['malware_name_column'], args['malware_family_column']
+    return eventdb_apply(**args)
 
 
 if __name__ == "__main__":
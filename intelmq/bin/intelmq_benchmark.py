@@ -0,0 +1,372 @@
+# SPDX-FileCopyrightText: 2021 Sebastian Wagner
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# -*- coding: utf-8 -*-
+"""
+Benchmarks the throughput of bots.
+
+Runs one bot, given by its module, or a chain of bots from the runtime
+configuration against synthetic or recorded messages. Reports the throughput,
+the latency per message, the allocated memory and the peak RSS of the process.
+"""
+import argparse
+import base64
+import importlib
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import unittest.mock as mock
+from typing import Iterable, List, Optional
+
+import pkg_resources
+
+import intelmq.lib.message as message
+import intelmq.lib.pipeline as pipeline
+import intelmq.lib.utils as utils
+from intelmq import CONFIG_DIR, HARMONIZATION_CONF_FILE, RUNTIME_CONF_FILE
+from intelmq.lib.datatypes import BotType
+from intelmq.version import __version__
+
+APPNAME = "intelmq-benchmark"
+DESCRIPTION = """
+intelmq-benchmark measures the throughput of bots. Give either the module of a
+bot or the IDs of bots in the runtime configuration. Multiple bots are run as a
+chain: The output of a bot is the input of the next one, independent of the
+configured destination queues.
+
+For every bot, the number of processed messages per second, the median and 99th
+percentile of the processing time per message and optionally the allocated
+memory (--tracemalloc) are reported, as well as the peak RSS of the process.
+"""
+EPILOG = """
+Examples:
+  intelmq-benchmark intelmq.bots.experts.taxonomy.expert
+  intelmq-benchmark -n 100000 --pipeline redis --type json taxonomy-expert url2fqdn-expert
+  intelmq-benchmark --input events.json intelmq.bots.experts.url2fqdn.expert
+"""
+PIPELINES = ('pythonlist', 'redis', 'amqp')
+QUEUE_PREFIX = 'intelmq-benchmark'
+
+
+def synthetic_messages(count: int, message_type: str = 'Event') -> Iterable[dict]:
+    """
+    Generates valid messages of the given type with varying values.
+    """
+    for i in range(count):
+        if message_type == 'Report':
+            raw = '198.51.100.%d,host%d.example.com,http://host%d.example.com/%d\n' % (i % 256, i, i, i)
+            yield {'__type': 'Report',
+                   'feed.name': 'Benchmark',
+                   'feed.url': 'https://example.com/feed.csv',
+                   'raw': base64.b64encode(raw.encode()).decode(),
+                   'time.observation': '2021-01-01T00:00:00+00:00',
+                   }
+        else:
+            yield {'__type': 'Event',
+                   'classification.type': 'infected-system',
+                   'classification.taxonomy': 'malicious-code',
+                   'feed.name': 'Benchmark',
+                   'feed.url': 'https://example.com/feed.csv',
+                   'source.ip': '198.51.100.%d' % (i % 256),
+                   'source.port': 1024 + i % 64511,
+                   'source.fqdn': 'host%d.example.com' % i,
+                   'source.url': 'http://host%d.example.com/%d' % (i, i),
+                   'time.observation': '2021-01-01T00:00:00+00:00',
+                   'time.source': '2021-01-01T00:00:00+00:00',
+                   'extra.benchmark_id': i,
+                   'raw': base64.b64encode(b'benchmark').decode(),
+                   }
+
+
+def recorded_messages(filename: str, count: Optional[int], message_type: str = 'Event') -> Iterable[dict]:
+    """
+    Reads messages from a file with one JSON object per line, e.g. written by the
+    file output bot. The messages are repeated to get count messages if given.
+    """
+    with open(filename) as handle:
+        messages = [json.loads(line) for line in handle if line.strip()]
+    if not messages:
+        raise ValueError('No messages found in %r.' % filename)
+    for i in range(count if count else len(messages)):
+        msg = dict(messages[i % len(messages)])
+        msg.setdefault('__type', message_type)
+        yield msg
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+class Benchmark(object):
+    """
+    Sets up the bots of the chain with the pipelines for the benchmark and runs them.
+    """
+
+    def __init__(self, bots: List[str], pipeline_broker: str = 'pythonlist',
+                 pipeline_args: Optional[dict] = None, parameters: Optional[dict] = None,
+                 runtime_file: str = RUNTIME_CONF_FILE, logging_level: str = 'WARNING',
+                 trace_memory: bool = False):
+        self.pipeline_broker = pipeline_broker
+        self.pipeline_args = pipeline_args or {}
+        self.trace_memory = trace_memory
+        # the original function, as it is replaced by load_configuration while the bots are initialized
+        self._load_configuration = utils.load_configuration
+        self.logger = utils.log(APPNAME, log_path=False, log_level=logging_level)
+        self.harmonization = self.load_configuration(HARMONIZATION_CONF_FILE)
+
+        if os.path.exists(runtime_file):
+            configured = utils.load_configuration(runtime_file)
+        else:
+            configured = {}
+        self.runtime = {'global': dict(configured.get('global', {}))}
+        self.runtime['global'].update({'logging_handler': 'file',
+                                       'logging_path': False,
+                                       'logging_level': logging_level,
+                                       'rate_limit': 0,
+                                       'error_retry_delay': 0,
+                                       'error_max_retries': 0,
+                                       'instances_processes': 0,
+                                       'instances_threads': 0,
+                                       'testing': True})
+        self.stages = []
+        for index, bot in enumerate(bots):
+            if bot in configured and bot != 'global':
+                bot_id = bot
+                bot_config = json.loads(json.dumps(configured[bot]))
+            else:
+                bot_id = '%s-%d' % ('-'.join(bot.split('.')[-2:]).replace('_', '-'), index)
+                bot_config = {'module': bot, 'parameters': {}}
+            bot_config.setdefault('parameters', {})
+            bot_config['parameters'].update(parameters or {})
+            bot_config['parameters'].update({'source_pipeline_broker': pipeline_broker,
+                                             'destination_pipeline_broker': pipeline_broker,
+                                             'source_queue': '%s-%d' % (QUEUE_PREFIX, index),
+                                             })
+            bot_config['parameters'].update(self.pipeline_args)
+            paths = bot_config['parameters'].get('destination_queues') or {'_default': []}
+            bot_config['parameters']['destination_queues'] = {path: ['%s-%d' % (QUEUE_PREFIX, index + 1)]
+                                                              for path in paths}
+            bot_config['parameters']['destination_queues'].setdefault('_default', ['%s-%d' % (QUEUE_PREFIX, index + 1)])
+            self.runtime[bot_id] = bot_config
+            self.stages.append(bot_id)
+        self.output_queue = '%s-%d' % (QUEUE_PREFIX, len(bots))
+        # for counting and clearing the queues
+        self.queues = self.create_pipeline(None, 'source')
+        self.queues.set_queues(None, 'source')
+        self.queues.connect()
+
+        self.bots = []
+        with mock.patch('intelmq.lib.utils.load_configuration', new=self.load_configuration):
+            for bot_id in self.stages:
+                bot_class = importlib.import_module(self.runtime[bot_id]['module']).BOT
+                if bot_class.bottype == BotType.COLLECTOR:
+                    raise ValueError('Collector %r can not be benchmarked, as it has no input.' % bot_id)
+                self.runtime[bot_id]['group'] = bot_class.bottype.value
+                bot_instance = bot_class(bot_id)
+                # do not write the statistics of the benchmark to the statistics database
+                bot_instance._Bot__stats_cache = None
+                self.bots.append(bot_instance)
+
+    def load_configuration(self, configuration_filepath: str) -> dict:
+        """
+        Replaces the runtime configuration by the benchmark's one. Falls back
+        to the configuration files of the package if the file is not installed.
+        """
+        if configuration_filepath == RUNTIME_CONF_FILE and hasattr(self, 'runtime'):
+            return self.runtime
+        if not os.path.exists(configuration_filepath) and configuration_filepath.startswith(CONFIG_DIR):
+            configuration_filepath = pkg_resources.resource_filename('intelmq', os.path.join('etc/', os.path.basename(configuration_filepath)))
+        return self._load_configuration(configuration_filepath)
+
+    def create_pipeline(self, queues, direction: str) -> pipeline.Pipeline:
+        args = {'source_pipeline_broker': self.pipeline_broker,
+                'destination_pipeline_broker': self.pipeline_broker}
+        args.update(self.pipeline_args)
+        return pipeline.PipelineFactory.create(logger=self.logger, direction=direction,
+                                               queues=queues, pipeline_args=args)
+
+    def count(self, queue: str) -> int:
+        return self.queues.count_queued_messages(queue)[queue]
+
+    def clear(self):
+        for index in range(len(self.stages) + 1):
+            self.queues.clear_queue('%s-%d' % (QUEUE_PREFIX, index))
+            self.queues.clear_queue('%s-%d-internal' % (QUEUE_PREFIX, index))
+
+    def fill(self, messages: Iterable[dict]) -> int:
+        """ Sends the messages to the input queue of the first bot. """
+        pipe = self.create_pipeline(self.bots[0].source_queue, 'destination')
+        pipe.connect()
+        count = 0
+        for msg in messages:
+            msg_type = msg.pop('__type', 'Event')
+            pipe.send(getattr(message, msg_type)(msg, harmonization=self.harmonization).serialize())
+            count += 1
+        pipe.flush()
+        return count
+
+    def run_stage(self, bot) -> dict:
+        """
+        Processes all messages in the input queue of the bot, measuring the time of each one.
+        """
+        source = bot._Bot__source_pipeline
+        destination = bot._Bot__destination_pipeline
+        messages_in = self.count(bot.source_queue)
+        failures_before = bot._Bot__message_counter['failure']
+        latencies = []
+
+        if self.trace_memory:
+            tracemalloc.clear_traces()
+        start = time.perf_counter()
+        for _ in range(messages_in):
+            message_start = time.perf_counter()
+            bot.start(error_on_pipeline=False, source_pipeline=source, destination_pipeline=destination)
+            latencies.append(time.perf_counter() - message_start)
+        seconds = time.perf_counter() - start
+        if self.trace_memory:
+            memory_retained, memory_peak = tracemalloc.get_traced_memory()
+        else:
+            memory_retained = memory_peak = None
+        destination.flush()
+
+        latencies.sort()
+        next_queue = bot.destination_queues['_default'][0]
+        return {'bot_id': bot._Bot__bot_id,
+                'module': bot.__class__.__module__,
+                'messages_in': messages_in,
+                'messages_out': self.count(next_queue),
+                'failures': bot._Bot__message_counter['failure'] - failures_before,
+                'seconds': seconds,
+                'events_per_second': messages_in / seconds if seconds else None,
+                'latency_p50': percentile(latencies, 50) * 1000,
+                'latency_p99': percentile(latencies, 99) * 1000,
+                'latency_max': latencies[-1] * 1000 if latencies else 0.0,
+                'memory_peak': memory_peak,
+                'memory_retained': memory_retained,
+                }
+
+    def run(self, messages: Iterable[dict]) -> dict:
+        self.clear()
+        count = self.fill(messages)
+        if self.trace_memory:
+            tracemalloc.start()
+        results = []
+        try:
+            for bot in self.bots:
+                results.append(self.run_stage(bot))
+        finally:
+            if self.trace_memory:
+                tracemalloc.stop()
+            output = self.count(self.output_queue)
+            for bot in self.bots:
+                bot.stop(exitcode=0)
+            self.clear()
+        seconds = sum(result['seconds'] for result in results)
+        return {'intelmq_version': __version__,
+                'python_version': sys.version.split()[0],
+                'pipeline': self.pipeline_broker,
+                'messages': count,
+                'bots': results,
+                'total': {'seconds': seconds,
+                          'events_per_second': count / seconds if seconds else None,
+                          'messages_out': output,
+                          },
+                # on Linux in kilobytes
+                'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                }
+
+
+def format_text(result: dict) -> str:
+    lines = ['IntelMQ %s, Python %s, pipeline %s, %d messages.'
+             '' % (result['intelmq_version'], result['python_version'],
+                   result['pipeline'], result['messages'])]
+    for bot in result['bots']:
+        lines.append('%s (%s): %d messages in, %d out, %d failures in %.3f s: %.1f events/s, '
+                     'latency p50 %.3f ms, p99 %.3f ms, max %.3f ms.'
+                     '' % (bot['bot_id'], bot['module'], bot['messages_in'], bot['messages_out'],
+                           bot['failures'], bot['seconds'], bot['events_per_second'] or 0,
+                           bot['latency_p50'], bot['latency_p99'], bot['latency_max']))
+        if bot['memory_peak'] is not None:
+            lines.append('    memory allocated: peak %d bytes, retained %d bytes.'
+                         '' % (bot['memory_peak'], bot['memory_retained']))
+    lines.append('Total: %.3f s, %.1f events/s, %d messages out. Peak RSS: %d kB.'
+                 '' % (result['total']['seconds'], result['total']['events_per_second'] or 0,
+                       result['total']['messages_out'], result['peak_rss'] // 1024))
+    return '\n'.join(lines)
+
+
+def parse_parameter(parameter: str) -> tuple:
+    key, _, value = parameter.partition('=')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return key, value
+
+
+def main(args: Optional[list] = None):
+    parser = argparse.ArgumentParser(
+        prog=APPNAME,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=DESCRIPTION,
+        epilog=EPILOG,
+    )
+    parser.add_argument('bots', metavar='bot', nargs='+',
+                        help='module of a bot or ID of a bot in the runtime configuration')
+    parser.add_argument('--count', '-n', type=int, default=None,
+                        help='number of messages, default: 10000 synthetic ones or all of the input file')
+    parser.add_argument('--input', '-i', default=None,
+                        help='file with one JSON message per line, default: synthetic messages')
+    parser.add_argument('--parameter', '-p', action='append', default=[], type=parse_parameter,
+                        metavar='KEY=VALUE', help='bot parameter for all bots, the value is parsed as JSON if possible')
+    parser.add_argument('--pipeline', choices=PIPELINES, default='pythonlist',
+                        help='pipeline broker to use, default: pythonlist (in-memory)')
+    parser.add_argument('--pipeline-host', default=None, help='host of the pipeline broker')
+    parser.add_argument('--pipeline-port', type=int, default=None, help='port of the pipeline broker')
+    parser.add_argument('--pipeline-db', type=int, default=None, help='database of the redis broker')
+    parser.add_argument('--pipeline-password', default=None, help='password of the pipeline broker')
+    parser.add_argument('--runtime', default=RUNTIME_CONF_FILE,
+                        help='runtime configuration for bot IDs, default: %s' % RUNTIME_CONF_FILE)
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='trace memory allocations, slows the bots down')
+    parser.add_argument('--logging-level', default='WARNING', help='logging level of the bots, default: WARNING')
+    parser.add_argument('--type', '-t', choices=['text', 'json'], default='text',
+                        help='output type, json is machine-readable')
+    args = parser.parse_args(args)
+
+    pipeline_args = {}
+    for option in ('host', 'port', 'db', 'password'):
+        value = getattr(args, 'pipeline_%s' % option)
+        if value is not None:
+            pipeline_args['source_pipeline_%s' % option] = value
+            pipeline_args['destination_pipeline_%s' % option] = value
+
+    benchmark = Benchmark(args.bots, pipeline_broker=args.pipeline,
+                          pipeline_args=pipeline_args,
+                          parameters=dict(args.parameter),
+                          runtime_file=args.runtime,
+                          logging_level=args.logging_level,
+                          trace_memory=args.tracemalloc)
+    message_type = 'Report' if benchmark.bots[0].bottype == BotType.PARSER else 'Event'
+    if args.input:
+        messages = recorded_messages(args.input, args.count, message_type)
+    else:
+        messages = synthetic_messages(args.count or 10000, message_type)
+    result = benchmark.run(messages)
+
+    if args.type == 'json':
+        print(json.dumps(result, indent=4))
+    else:
+        print(format_text(result))
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -25,7 +25,7 @@
                      RUNTIME_CONF_FILE, VAR_RUN_PATH, STATE_FILE_PATH,
                      DEFAULT_LOGGING_PATH, __version_info__,
                      CONFIG_DIR, ROOT_DIR)
-from intelmq.lib import utils
+from intelmq.lib import cache, utils
 from intelmq.lib.datatypes import ReturnType, MESSAGES, LogLevel
 from intelmq.lib.processmanager import *
 from intelmq.lib.pipeline import PipelineFactory
@@ -135,11 +135,12 @@ def __init__(self, interactive: bool = False, returntype: ReturnType = ReturnTyp
         intelmqctl [start|stop|restart|status|reload] --group [collectors|parsers|experts|outputs]
         intelmqctl [start|stop|restart|status|reload] bot-id
         intelmqctl [start|stop|restart|status|reload]
-        intelmqctl list [bots|queues|queues-and-status]
+        intelmqctl list [bots|queues|queues-and-status|latencies]
         intelmqctl log bot-id [number-of-lines [log-level]]
         intelmqctl run bot-id message [get|pop|send]
         intelmqctl run bot-id process [--msg|--dryrun]
         intelmqctl run bot-id console
+        intelmqctl profile bot-id [--duration seconds]
         intelmqctl clear queue-id
         intelmqctl check
         intelmqctl upgrade-config
@@ -165,6 +166,10 @@ def __init__(self, interactive: bool = False, returntype: ReturnType = ReturnTyp
 See additional help for further explanation.
     intelmqctl run bot-id --help
 
+Profile the processing of a running bot for 60 seconds:
+    intelmqctl profile bot-id --duration 60
+The bot writes the profile to its logging path, see the bot's log for the filename.
+
 Starting the botnet (all bots):
     intelmqctl start
     etc.
@@ -184,6 +189,9 @@ def __init__(self, interactive: bool = False, returntype: ReturnType = ReturnTyp
 Get a list of all queues and status of the bots:
     intelmqctl list queues-and-status
 
+Get the processing time and the waiting time in the queue of the bots:
+    intelmqctl list latencies
+
 Clear a queue:
     intelmqctl clear queue-id
 
@@ -227,7 +235,7 @@ def __init__(self, interactive: bool = False, returntype: ReturnType = ReturnTyp
             subparsers = parser.add_subparsers(title='subcommands')
 
             parser_list = subparsers.add_parser('list', help='Listing bots or queues')
-            parser_list.add_argument('kind', choices=['bots', 'queues', 'queues-and-status'])
+            parser_list.add_argument('kind', choices=['bots', 'queues', 'queues-and-status', 'latencies'])
             parser_list.add_argument('--non-zero', '--quiet', '-q', action='store_true',
                                      help='Only list non-empty queues '
                                           'or the IDs of enabled bots.')
@@ -285,6 +293,12 @@ def __init__(self, interactive: bool = False, returntype: ReturnType = ReturnTyp
             parser_run_process.set_defaults(run_subcommand="process")
             parser_run.set_defaults(func=self.bot_run)
 
+            parser_profile = subparsers.add_parser('profile', help='Profile a running bot')
+            parser_profile.add_argument('bot_id', choices=self._configured_bots_list())
+            parser_profile.add_argument('--duration', '-d', type=int, default=60,
+                                        help='Number of seconds to profile the bot, default: 60.')
+            parser_profile.set_defaults(func=self.bot_profile)
+
             parser_check = subparsers.add_parser('check',
                                                  help='Check installation and configuration')
             parser_check.add_argument('--quiet', '-q', action='store_true',
@@ -433,6 +447,26 @@ def bot_run(self, **kwargs):
         print(results)
         return retval, None
 
+    def bot_profile(self, bot_id, duration=60):
+        """
+        Requests a running bot to profile its process() method for duration seconds.
+
+        The request is stored in the statistics database, the bot (and all its
+        threads and worker processes) writes the profile to its logging path.
+        """
+        if duration <= 0:
+            self.abort('The duration must be positive.')
+        until = time.time() + duration
+        try:
+            self._statistics_cache().set('%s.profile' % bot_id, repr(until), ttl=duration)
+        except Exception:
+            self._logger.exception('Could not store the profiling request, check your `statistics_*` settings.')
+            return 1, 'error'
+        if self._returntype is ReturnType.TEXT:
+            self._logger.info('Bot %s will profile process() for %d seconds and then write the profile '
+                              'to its logging path.', bot_id, duration)
+        return 0, {'bot_id': bot_id, 'until': datetime.datetime.fromtimestamp(until).isoformat()}
+
     def bot_start(self, bot_id, getstatus=True, group=None):
         if bot_id is None:
             return self.botnet_start(group=group)
@@ -608,6 +642,58 @@ def list(self, kind=None, non_zero=False, count=False, configured=False):
             q = self.list_queues()
             b = self.botnet_status()
             return q[0] | b[0], [q[1], b[1]]
+        elif kind == 'latencies':
+            return self.list_latencies()
+
+    def list_latencies(self):
+        """
+        Lists the latencies of the bots, as recorded in the statistics database.
+
+        For each bot and kind, the duration of processing a message ('process') and the waiting
+        time of the received messages in the queue ('queue'), the number of measurements,
+        the mean and the upper bounds of the buckets holding the median and the
+        99th percentile are given in seconds. Workers of a bot are combined.
+        The duration of processing is measured from receiving a message until
+        acknowledging it, excluding the time waiting for a message.
+        The waiting time is only measured if the previous bot has
+        `destination_pipeline_timestamp` enabled.
+        """
+        try:
+            stats_redis = self._statistics_cache().redis
+            keys = sorted(utils.decode(key) for key in stats_redis.keys('*.latency.*'))
+            histograms = {}
+            for key in keys:
+                # <bot-id>.latency.<kind> or <bot-id>.<instance>.latency.<kind> for workers
+                prefix, kind = key.rsplit('.latency.', 1)
+                bot_id = prefix.split('.')[0]
+                histogram = utils.Histogram.from_dict(stats_redis.hgetall(key))
+                histograms.setdefault(bot_id, {}).setdefault(kind, utils.Histogram(histogram.buckets)).update(histogram)
+        except Exception:
+            self._logger.exception('Could not read the latencies, check your `statistics_*` settings.')
+            return 1, {}
+
+        result = {}
+        for bot_id in sorted(histograms):
+            if bot_id not in self._runtime_configuration:
+                continue
+            result[bot_id] = {}
+            for kind, histogram in sorted(histograms[bot_id].items()):
+                result[bot_id][kind] = {'count': histogram.count,
+                                        'mean': histogram.mean(),
+                                        'p50': histogram.percentile(50),
+                                        'p99': histogram.percentile(99)}
+                if self._returntype is ReturnType.TEXT:
+                    self._logger.info('%s - %s: %d messages, mean %.3fs, p50 <= %gs, p99 <= %gs',
+                                      bot_id, kind, histogram.count, histogram.mean(),
+                                      histogram.percentile(50), histogram.percentile(99))
+        return 0, result
+
+    def _statistics_cache(self):
+        return cache.Cache(host=getattr(self._parameters, 'statistics_host', '127.0.0.1'),
+                           port=getattr(self._parameters, 'statistics_port', 6379),
+                           db=int(getattr(self._parameters, 'statistics_database', 3)),
+                           password=getattr(self._parameters, 'statistics_password', None),
+                           ttl=None)
 
     def abort(self, message):
         if self._interactive:
@@ -662,6 +748,12 @@ def _pipeline_configuration(self):
                         pipeline_configuration[botid]['source_queue'] = botconfig['parameters']['source_queue']
                     if 'destination_queues' in botconfig['parameters']:
                         pipeline_configuration[botid]['destination_queues'] = botconfig['parameters']['destination_queues']
+                source_queue = pipeline_configuration[botid]['source_queue']
+                # worker processes have their own internal queues
+                instances = int(botconfig.get('parameters', {}).get('instances_processes') or 0)
+                pipeline_configuration[botid]['internal_queues'] = [f"{source_queue}-internal"]
+                if instances > 1:
+                    pipeline_configuration[botid]['internal_queues'].extend(f"{source_queue}-internal-{i}" for i in range(instances))
         return pipeline_configuration
 
     def get_queues(self, with_internal_queues=False):
@@ -679,7 +771,7 @@ def get_queues(self, with_internal_queues=False):
             if 'source_queue' in value:
                 source_queues.add(value['source_queue'])
                 if with_internal_queues:
-                    internal_queues.add(value['source_queue'] + '-internal')
+                    internal_queues.update(value['internal_queues'])
             if 'destination_queues' in value:
                 # flattens ["one", "two"] → {"one", "two"}, {"_default": "one", "other": ["two", "three"]} → {"one", "two", "three"}
                 destination_queues.update(utils.flatten_queues(value['destination_queues']))
@@ -718,7 +810,7 @@ def list_queues(self, non_zero=False, count=False):
                     return_dict[bot_id]['source_queue'] = (
                         info['source_queue'], counters[info['source_queue']])
                     if pipeline.has_internal_queues:
-                        return_dict[bot_id]['internal_queue'] = counters[info['source_queue'] + '-internal']
+                        return_dict[bot_id]['internal_queue'] = sum(counters[queue] for queue in info['internal_queues'])
 
                 if 'destination_queues' in info:
                     return_dict[bot_id]['destination_queues'] = []
@@ -744,7 +836,7 @@ def clear_queue(self, queue):
             if 'source_queue' in value:
                 queues.add(value['source_queue'])
                 if pipeline.has_internal_queues:
-                    queues.add(value['source_queue'] + '-internal')
+                    queues.update(value['internal_queues'])
             if 'destination_queues' in value:
                 queues.update(value['destination_queues'])
 
@@ -868,11 +960,14 @@ def check(self, no_connections=False):
                     all_queues = all_queues.union(bot_config['parameters']['destination_queues'])
             if ('group' in bot_config and bot_config['group'] in ['Parser', 'Expert', 'Output']):
                 if ('parameters' in bot_config and 'source_queue' in bot_config['parameters'] and isinstance(bot_config['parameters']['source_queue'], str)):
-                    all_queues.add(bot_config['parameters']['source_queue'])
-                    all_queues.add(f"{bot_config['parameters']['source_queue']}-internal")
+                    source_queue = bot_config['parameters']['source_queue']
                 else:
-                    all_queues.add(f"{bot_id}-queue")
-                    all_queues.add(f"{bot_id}-queue-internal")
+                    source_queue = f"{bot_id}-queue"
+                all_queues.add(source_queue)
+                all_queues.add(f"{source_queue}-internal")
+                instances = int(bot_config.get('parameters', {}).get('instances_processes') or 0)
+                if instances > 1:
+                    all_queues.update(f"{source_queue}-internal-{i}" for i in range(instances))
         # ignore allowed orphaned queues
         allowed_orphan_queues = set(getattr(self._parameters, 'intelmqctl_check_orphaned_queues_ignore', ()))
         if not no_connections:
@@ -143,6 +143,14 @@ def load_meta(dump):
     return retval
 
 
+def is_binary_message(base64_message: str) -> bool:
+    """ Whether a base64 encoded dumped message is a message in a binary format like msgpack. """
+    try:
+        return base64.b64decode(base64_message).startswith(message.BINARY_FORMAT_MARKER)
+    except ValueError:
+        return False
+
+
 class Completer():
     state = None
     queues = None
@@ -336,6 +344,8 @@ def main():
                             msg = copy.copy(entry['message'])  # otherwise the message field gets converted
                             if isinstance(msg, dict):
                                 msg = json.dumps(msg)
+                            elif entry.get('message_type') == 'base64' and is_binary_message(msg):
+                                msg = base64.b64decode(msg)
                         else:
                             print('No message here, deleting entry.')
                             del content[key]
@@ -347,7 +357,7 @@ def main():
                             else:
                                 queue_name = entry['source_queue']
                         if queue_name in pipeline_pipes:
-                            if runtime_config[pipeline_pipes[queue_name]]['group'] == 'Parser' and json.loads(msg)['__type'] == 'Event':
+                            if runtime_config[pipeline_pipes[queue_name]]['group'] == 'Parser' and message.Message.unserialize(msg)['__type'] == 'Event':
                                 print('Event converted to Report automatically.')
                                 msg = message.Report(message.MessageFactory.unserialize(msg)).serialize()
                         else:
@@ -389,7 +399,13 @@ def main():
                         continue
                     print('=' * 100, '\nShowing id {} {}\n'.format(count, key),
                           '-' * 50)
-                    if value.get('message_type') == 'base64':
+                    if value.get('message_type') == 'base64' and is_binary_message(value['message']):
+                        value['message'] = message.Message.unserialize(base64.b64decode(value['message']))
+                        if (args.truncate and 'raw' in value['message'] and
+                                len(value['message']['raw']) > args.truncate):
+                            value['message']['raw'] = value['message'][
+                                'raw'][:args.truncate] + '...[truncated]'
+                    elif value.get('message_type') == 'base64':
                         if args.truncate and len(value['message']) > args.truncate:
                             value['message'] = value['message'][:args.truncate] + '...[truncated]'
                     else:
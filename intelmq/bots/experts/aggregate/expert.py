@@ -5,13 +5,24 @@
 SPDX-FileCopyrightText: 2021 Intelmq Team <intelmq-team@cert.at>
 SPDX-License-Identifier: AGPL-3.0-or-later
 """
-from datetime import datetime, timedelta
+from datetime import datetime
+import os
+import threading
 import time
 import json
+from intelmq import VAR_STATE_PATH
 from intelmq.lib.bot import ExpertBot
+from intelmq.lib.exceptions import ConfigurationError
 from intelmq.lib.utils import parse_relative
 from intelmq.lib.mixins import CacheMixin
 
+# sorted set of all open aggregates, the score is the end of the aggregation window
+INDEX_KEY = 'aggregate-index'
+# set after the aggregates of previous versions have been added to the index
+MIGRATED_KEY = 'aggregate-index:migrated'
+CLEANUP_BATCH_SIZE = 1000
+CLEANUP_INTERVAL = 10
+
 
 class AggregateExpertBot(ExpertBot, CacheMixin):
     """Aggregation expert bot"""
@@ -20,64 +31,230 @@ class AggregateExpertBot(ExpertBot, CacheMixin):
     threshold: int = 10
     redis_cache_db: int = 8
     timespan: str = "1 hour"
+    backend: str = "redis"
+    memory_max_windows: int = 10000
+    memory_checkpoint_file: str = None
+    memory_checkpoint_interval: int = 60
 
     __timespan: int = 0
     __next_cleanup: int = 0
+    __next_checkpoint: float = 0
+    # open aggregates of the memory backend by their key, same fields as in Redis plus 'e' for the end
+    __windows: dict = {}
+    # True if the memory backend may have stored aggregates in Redis
+    __spilled: bool = False
+    __lock = None
+    __timer = None
+    __timer_stop = None
 
     def init(self):
         self.__timespan = parse_relative(self.timespan)
         self.fields = {k.strip() for k in self.fields.split(',')}
+        self.__windows = {}
+        if self.backend not in ('redis', 'memory'):
+            raise ConfigurationError('backend', 'Must be "redis" or "memory".')
+        if self.backend == 'memory':
+            if self.instances_processes > 1 or self.instances_threads > 1:
+                raise ConfigurationError('backend', 'The memory backend can not be used with multiple instances, '
+                                         'as they would aggregate the same events separately.')
+            if not self.memory_checkpoint_file:
+                self.memory_checkpoint_file = os.path.join(VAR_STATE_PATH, '%s.aggregate.json' % self._Bot__bot_id)
+            self.load_checkpoint()
+        self.index_legacy_aggregates()
+        if self.backend == 'memory':
+            # aggregates of new events may be open in Redis only if the limit of windows was reached before
+            self.__spilled = bool(self.cache_get_redis_instance().zcard(INDEX_KEY))
         self.cleanup()
 
+        # The lock is held by the main thread, except while it waits for new messages.
+        # Only then the timer can send the expired aggregates.
+        self.__lock = threading.Lock()
+        self.__lock.acquire()
+        self.__timer_stop = threading.Event()
+        self.__timer = threading.Thread(target=self.__run_timer, name='aggregate-cleanup', daemon=True)
+        self.__timer.start()
+
+    def shutdown(self):
+        if self.__timer:
+            self.__timer_stop.set()
+            self.__timer.join(timeout=5)
+            self.__timer = None
+        if self.backend == 'memory':
+            self.save_checkpoint()
+
+    def __run_timer(self):
+        while not self.__timer_stop.wait(CLEANUP_INTERVAL):
+            while not self.__timer_stop.is_set():
+                if self.__lock.acquire(timeout=1):
+                    break
+            else:
+                return
+            try:
+                self.cleanup()
+                self._flush_destination()
+            except Exception:
+                self.logger.exception('Cleanup failed.')
+            finally:
+                self.__lock.release()
+
+    def index_legacy_aggregates(self):
+        """
+        Adds aggregates created by previous versions of the bot to the index.
+
+        This is done once per Redis database, the start times of the aggregates
+        are fetched in one pipeline per page of the scan.
+        """
+        redis = self.cache_get_redis_instance()
+        if redis.exists(MIGRATED_KEY):
+            return
+        counter = 0
+        cursor = None
+        while cursor != 0:
+            cursor, keys = redis.scan(cursor or 0, match="aggregate.*", count=CLEANUP_BATCH_SIZE)
+            if not keys:
+                continue
+            pipe = redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hget(key, 's')
+            ends = {key: datetime.strptime(start.decode('utf-8'), '%Y-%m-%dT%H:%M:%S.%f').timestamp() + self.__timespan * 60
+                    for key, start in zip(keys, pipe.execute()) if start is not None}
+            if ends:
+                counter += redis.zadd(INDEX_KEY, ends, nx=True)
+        redis.set(MIGRATED_KEY, 1)
+        if counter:
+            self.logger.info('Added %d existing aggregates to the index.', counter)
+
+    def load_checkpoint(self):
+        """
+        Loads the open aggregates of the memory backend saved by save_checkpoint.
+        """
+        try:
+            with open(self.memory_checkpoint_file) as handle:
+                self.__windows = json.load(handle)
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError) as exc:
+            self.logger.warning('Could not load the aggregates from %r: %s.', self.memory_checkpoint_file, exc)
+            return
+        self.logger.info('Loaded %d aggregates from %r.', len(self.__windows), self.memory_checkpoint_file)
+
+    def save_checkpoint(self):
+        """
+        Writes the open aggregates of the memory backend to the checkpoint file.
+        """
+        temporary = self.memory_checkpoint_file + '.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(self.__windows, handle)
+        os.replace(temporary, self.memory_checkpoint_file)
+        self.__next_checkpoint = time.time() + self.memory_checkpoint_interval
+
+    def __send_aggregate(self, data: dict) -> bool:
+        """
+        Sends the aggregate if its count reached the threshold.
+
+        Returns:
+            True if the aggregate has been sent, False if it has been dropped
+        """
+        if int(data['c']) < self.threshold:
+            return False
+        event = self.new_event(json.loads(data['d']))
+        event.add("time.source", data['s'])
+        event.add("extra.count", int(data['c']))
+        event.add("extra.time_end", data['l'])
+        self.send_message(event)
+        return True
+
     def cleanup(self):
         if self.__next_cleanup <= time.time():
             self.logger.debug('Started Cleanup.')
-            delta = timedelta(minutes=self.__timespan)
+            redis = self.cache_get_redis_instance()
 
             counter_sent = 0
-            counter_ignored = 0
             counter_dropped = 0
-            for key in self.cache_get_redis_instance().keys(pattern="aggregate.*"):
-                keys = self.cache_get_redis_instance().hgetall(key)
-                data = {y.decode('utf-8'): keys.get(y).decode('utf-8')
-                        for y in keys.keys()}
-
-                if datetime.now() <= (datetime.strptime(data['s'], '%Y-%m-%dT%H:%M:%S.%f') + delta):
-                    counter_ignored += 1
-                    continue
-
-                if int(data['c']) >= self.threshold:
-                    event = self.new_event(json.loads(data['d']))
-                    event.add("time.source", data['s'])
-                    event.add("extra.count", int(data['c']))
-                    event.add("extra.time_end", data['l'])
-                    self.send_message(event)
+            now = time.time()
+            expired = [key for key, data in self.__windows.items() if data['e'] <= now]
+            for key in expired:
+                if self.__send_aggregate(self.__windows.pop(key)):
                     counter_sent += 1
                 else:
                     counter_dropped += 1
-                self.cache_get_redis_instance().delete(key)
-            self.__next_cleanup = int(time.time()) + 10
-            self.logger.debug('Completed Cleanup. Messages sent: %d, messages ignored: %d, messages dropped: %d.', counter_sent, counter_ignored, counter_dropped)
+            while True:
+                keys = redis.zrangebyscore(INDEX_KEY, '-inf', time.time(), start=0, num=CLEANUP_BATCH_SIZE)
+                if not keys:
+                    break
+                pipe = redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.hgetall(key)
+                for values in pipe.execute():
+                    data = {y.decode('utf-8'): values.get(y).decode('utf-8')
+                            for y in values.keys()}
+                    if data and self.__send_aggregate(data):
+                        counter_sent += 1
+                    else:
+                        counter_dropped += 1
+                # the aggregates must be sent before they are deleted
+                self._flush_destination()
+                pipe.delete(*keys)
+                pipe.zrem(INDEX_KEY, *keys)
+                pipe.execute()
+            self.__next_cleanup = int(time.time()) + CLEANUP_INTERVAL
+            if self.backend == 'memory':
+                if self.__spilled:
+                    self.__spilled = bool(redis.zcard(INDEX_KEY))
+                # the sent aggregates must not be restored from an older checkpoint after a crash
+                if expired:
+                    self._flush_destination()
+                    self.save_checkpoint()
+                elif self.__next_checkpoint <= time.time():
+                    self.save_checkpoint()
+            self.logger.debug('Completed Cleanup. Messages sent: %d, messages dropped: %d.', counter_sent, counter_dropped)
         else:
-            self.logger.debug('Skipped Cleanup (%fs < 10s).', self.__next_cleanup - time.time())
+            self.logger.debug('Skipped Cleanup (%fs < %ds).', self.__next_cleanup - time.time(), CLEANUP_INTERVAL)
 
     def process(self):
-        event = self.receive_message()
+        lock = self.__lock  # a reload during receive replaces the lock
+        lock.release()
+        try:
+            event = self.receive_message()
+        finally:
+            lock.acquire()
 
         self.cleanup()
 
         message_hash = event.hash(filter_keys=self.fields, filter_type="whitelist")
         cache_id = f"aggregate.{message_hash}"
+        event_time = event.get('time.source') if event.get('time.source') else event.get('time.observation')
+
+        window = self.__windows.get(cache_id)
+        if window:
+            window['l'] = event_time
+            window['c'] += int(event.get('extra.count', 1))
+        elif (self.backend == 'memory' and len(self.__windows) < self.memory_max_windows and
+              not (self.__spilled and self.cache_exists(cache_id))):
+            self.__windows[cache_id] = {
+                'd': event.to_json(),
+                's': datetime.now().isoformat(),
+                'f': event_time,
+                'l': event_time,
+                'c': int(event.get('extra.count', 1)),
+                'e': time.time() + self.__timespan * 60,
+            }
+        else:
+            # the redis backend, or the memory backend if the limit of windows is reached
+            if self.backend == 'memory':
+                self.__spilled = True
+            self.__update_cache(cache_id, event, event_time)
 
+        self.acknowledge_message()
+
+    def __update_cache(self, cache_id: str, event, event_time: str):
+        # pipeline commands, because its faster to run them this way
+        pipe = self.cache_get_redis_instance().pipeline()
         if self.cache_exists(cache_id):
-            # pipeline commands, because its faster to run them this way
-            pipe = self.cache_get_redis_instance().pipeline()
             # set the last time we got an event to time.source/time.observation
-            pipe.hset(name=cache_id, key="l", value=event.get('time.source') if event.get('time.source') else event.get('time.observation'))
+            pipe.hset(name=cache_id, key="l", value=event_time)
             # count the count +1 up if no other extra.count is already given, else use extra.count as increment
             pipe.hincrby(name=cache_id, key="c", amount=int(event.get('extra.count', 1)))
-            # execute the prepare commands
-            pipe.execute(raise_on_error=True)
         else:
             # keys are shortened, to avoid high loads & unnecessary usage of ram
             # d = data
@@ -85,15 +262,17 @@ def process(self):
             # f = first time
             # l = last time
             # c = count
-            self.cache_get_redis_instance().hset(name=cache_id, mapping={
+            pipe.hset(name=cache_id, mapping={
                 'd': event.to_json(),
                 's': datetime.now().isoformat(),
-                'f': event.get('time.source') if event.get('time.source') else event.get('time.observation'),
-                'l': event.get('time.source') if event.get('time.source') else event.get('time.observation'),
+                'f': event_time,
+                'l': event_time,
                 'c': int(event.get('extra.count', 1))
             })
-
-        self.acknowledge_message()
+            # the aggregate is sent or dropped by the cleanup after the timespan
+            pipe.zadd(INDEX_KEY, {cache_id: time.time() + self.__timespan * 60})
+        # execute the prepare commands
+        pipe.execute(raise_on_error=True)
 
 
 BOT = AggregateExpertBot
@@ -8,12 +8,14 @@
 import re
 import sys
 import bz2
-import pathlib
 import requests
+from typing import Optional
 
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.exceptions import MissingDependencyError
-from intelmq.lib.utils import get_bots_settings, create_request_session
+from intelmq.lib.iptree import IPTree, TREE_SUFFIX, open_tree
+from intelmq.lib.utils import (get_bots_settings, create_request_session, DatabaseWatcher,
+                               bots_without_database_reload, write_file_atomically)
 from intelmq.bin.intelmqctl import IntelMQController
 
 try:
@@ -26,13 +28,14 @@
 class ASNLookupExpertBot(ExpertBot):
     """Add ASN and netmask information from a local BGP dump"""
     database = None  # TODO: should be pathlib.Path
+    database_reload_interval: int = 60
 
-    def init(self):
-        if pyasn is None:
-            raise MissingDependencyError("pyasn")
+    _watcher = None
 
+    def init(self):
         try:
-            self._database = pyasn.pyasn(self.database)
+            self._watcher = DatabaseWatcher([self.database, self.database + TREE_SUFFIX], self.load_database,
+                                            self.database_reload_interval, self.logger)
         except IOError:
             self.logger.error("pyasn data file does not exist or could not be "
                               "accessed in %r.", self.database)
@@ -40,20 +43,37 @@ def init(self):
                               "follow the procedure.")
             self.stop()
 
+    def load_database(self):
+        tree = open_tree(self.database)
+        if tree:
+            self.logger.info("Using the IP tree %r.", tree.filename)
+            return tree
+
+        if pyasn is None:
+            raise MissingDependencyError("pyasn")
+        return pyasn.pyasn(self.database)
+
+    def shutdown(self):
+        if self._watcher:
+            self._watcher.stop()
+            if isinstance(self._watcher.database, IPTree):
+                self._watcher.database.close()
+
     def process(self):
         event = self.receive_message()
+        database = self._watcher.database
+
+        keys = [key for key in ["source.", "destination."] if key + "ip" in event]
+        if isinstance(database, IPTree):
+            infos = database.lookup_many([event.get(key + "ip") for key in keys])
+        else:
+            infos = [database.lookup(event.get(key + "ip")) for key in keys]
 
-        for key in ["source.", "destination."]:
+        for key, info in zip(keys, infos):
 
-            ip_key = key + "ip"
             asn_key = key + "asn"
             bgp_key = key + "network"
 
-            if ip_key not in event:
-                continue
-
-            info = self._database.lookup(event.get(ip_key))
-
             if info:
                 if info[0]:
                     event.add(asn_key, str(info[0]), overwrite=True)
@@ -157,16 +177,31 @@ def update_database(cls, verbose=False):
             prefixes = pyasn.mrtx.parse_mrt_file(archive, print_progress=False, skip_record_on_error=True)
 
         for database_path in set(bots.values()):
-            database_dir = pathlib.Path(database_path).parent
-            database_dir.mkdir(parents=True, exist_ok=True)
-            pyasn.mrtx.dump_prefixes_to_file(prefixes, database_path)
+            write_file_atomically(database_path, lambda temporary: pyasn.mrtx.dump_prefixes_to_file(prefixes, temporary),
+                                  lambda temporary: cls.build_tree(temporary, database_path + TREE_SUFFIX))
 
         if verbose:
             print("Database updated. Reloading affected bots.")
 
         ctl = IntelMQController()
-        for bot in bots.keys():
+        for bot in bots_without_database_reload(runtime_conf, bots, cls.database_reload_interval):
             ctl.bot_reload(bot)
 
+    @staticmethod
+    def build_tree(database: str, tree: Optional[str] = None):
+        """
+        Converts the pyasn database to an IP tree, used by the bots instead of the database.
+        By default, the tree is written next to the database.
+        """
+        def networks():
+            with open(database) as handle:
+                for line in handle:
+                    if not line.strip() or line.startswith(';'):
+                        continue
+                    prefix, asn = line.split()[:2]
+                    yield prefix, [int(asn), prefix]
+
+        IPTree.build(tree or database + TREE_SUFFIX, networks())
+
 
 BOT = ASNLookupExpertBot
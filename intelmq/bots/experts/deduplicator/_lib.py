@@ -0,0 +1,142 @@
+# SPDX-FileCopyrightText: 2021 Sebastian Wagner
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# -*- coding: utf-8 -*-
+"""
+A time-partitioned bloom filter for the deduplicator.
+
+It remembers message hashes (hexadecimal SHA256 strings) for at least the
+given time to live and answers if a hash has definitely not been seen.
+"""
+import json
+import math
+import time
+from typing import List, Optional, Tuple
+
+
+class BloomFilter(object):
+    """
+    Bloom filter for hexadecimal hash strings.
+
+    The hash is used as source of randomness for the positions of the bits,
+    it is not hashed again.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def __positions(self, value: str):
+        # double hashing with two independent parts of the hash
+        first, second = int(value[:16], 16), int(value[16:32], 16) | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for position in self.__positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self.__positions(value))
+
+
+class TimedBloomFilter(object):
+    """
+    A sequence of bloom filters, each holding the hashes added in a time period.
+
+    With a TTL, a new filter is started after ttl / generations seconds and
+    the filters older than the TTL are dropped, so a hash is remembered between
+    ttl and ttl * (generations + 1) / generations seconds. Without TTL, a single
+    filter is used.
+
+    The filter only knows the hashes added since its creation (`since`). Before
+    it covers the full TTL, a hash not in the filter may still have been seen.
+    A loaded filter does not know the hashes seen after it has been saved, so it
+    covers the time since saving only.
+    """
+    generations = 4
+
+    def __init__(self, capacity: int, error_rate: float, ttl: Optional[int] = None):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        self.ttl = int(ttl) if ttl else None
+        self.period = self.ttl / self.generations if self.ttl else None
+        self.since = time.time()
+        self.filters: List[Tuple[float, BloomFilter]] = []
+        self.__new_filter(self.since)
+
+    def __new_filter(self, start: float):
+        if self.period:
+            bloom = BloomFilter(self.capacity / self.generations, self.error_rate / (self.generations + 1))
+        else:
+            bloom = BloomFilter(self.capacity, self.error_rate)
+        self.filters.append((start, bloom))
+
+    def __rotate(self, now: float):
+        if not self.period or now - self.filters[-1][0] < self.period:
+            return
+        start = self.filters[-1][0]
+        start += (now - start) // self.period * self.period
+        self.__new_filter(start)
+        self.filters = [(filter_start, bloom) for filter_start, bloom in self.filters
+                        if filter_start + self.period > now - self.ttl]
+
+    def add(self, value: str):
+        self.__rotate(time.time())
+        self.filters[-1][1].add(value)
+
+    def __contains__(self, value: str) -> bool:
+        self.__rotate(time.time())
+        return any(value in bloom for _, bloom in self.filters)
+
+    def is_complete(self) -> bool:
+        """
+        True if the filter knows all hashes added in the last TTL.
+        """
+        return bool(self.ttl) and time.time() - self.since >= self.ttl
+
+    def save(self, filename: str):
+        """
+        Writes the filter to a file: a JSON header line, followed by the bits of all filters.
+        """
+        header = {'capacity': self.capacity, 'error_rate': self.error_rate,
+                  'ttl': self.ttl, 'saved': time.time(),
+                  'filters': [start for start, _ in self.filters]}
+        with open(filename, 'wb') as handle:
+            handle.write(json.dumps(header).encode() + b'\n')
+            for _, bloom in self.filters:
+                handle.write(bloom.bits)
+
+    @classmethod
+    def load(cls, filename: str, capacity: int, error_rate: float,
+             ttl: Optional[int] = None) -> 'TimedBloomFilter':
+        """
+        Reads a filter written by save.
+
+        The filter is complete one TTL after it has been saved, as hashes may
+        have been added to Redis in the meantime.
+
+        Raises:
+            ValueError: If the file is invalid or has been written with other parameters.
+        """
+        result = cls(capacity, error_rate, ttl)
+        with open(filename, 'rb') as handle:
+            header = json.loads(handle.readline())
+            if (header['capacity'], header['error_rate'], header['ttl']) != (result.capacity, result.error_rate, result.ttl):
+                raise ValueError('The filter has been saved with other parameters.')
+            result.since = header['saved']
+            result.filters = []
+            for start in header['filters']:
+                result.__new_filter(start)
+                bloom = result.filters[-1][1]
+                bloom.bits = bytearray(handle.read(len(bloom.bits)))
+                if len(bloom.bits) != (bloom.size + 7) // 8:
+                    raise ValueError('The filter file is truncated.')
+            if not result.filters:
+                raise ValueError('The filter file is empty.')
+        result.__rotate(time.time())
+        return result
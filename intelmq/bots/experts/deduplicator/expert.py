@@ -24,9 +24,27 @@
     filter_keys: string with multiple keys separated by comma. Please
                  note that time.observation key is never consider by the
                  system because system will always ignore this key.
+
+    bloom_filter_capacity: int, number of distinct messages expected in
+                 redis_cache_ttl seconds. If not 0, a local bloom filter
+                 answers for new messages without asking Redis. default: 0
+
+    bloom_filter_error_rate: float, false positive rate of the bloom
+                 filter. default: 0.001
+
+    bloom_filter_file: string, the bloom filter is saved there on shutdown
+                 and removed after loading it. default: [VAR_STATE_PATH]/[bot_id].bloom
+
+Without bloom filter, the hashes are set atomically in Redis, so multiple
+instances of the bot can share the Redis database.
 """
+import os
+import time
 
+from intelmq import VAR_STATE_PATH
+from intelmq.bots.experts.deduplicator._lib import TimedBloomFilter
 from intelmq.lib.bot import ExpertBot
+from intelmq.lib.exceptions import ConfigurationError
 from intelmq.lib.mixins import CacheMixin
 
 
@@ -39,15 +57,92 @@ class DeduplicatorExpertBot(ExpertBot, CacheMixin):
     redis_cache_password: str = None
     redis_cache_port: int = 6379
     redis_cache_ttl: int = 86400
+    bloom_filter_capacity: int = 0
+    bloom_filter_error_rate: float = 0.001
+    bloom_filter_file: str = None
 
     _message_processed_verb = 'Forwarded'
     bypass = False
     filter_keys = None
+    _bloom_filter = None
+    # new hashes found by the bloom filter, written to Redis in batches
+    _pending_hashes: dict = {}
+    _pending_flushed: float = 0.0
+    _pending_batch_size = 100
+    _pending_batch_timeout = 1
 
     def init(self):
         self.filter_keys = {k.strip() for k in
                             self.filter_keys.split(',')}
 
+        self._pending_hashes = {}
+        self._pending_flushed = time.time()
+        if self.bloom_filter_capacity and not self.bypass:
+            if self.instances_processes > 1 or self.instances_threads > 1:
+                raise ConfigurationError('bloom_filter_capacity', 'The bloom filter can not be used with '
+                                         'multiple instances, as they do not know each other\'s messages.')
+            if not self.redis_cache_ttl:
+                raise ConfigurationError('bloom_filter_capacity', 'The bloom filter needs a redis_cache_ttl.')
+            if not self.bloom_filter_file:
+                self.bloom_filter_file = os.path.join(VAR_STATE_PATH, '%s.bloom' % self._Bot__bot_id)
+            try:
+                self._bloom_filter = TimedBloomFilter.load(self.bloom_filter_file, self.bloom_filter_capacity,
+                                                           self.bloom_filter_error_rate, self.redis_cache_ttl)
+            except FileNotFoundError:
+                self._bloom_filter = None
+            except (ValueError, KeyError, OSError) as exc:
+                self.logger.warning('Could not load the bloom filter from %r: %s.', self.bloom_filter_file, exc)
+                self._bloom_filter = None
+            else:
+                # after a crash, the outdated filter must not be loaded again
+                try:
+                    os.remove(self.bloom_filter_file)
+                except OSError as exc:
+                    self.logger.warning('Could not remove the loaded bloom filter %r: %s.', self.bloom_filter_file, exc)
+            if self._bloom_filter is None:
+                self._bloom_filter = TimedBloomFilter(self.bloom_filter_capacity, self.bloom_filter_error_rate,
+                                                      self.redis_cache_ttl)
+                self.logger.info('Started an empty bloom filter, it will be used after %d seconds.',
+                                 int(self.redis_cache_ttl))
+
+    def is_duplicate(self, message_hash: str) -> bool:
+        """
+        Returns True if the hash is known and remembers it otherwise.
+
+        Without bloom filter, the hash is set in Redis if it does not exist yet,
+        which is atomic and safe for multiple instances.
+        A hash not in the bloom filter is new, if the filter has been running for a full TTL.
+        Such hashes are written to Redis in batches, only possible hits of the
+        filter are looked up in Redis.
+        """
+        bloom = self._bloom_filter
+        if bloom is None:
+            return not self.cache_set_if_absent(message_hash, 'hash')
+
+        if message_hash in self._pending_hashes:
+            is_duplicate = True
+        elif message_hash not in bloom and bloom.is_complete():
+            bloom.add(message_hash)
+            self._pending_hashes[message_hash] = 'hash'
+            is_duplicate = False
+        else:
+            is_duplicate = not self.cache_set_if_absent(message_hash, 'hash')
+            if not is_duplicate:
+                bloom.add(message_hash)
+
+        if self._pending_hashes and (len(self._pending_hashes) >= self._pending_batch_size or
+                                     time.time() - self._pending_flushed >= self._pending_batch_timeout):
+            self.flush_pending_hashes()
+        return is_duplicate
+
+    def flush_pending_hashes(self):
+        """
+        Writes the new hashes found by the bloom filter to Redis.
+        """
+        self.cache_set_many(self._pending_hashes)
+        self._pending_hashes = {}
+        self._pending_flushed = time.time()
+
     def process(self):
         message = self.receive_message()
 
@@ -57,13 +152,21 @@ def process(self):
             message_hash = message.hash(filter_keys=self.filter_keys,
                                         filter_type=self.filter_type)
 
-            if not self.cache_exists(message_hash):
-                self.cache_set(message_hash, 'hash')
+            if not self.is_duplicate(message_hash):
                 self.send_message(message)
             else:
                 self.logger.debug('Dropped message.')
 
         self.acknowledge_message()
 
+    def shutdown(self):
+        if self._bloom_filter is not None:
+            # the saved filter must not contain hashes which are not in Redis
+            self.flush_pending_hashes()
+            try:
+                self._bloom_filter.save(self.bloom_filter_file)
+            except OSError:
+                self.logger.exception('Could not save the bloom filter to %r.', self.bloom_filter_file)
+
 
 BOT = DeduplicatorExpertBot
@@ -7,11 +7,30 @@
 A custom public suffix implementation
 Only works with punycode, not unicode, as intelmq only uses
 the first representation.
+
+The rules are converted to punycode when loading the list, so that domains
+can be looked up without converting them. `SuffixLookup` memoizes the
+lookups of any public suffix list implementation and is shared by the bot
+and the EventDB script in contrib.
 """
+import functools
+from typing import Iterable, Iterator, Optional
+
+# number of domains remembered by SuffixLookup by default
+DEFAULT_CACHE_SIZE = 10000
+
+
+def _to_punycode(label: str) -> str:
+    try:
+        return label.encode('idna').decode('ascii')
+    except UnicodeError:
+        # can't be matched by any (punycode) domain
+        return label
 
 
 class PublicSuffixList(object):
     def __init__(self, source, only_icann=None):
+        # trie of the labels of the rules, starting with the top level domain
         self.suffixes = {}
         icann_section = False
         for line in source.readlines():
@@ -22,30 +41,61 @@ def __init__(self, source, only_icann=None):
                 icann_section = False
             if not line or line.startswith('//') or not icann_section:
                 continue
-            line_split = line.split('.')
             suffixes = self.suffixes
-            for level, suffix in enumerate(line_split[::-1]):
-                if suffix in suffixes:
-                    suffixes = suffixes[suffix]
-                else:
-                    suffixes[suffix] = {}
-                    suffixes = suffixes[suffix]
-
-    def publicsuffix(self, domain):
+            for label in reversed(line.split('.')):
+                if label.startswith('!'):
+                    label = '!' + _to_punycode(label[1:])
+                elif label != '*':
+                    label = _to_punycode(label)
+                suffixes = suffixes.setdefault(label, {})
+
+    def publicsuffix(self, domain: str) -> Optional[str]:
         if not domain:
             return
         suffixes = self.suffixes
-        suffix_path = []
-        # we are converting here from punycode to unicode because it is easier with the !exceptions
-        for level, suffix in enumerate(domain.encode().decode('idna').split('.')[::-1]):
-            if suffix in suffixes:
-                suffixes = suffixes[suffix]
-                suffix_path.append(suffix)
-            elif '*' in suffixes and not '!%s' % suffix in suffixes:
-                suffix_path.append(suffix)
+        labels = domain.lower().split('.')
+        position = len(labels)
+        while position:
+            label = labels[position - 1]
+            if label in suffixes:
+                suffixes = suffixes[label]
+            elif '*' in suffixes and '!' + label not in suffixes:
                 suffixes = suffixes['*']
             else:
                 break
+            position -= 1
+
+        if position < len(labels):
+            return '.'.join(labels[position:])
+
+
+class SuffixLookup(object):
+    """
+    Memoizes the public suffixes of domains, looked up in a public suffix
+    list (the `publicsuffixlist` library or the fallback implementation).
+
+    Usage:
+        lookup = SuffixLookup(PublicSuffixList(source=file_handle, only_icann=True))
+        lookup.publicsuffix('www.example.com')  # 'com'
+        list(lookup.publicsuffixes(['www.example.com', None]))  # ['com', None]
+    """
+
+    def __init__(self, psl, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.psl = psl
+        self.publicsuffix = functools.lru_cache(maxsize=cache_size)(self.__lookup)
+
+    def __lookup(self, domain: str) -> Optional[str]:
+        if not domain:
+            return None
+        return self.psl.publicsuffix(domain)
+
+    def publicsuffixes(self, domains: Iterable[Optional[str]]) -> Iterator[Optional[str]]:
+        """
+        Yields the public suffix for every domain, None for empty domains.
+        """
+        publicsuffix = self.publicsuffix
+        for domain in domains:
+            yield publicsuffix(domain)
 
-        if suffix_path:
-            return '.'.join(suffix_path[::-1]).encode('idna')
+    def cache_info(self):
+        return self.publicsuffix.cache_info()
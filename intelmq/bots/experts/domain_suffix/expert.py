@@ -6,9 +6,9 @@
 """
 The library publicsuffixlist will be used if installed,
 otherwise our own internal fallback is used.
+The lookups are memoized, as the domains in the feeds are very repetitive.
 """
 import codecs
-import pathlib
 import os.path
 import sys
 
@@ -16,9 +16,12 @@
 
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.exceptions import InvalidArgument
-from intelmq.lib.utils import get_bots_settings, create_request_session
+from intelmq.lib.utils import (get_bots_settings, create_request_session, DatabaseWatcher,
+                               bots_without_database_reload, write_file_atomically)
 from intelmq.bin.intelmqctl import IntelMQController
 
+from ._lib import DEFAULT_CACHE_SIZE, SuffixLookup
+
 try:
     from publicsuffixlist import PublicSuffixList
 except ImportError:
@@ -32,20 +35,34 @@ class DomainSuffixExpertBot(ExpertBot):
     """Extract the domain suffix from a domain and save it in the the domain_suffix field. Requires a local file with valid domain suffixes"""
     field: str = None
     suffix_file: str = None  # TODO: should be pathlib.Path
+    database_reload_interval: int = 60
+    lookup_cache_size: int = DEFAULT_CACHE_SIZE
+
+    _watcher = None
 
     def init(self):
         if self.field not in ALLOWED_FIELDS:
             raise InvalidArgument('key', got=self.field, expected=ALLOWED_FIELDS)
+        self._watcher = DatabaseWatcher([self.suffix_file], self.load_database,
+                                        self.database_reload_interval, self.logger)
+
+    def load_database(self):
         with codecs.open(self.suffix_file, encoding='UTF-8') as file_handle:
-            self.psl = PublicSuffixList(source=file_handle, only_icann=True)
+            return SuffixLookup(PublicSuffixList(source=file_handle, only_icann=True),
+                                cache_size=self.lookup_cache_size)
+
+    def shutdown(self):
+        if self._watcher:
+            self._watcher.stop()
 
     def process(self):
         event = self.receive_message()
+        lookup = self._watcher.database
         for space in ('source', 'destination'):
             key = '.'.join((space, self.field))
             if key not in event:
                 continue
-            event['.'.join((space, 'domain_suffix'))] = self.psl.publicsuffix(domain=event[key])
+            event['.'.join((space, 'domain_suffix'))] = lookup.publicsuffix(event[key])
 
         self.send_message(event)
         self.acknowledge_message()
@@ -112,16 +129,13 @@ def update_database(cls, verbose=False):
             sys.exit("Database update failed. Connection Error: {0}".format(e))
 
         for database_path in set(bots.values()):
-            database_dir = pathlib.Path(database_path).parent
-            database_dir.mkdir(parents=True, exist_ok=True)
-            with open(database_path, "wb") as database:
-                database.write(response.content)
+            write_file_atomically(database_path, response.content)
 
         if verbose:
             print("Database updated. Reloading affected bots.")
 
         ctl = IntelMQController()
-        for bot in bots.keys():
+        for bot in bots_without_database_reload(runtime_conf, bots, cls.database_reload_interval):
             ctl.bot_reload(bot)
 
 
@@ -12,32 +12,41 @@
     validators = None
 
 import os.path
-import pathlib
 import sys
 
 import requests.exceptions
 
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.exceptions import MissingDependencyError, ConfigurationError
-from intelmq.lib.utils import get_bots_settings, create_request_session
+from intelmq.lib.utils import (get_bots_settings, create_request_session, DatabaseWatcher,
+                               bots_without_database_reload, write_file_atomically)
 from intelmq.bin.intelmqctl import IntelMQController
 
 
 class DomainValidExpertBot(ExpertBot):
     domain_field: str = 'source.fqdn'
     tlds_domains_list: str = '/opt/intelmq/var/lib/bots/domain_valid/tlds-alpha-by-domain.txt'
+    database_reload_interval: int = 60
+
+    _watcher = None
 
     def init(self):
         if validators is None:
             raise MissingDependencyError("validators")
-        self.tlds_list = self.get_tlds_domain_list()
+        self._watcher = DatabaseWatcher([self.tlds_domains_list], self.get_tlds_domain_list,
+                                        self.database_reload_interval, self.logger)
+
+    def shutdown(self):
+        if self._watcher:
+            self._watcher.stop()
 
     def process(self):
         event = self.receive_message()
+        tlds_list = self._watcher.database
         is_valid = False
         if self.domain_field in event:
             if validators.domain(event[self.domain_field]) and '_' not in event[self.domain_field] and \
-                    event[self.domain_field].split('.')[-1] in self.tlds_list:
+                    event[self.domain_field].split('.')[-1] in tlds_list:
                 is_valid = True
             else:
                 self.logger.debug(f"Filtered out event with search field {self.domain_field!r}.")
@@ -103,16 +112,13 @@ def update_database(cls, verbose=False):
             sys.exit("Database update failed. Connection Error: {0}".format(e))
 
         for database_path in set(bots.values()):
-            database_dir = pathlib.Path(database_path).parent
-            database_dir.mkdir(parents=True, exist_ok=True)
-            with open(database_path, "wb") as database:
-                database.write(response.content)
+            write_file_atomically(database_path, response.content)
 
         if verbose:
             print("Database updated. Reloading affected bots.")
 
         ctl = IntelMQController()
-        for bot in bots.keys():
+        for bot in bots_without_database_reload(runtime_conf, bots, cls.database_reload_interval):
             ctl.bot_reload(bot)
 
 
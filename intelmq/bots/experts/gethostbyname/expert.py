@@ -28,14 +28,18 @@
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.harmonization import URL
 from intelmq.lib.exceptions import InvalidArgument
+from intelmq.lib.utils import LookupPool
 
 
 class GethostbynameExpertBot(ExpertBot):
     """Resolve the IP address for the FQDN"""
+    concurrent_lookups: int = 0
     fallback_to_url: bool = True
     gaierrors_to_ignore: Tuple[int] = ()
     overwrite: bool = False
 
+    _lookups = None
+
     def init(self):
         ignore = self.gaierrors_to_ignore
         if not ignore:  # for null/None/empty lists or strings
@@ -55,10 +59,17 @@ def init(self):
         ignore = tuple(int(x) for x in ignore)  # convert to integers
 
         self.ignore = (-2, -4, -5, -8, -11) + ignore
+        self._lookups = LookupPool(socket.gethostbyname, self.concurrent_lookups)
 
-    def process(self):
-        event = self.receive_message()
+    def shutdown(self):
+        if self._lookups:
+            self._lookups.shutdown()
 
+    def get_lookups(self, event) -> list:
+        """
+        Returns the target and the FQDN of all necessary lookups for the event.
+        """
+        lookups = []
         for target in ("source.", "destination."):
             fqdn, url, ip = (event.get(target + k) for k in ("fqdn", "url", "ip"))
 
@@ -68,17 +79,37 @@ def process(self):
                 fqdn = URL.to_domain_name(url)
             if not fqdn:
                 continue
-            try:
-                ip = socket.gethostbyname(fqdn)
-            except socket.gaierror as exc:
-                if exc.args[0] in self.ignore:
-                    self.logger.debug('Ignored error %r for hostname %r.',
-                                      exc.args[0], fqdn)
-                    pass
+            lookups.append((target, fqdn))
+        return lookups
+
+    def process(self):
+        event = self.receive_message()
+
+        lookups = self.get_lookups(event)
+        upcoming = []
+        if self.concurrent_lookups:
+            for message in self.peek_messages(self.concurrent_lookups):
+                upcoming.extend(self.get_lookups(message))
+        for _, fqdn in lookups + upcoming:
+            # queries for the same name are only done once
+            self._lookups.submit(fqdn, fqdn)
+
+        try:
+            for target, fqdn in lookups:
+                try:
+                    ip = self._lookups.result(fqdn, fqdn)
+                except socket.gaierror as exc:
+                    if exc.args[0] in self.ignore:
+                        self.logger.debug('Ignored error %r for hostname %r.',
+                                          exc.args[0], fqdn)
+                        pass
+                    else:
+                        raise
                 else:
-                    raise
-            else:
-                event.add(target + "ip", ip, raise_failure=False, overwrite=self.overwrite)
+                    event.add(target + "ip", ip, raise_failure=False, overwrite=self.overwrite)
+        finally:
+            # failed lookups are queried again on retries
+            self._lookups.retain(fqdn for _, fqdn in upcoming)
 
         self.send_message(event)
         self.acknowledge_message()
@@ -10,13 +10,13 @@
 
 import io
 import sys
-import pathlib
 import requests
 import tarfile
 
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.exceptions import MissingDependencyError
-from intelmq.lib.utils import get_bots_settings, create_request_session
+from intelmq.lib.utils import (get_bots_settings, create_request_session, DatabaseWatcher,
+                               bots_without_database_reload, write_file_atomically)
 from intelmq.bin.intelmqctl import IntelMQController
 
 try:
@@ -31,13 +31,18 @@ class GeoIPExpertBot(ExpertBot):
     license_key: str = "<insert Maxmind license key>"
     overwrite: bool = False
     use_registered: bool = False
+    database_reload_interval: int = 60
+
+    _watcher = None
+    _database = None
 
     def init(self):
         if geoip2 is None:
             raise MissingDependencyError("geoip2")
 
         try:
-            self.database = geoip2.database.Reader(self.database)
+            self._watcher = DatabaseWatcher([self.database], lambda: geoip2.database.Reader(self.database),
+                                            self.database_reload_interval, self.logger)
         except IOError:
             self.logger.exception("GeoIP Database does not exist or could not "
                                   "be accessed in %r.",
@@ -47,8 +52,19 @@ def init(self):
             self.stop()
         self.registered = self.use_registered
 
+    def shutdown(self):
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher.database.close()
+
     def process(self):
         event = self.receive_message()
+        database = self._watcher.database
+        if database is not self._database:
+            # the reloaded database replaced the previous one, which is not used anymore
+            if self._database:
+                self._database.close()
+            self._database = database
 
         for key in ["source.%s", "destination.%s"]:
             geo_key = key % "geolocation.%s"
@@ -59,7 +75,7 @@ def process(self):
             ip = event.get(key % "ip")
 
             try:
-                info = self.database.city(ip)
+                info = database.city(ip)
 
                 if self.registered:
                     if info.registered_country.iso_code:
@@ -177,16 +193,13 @@ def update_database(cls, verbose=False):
             sys.exit("Database update failed. Could not locate file 'GeoLite2-City.mmbd' in the downloaded archive.")
 
         for database_path in set(bots.values()):
-            database_dir = pathlib.Path(database_path).parent
-            database_dir.mkdir(parents=True, exist_ok=True)
-            with open(database_path, "wb") as database:
-                database.write(database_data._buffer)
+            write_file_atomically(database_path, database_data._buffer)
 
         if verbose:
             print("Database updated. Reloading affected bots.")
 
         ctl = IntelMQController()
-        for bot in bots.keys():
+        for bot in bots_without_database_reload(runtime_conf, bots, cls.database_reload_interval):
             ctl.bot_reload(bot)
 
 
@@ -12,6 +12,9 @@
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.utils import load_configuration
 
+# a regular expression only matching a literal string
+LITERAL_PATTERN = re.compile(r'\^([^.^$*+?{}\[\]\\|()]*)\$')
+
 
 def is_re_pattern(value):
     """
@@ -44,6 +47,15 @@ class ModifyExpertBot(ExpertBot):
     maximum_matches = None
     overwrite: bool = True
 
+    # Consecutive rules with the same conditions are merged to one entry:
+    # (conditions, [(rule name, [(field, is format string, value), ...]), ...])
+    __rules: list = []
+    # indices of the entries to evaluate for an event: without required fields,
+    # by a required field, and by the value of a field compared to a literal
+    __unconditional: list = []
+    __by_field: dict = {}
+    __by_value: dict = {}
+
     def init(self):
         config = load_configuration(self.configuration_path)
 
@@ -54,12 +66,64 @@ def init(self):
 
         # regex compilation
         self.config = []
+        self.__rules = []
         for rule in config:
             self.config.append(rule)
+            expressions = dict(rule["if"])
             for field, expression in rule["if"].items():
                 if isinstance(expression, str) and expression != '':
                     self.config[-1]["if"][field] = re.compile(expression, **self.re_kwargs)
 
+            action = [(name, isinstance(value, str) and ('{' in value or '}' in value), value)
+                      for name, value in rule["then"].items()]
+            if self.__rules and self.__rules[-1][0] == expressions and \
+                    not any(name in expressions for _, previous in self.__rules[-1][2] for name, _, _ in previous):
+                # same conditions and the previous actions do not change the tested fields
+                self.__rules[-1][2].append((rule["rulename"], action))
+            else:
+                self.__rules.append((expressions, rule["if"], [(rule["rulename"], action)]))
+        self.__rules = [(condition, rules) for _, condition, rules in self.__rules]
+
+        self.__unconditional = []
+        self.__by_field = {}
+        self.__by_value = {}
+        for index, (condition, _) in enumerate(self.__rules):
+            required = [name for name, rule in condition.items() if rule != '']
+            for name in required:
+                # case insensitive matching is not equivalent to a comparison of lower case strings
+                literal = (self.case_sensitive and is_re_pattern(condition[name]) and
+                           LITERAL_PATTERN.fullmatch(condition[name].pattern))
+                if literal:
+                    self.__by_value.setdefault(name, {}).setdefault(literal.group(1), []).append(index)
+                    break
+            else:
+                if required:
+                    self.__by_field.setdefault(required[0], []).append(index)
+                else:
+                    self.__unconditional.append(index)
+        self.logger.debug('Loaded %d rules as %d entries.', len(self.config), len(self.__rules))
+
+    def candidates(self, event, start: int = 0) -> list:
+        """
+        Returns the indices of the rule entries which may match the event, starting at the given index.
+        """
+        indices = set(self.__unconditional)
+        for name in event.keys():
+            indices.update(self.__by_field.get(name, ()))
+            table = self.__by_value.get(name)
+            if table:
+                value = event[name]
+                if isinstance(value, (int, float)):
+                    value = str(value)
+                if isinstance(value, str):
+                    indices.update(table.get(value, ()))
+                    if value.endswith('\n'):  # '$' also matches before a trailing newline
+                        indices.update(table.get(value[:-1], ()))
+                else:
+                    for value_indices in table.values():
+                        indices.update(value_indices)
+        return sorted(index for index in indices if index >= start)
+
     def matches(self, identifier, event, condition):
         matches = {}
 
@@ -92,31 +156,45 @@ def matches(self, identifier, event, condition):
         return matches
 
     def apply_action(self, event, action, matches):
-        for name, value in action.items():
-            try:
-                newvalue = value.format(msg=event,
-                                        matches={k: MatchGroupMapping(v)
-                                                 for (k, v) in matches.items()})
-            except AttributeError:  # value has ne format: int, bool etc
-                newvalue = value
+        match_groups = None
+        for name, is_template, value in action:
+            newvalue = value
+            if is_template:
+                if match_groups is None:
+                    match_groups = {k: MatchGroupMapping(v) for (k, v) in matches.items()}
+                try:
+                    newvalue = value.format(msg=event, matches=match_groups)
+                except AttributeError:
+                    pass
             event.add(name, newvalue,
                       overwrite=self.overwrite)
 
-    def process(self):
-        event = self.receive_message()
+    def apply_rules(self, event):
         num_matches = 0
 
-        for rule in self.config:
-            rule_id, rule_selection, rule_action = rule['rulename'], rule['if'], rule['then']
-            matches = self.matches(rule_id, event, rule_selection)
-            if matches is not None:
+        candidates = self.candidates(event)
+        position = 0
+        while position < len(candidates):
+            index = candidates[position]
+            position += 1
+            condition, rules = self.__rules[index]
+            matches = self.matches(rules[0][0], event, condition)
+            if matches is None:
+                continue
+            for rule_id, rule_action in rules:
                 num_matches += 1
                 self.logger.debug('Apply rule %s.', rule_id)
                 self.apply_action(event, rule_action, matches)
                 if self.maximum_matches and num_matches >= self.maximum_matches:
                     self.logger.debug('Reached maximum number of matches, breaking.')
-                    break
+                    return
+            # the actions may have added fields tested by the following rules
+            candidates = self.candidates(event, index + 1)
+            position = 0
 
+    def process(self):
+        event = self.receive_message()
+        self.apply_rules(event)
         self.send_message(event)
         self.acknowledge_message()
 
@@ -13,6 +13,7 @@
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.harmonization import IPAddress
 from intelmq.lib.mixins import CacheMixin
+from intelmq.lib.utils import LookupPool
 
 MINIMUM_BGP_PREFIX_IPV4 = 24
 MINIMUM_BGP_PREFIX_IPV6 = 128
@@ -23,6 +24,18 @@ class InvalidPTRResult(ValueError):
     pass
 
 
+def resolve(ip: str):
+    """
+    Queries the PTR records of the IP address.
+
+    Returns:
+        expiration: timestamp of the expiration of the answer
+        results: the records as strings
+    """
+    results = dns.resolver.query(dns.reversename.from_address(ip), "PTR")
+    return results.expiration, [str(result) for result in results]
+
+
 class ReverseDnsExpertBot(ExpertBot, CacheMixin):
     """Get the correspondent domain name for source and destination IP address"""
     cache_ttl_invalid_response: int = 60
@@ -32,13 +45,23 @@ class ReverseDnsExpertBot(ExpertBot, CacheMixin):
     redis_cache_password: str = None
     redis_cache_port: int = 6379
     redis_cache_ttl: int = 86400
+    concurrent_lookups: int = 0
 
-    def process(self):
-        event = self.receive_message()
+    _lookups = None
+
+    def init(self):
+        self._lookups = LookupPool(resolve, self.concurrent_lookups)
 
-        keys = ["source.%s", "destination.%s"]
+    def shutdown(self):
+        if self._lookups:
+            self._lookups.shutdown()
 
-        for key in keys:
+    def get_lookups(self, event) -> list:
+        """
+        Returns the key, IP address and cache key of all necessary lookups for the event.
+        """
+        lookups = []
+        for key in ["source.%s", "destination.%s"]:
             ip_key = key % "ip"
 
             if ip_key not in event:
@@ -56,38 +79,57 @@ def process(self):
             elif ip_version == 6:
                 minimum = MINIMUM_BGP_PREFIX_IPV6
 
-            cache_key = bin(ip_integer)[2: minimum + 2]
-            cachevalue = self.cache_get(cache_key)
+            lookups.append((key, ip, bin(ip_integer)[2: minimum + 2]))
+        return lookups
 
-            result = None
-            if cachevalue == DNS_EXCEPTION_VALUE:
-                continue
-            elif cachevalue:
-                result = cachevalue
-            else:
-                rev_name = dns.reversename.from_address(ip)
-                try:
-                    results = dns.resolver.query(rev_name, "PTR")
-                    expiration = results.expiration
-                    for result in results:
-                        # use first valid result
-                        if event.is_valid('source.reverse_dns', str(result)):
-                            break
-                    else:
-                        raise InvalidPTRResult
-                except (dns.exception.DNSException, InvalidPTRResult) as e:
-                    # Set default TTL for 'DNS query name does not exist' error
-                    ttl = None if isinstance(e, dns.resolver.NXDOMAIN) else self.cache_ttl_invalid_response
-                    self.cache_set(cache_key, DNS_EXCEPTION_VALUE, ttl)
-                    result = None
+    def process(self):
+        event = self.receive_message()
 
+        lookups = self.get_lookups(event)
+        upcoming = []
+        if self.concurrent_lookups:
+            for message in self.peek_messages(self.concurrent_lookups):
+                upcoming.extend(self.get_lookups(message))
+
+        # get the cached values of all lookups with one round trip
+        cachevalues = self.cache_get_many(cache_key for _, _, cache_key in lookups + upcoming)
+        for (_, ip, cache_key), cachevalue in zip(lookups + upcoming, cachevalues):
+            if not cachevalue:
+                # queries for the same network are only done once
+                self._lookups.submit(cache_key, ip)
+
+        try:
+            for (key, ip, cache_key), cachevalue in zip(lookups, cachevalues):
+                result = None
+                if cachevalue == DNS_EXCEPTION_VALUE:
+                    continue
+                elif cachevalue:
+                    result = cachevalue
                 else:
-                    ttl = datetime.fromtimestamp(expiration) - datetime.now()
-                    self.cache_set(cache_key, str(result),
-                                   ttl=int(ttl.total_seconds()))
+                    try:
+                        expiration, results = self._lookups.result(cache_key, ip)
+                        for result in results:
+                            # use first valid result
+                            if event.is_valid('source.reverse_dns', result):
+                                break
+                        else:
+                            raise InvalidPTRResult
+                    except (dns.exception.DNSException, InvalidPTRResult) as e:
+                        # Set default TTL for 'DNS query name does not exist' error
+                        ttl = None if isinstance(e, dns.resolver.NXDOMAIN) else self.cache_ttl_invalid_response
+                        self.cache_set(cache_key, DNS_EXCEPTION_VALUE, ttl)
+                        result = None
 
-            if result is not None:
-                event.add(key % 'reverse_dns', str(result), overwrite=self.overwrite)
+                    else:
+                        ttl = datetime.fromtimestamp(expiration) - datetime.now()
+                        self.cache_set(cache_key, str(result),
+                                       ttl=max(int(ttl.total_seconds()), 1))
+
+                if result is not None:
+                    event.add(key % 'reverse_dns', str(result), overwrite=self.overwrite)
+        finally:
+            # failed lookups are queried again on retries
+            self._lookups.retain(cache_key for _, _, cache_key in upcoming)
 
         self.send_message(event)
         self.acknowledge_message()
@@ -15,6 +15,11 @@
 Several parameters could be used, separated by ","
 It could sanitize the whole records with the "drop" parameter set to "yes"
 
+The networks (including the operator's "extra_networks") are merged into
+sorted, disjoint integer ranges per IP version and searched with bisect, the
+domain suffixes are stored in a trie of their labels in reverse order. The
+time of a check does not depend on the number of networks or domains.
+
 Sources:
 https://tools.ietf.org/html/rfc1918
 https://tools.ietf.org/html/rfc2606
@@ -25,29 +30,49 @@
 https://en.wikipedia.org/wiki/Autonomous_system_(Internet)
 """
 
-import ipaddress
+import bisect
+from typing import Iterable, List, Union
 from urllib.parse import urlparse
 
 from intelmq.lib.bot import ExpertBot
+from intelmq.lib.exceptions import ConfigurationError
+from intelmq.lib.harmonization import IPAddress
+from intelmq.lib.iptree import merge_networks
 
 NETWORKS = ("10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8",
             "169.254.0.0/16", "172.16.0.0/12", "192.0.0.0/24", "192.0.2.0/24",
             "192.88.99.0/24", "192.168.0.0/16", "198.18.0.0/15",
             "198.51.100.0/24", "203.0.113.0/24", "224.0.0.0/4", "240.0.0.0/4",
             "255.255.255.255/32", "fe80::/64", "2001:0db8::/32")
-DOMAINS = ("example.com", "example.net", "example.org")
+DOMAINS = frozenset(("example.com", "example.net", "example.org"))
 # Also contains TLDs
 SUBDOMAINS = (".test", ".example", ".invalid", ".localhost", ".example.com",
               ".example.net", ".example.org")
 ASN16 = tuple(range(64496, 64512))
 ASN32 = tuple(range(65536, 65552))
-ASNS = ASN16 + ASN32
+ASNS = frozenset(ASN16 + ASN32)
+# marks the nodes of the suffix trie at which a suffix ends
+SUFFIX_END = None
+
+
+def compile_suffixes(suffixes: Iterable[str]) -> dict:
+    """
+    Builds a trie of the labels of the domain suffixes, starting with the last label.
+    """
+    trie = {}
+    for suffix in suffixes:
+        node = trie
+        for label in reversed(suffix.strip(".").split(".")):
+            node = node.setdefault(label, {})
+        node[SUFFIX_END] = True
+    return trie
 
 
 class RFC1918ExpertBot(ExpertBot):
     """Removes fields or discard events if an IP address or domain is invalid as defined in standards like RFC 1918 (invalid, local, reserved, documentation). IP address, FQDN and URL fields are supported"""
     fields: str = "destination.ip,source.ip,source.url"  # TODO: could be List[str]
     policy: str = "del,drop,drop"  # TODO: detto
+    extra_networks: Union[str, List[str]] = ""
 
     def init(self):
         self.fields = self.fields.lower().strip().split(",")
@@ -57,7 +82,13 @@ def init(self):
             raise ValueError("Length of parameters 'fields' (%d) and 'policy' (%d) is unequal."
                              "" % (len(self.fields), len(self.policy)))
 
-        self.ip_networks = [ipaddress.ip_network(iprange) for iprange in NETWORKS]
+        if isinstance(self.extra_networks, str):
+            self.extra_networks = [network for network in self.extra_networks.split(",") if network.strip()]
+        try:
+            self.ip_networks = merge_networks(NETWORKS + tuple(self.extra_networks))
+        except ValueError as exc:
+            raise ConfigurationError("extra_networks", str(exc)) from exc
+        self.suffixes = compile_suffixes(SUBDOMAINS)
 
     @staticmethod
     def check(parameters):
@@ -67,15 +98,36 @@ def check(parameters):
             return [["error",
                      "Length of parameters 'fields' (%d) and 'policy' (%d) is unequal."
                      "" % (fields, policy)]]
-
-    def is_in_net(self, ip):
-        return any(ip in iprange for iprange in self.ip_networks)
+        extra_networks = parameters.get("extra_networks") or []
+        if isinstance(extra_networks, str):
+            extra_networks = [network for network in extra_networks.split(",") if network.strip()]
+        try:
+            merge_networks(extra_networks)
+        except ValueError as exc:
+            return [["error", "Invalid value of parameter 'extra_networks': %s." % exc]]
+
+    def is_in_net(self, ip: str, address: int) -> bool:
+        """
+        Checks if the IP address, given as string and as integer, is in one of the networks.
+        """
+        starts, ends = self.ip_networks[6 if ":" in ip else 4]
+        position = bisect.bisect_right(starts, address) - 1
+        return position >= 0 and address <= ends[position]
 
     def is_in_domains(self, value):
         return value in DOMAINS
 
     def is_subdomain(self, value):
-        return any(value.endswith(domain) for domain in SUBDOMAINS)
+        node = self.suffixes
+        labels = value.split(".")
+        # the last label (e.g. "test" of "sub.test") alone is not a subdomain
+        for label in reversed(labels[1:]):
+            node = node.get(label)
+            if node is None:
+                return False
+            if SUFFIX_END in node:
+                return True
+        return False
 
     def process(self):
         event = self.receive_message()
@@ -87,8 +139,7 @@ def process(self):
                 continue
             value = event.get(field)
             if field.endswith(".ip"):
-                ip = ipaddress.ip_address(value)
-                netcheck = self.is_in_net(ip)
+                netcheck = self.is_in_net(value, IPAddress.to_int(value))
                 if netcheck:
                     self.logger.debug("Field %r (%r) matched IP address check.", field, value)
             elif field.endswith(".fqdn"):
@@ -97,14 +148,13 @@ def process(self):
                     self.logger.debug("Field %r (%r) matched Domain/TLD check.", field, value)
             elif field.endswith(".url"):
                 netloc = urlparse(value).netloc
-                try:
-                    ip = ipaddress.ip_address(netloc)
-                except ValueError:
+                address = IPAddress.to_int(netloc)
+                if address is None:
                     netcheck = self.is_in_domains(netloc) or self.is_subdomain(netloc)
                     if netcheck:
                         self.logger.debug("Field %r (%r) matched Domain/TLD check.", field, value)
                 else:
-                    netcheck = self.is_in_net(ip)
+                    netcheck = self.is_in_net(netloc, address)
                     if netcheck:
                         self.logger.debug("Field %r (%r) matched IP address check.", field, value)
             elif field.endswith(".asn"):
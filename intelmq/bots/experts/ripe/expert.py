@@ -43,6 +43,7 @@ def clean_geo(geo_data):
 
 class RIPEExpertBot(ExpertBot, CacheMixin):
     """Fetch abuse contact and/or geolocation information for the source and/or destination IP addresses and/or ASNs of the events"""
+    concurrent_lookups: int = 0
     mode: str = "append"
     query_ripe_db_asn: bool = True
     query_ripe_db_ip: bool = True
@@ -69,6 +70,8 @@ class RIPEExpertBot(ExpertBot, CacheMixin):
         'stat_geolocation': lambda x: clean_geo(x['data']['located_resources'][0]['locations'][0]),
     }
 
+    __lookups = None
+
     GEOLOCATION_REPLY_TO_INTERNAL = {
         ('cc', 'country'),
         ('latitude', 'latitude'),
@@ -88,14 +91,78 @@ def init(self):
             "stat_geo": self.query_ripe_stat_geolocation,
         }
 
+        self.__cached = {}
         self.__initialize_http_session()
+        self.__lookups = utils.LookupPool(self.__query_api, self.concurrent_lookups)
+
+    def shutdown(self):
+        if self.__lookups:
+            self.__lookups.shutdown()
 
     def __initialize_http_session(self):
         self.set_request_parameters()
-        self.http_session = utils.create_request_session(self)
+        self.http_session = utils.create_request_session(
+            self, pool_maxsize=max(self.concurrent_lookups, requests.adapters.DEFAULT_POOLSIZE))
+
+    def __get_queries(self, event) -> list:
+        """
+        Returns the type and the resource of all queries for this event.
+        """
+        queries = []
+        for target in ('source.', 'destination.'):
+            asn = event.get(target + "asn", None)
+            if asn:
+                if self.__query['stat_asn']:
+                    queries.append(('stat', asn))
+                if self.__query['db_asn']:
+                    queries.append(('db_asn', asn))
+            ip = event.get(target + "ip", None)
+            if ip:
+                if self.__query['stat_ip']:
+                    queries.append(('stat', ip))
+                if self.__query['db_ip']:
+                    queries.append(('db_ip', ip))
+                if self.__query['stat_geo']:
+                    queries.append(('stat_geolocation', ip))
+        return queries
+
+    def __prefetch(self, event) -> list:
+        """
+        Gets the cached values of all queries for this event and the upcoming
+        events with one round trip and starts the missing queries.
+
+        Returns the cache keys of the queries for the upcoming events.
+        """
+        queries = self.__get_queries(event)
+        if self.concurrent_lookups:
+            upcoming = [query for message in self.peek_messages(self.concurrent_lookups)
+                        for query in self.__get_queries(message)]
+        else:
+            upcoming = []
+        keys = ['{}:{}'.format(type, resource) for type, resource in queries + upcoming]
+        self.__cached = dict(zip(keys, self.cache_get_many(keys)))
+        for key, (type, resource) in zip(keys, queries + upcoming):
+            if not self.__cached[key]:
+                # queries for the same resource are only done once
+                self.__lookups.submit(key, type, resource)
+        return keys[len(queries):]
+
+    def __cache_set(self, key, value):
+        self.cache_set(key, value)
+        self.__cached[key] = value
 
     def process(self):
         event = self.receive_message()
+        upcoming = self.__prefetch(event)
+        try:
+            self.__process_event(event)
+        finally:
+            # failed queries are done again on retries
+            self.__lookups.retain(upcoming)
+        self.send_message(event)
+        self.acknowledge_message()
+
+    def __process_event(self, event):
         for target in {'source.', 'destination.'}:
             abuse_key = target + "abuse_contact"
             abuse = set(event.get(abuse_key).split(',')) if self.mode == 'append' and abuse_key in event else set()
@@ -123,49 +190,54 @@ def process(self):
                             event.add(target + "geolocation." + local_key, info[ripe_key], overwrite=should_overwrite)
 
             event.add(abuse_key, ','.join(abuse), overwrite=True)
-        self.send_message(event)
-        self.acknowledge_message()
 
     def __perform_cached_query(self, type, resource):
-        cached_value = self.cache_get('{}:{}'.format(type, resource))
-        if cached_value:
-            if cached_value == CACHE_NO_VALUE:
-                return {}
-            else:
-                return json.loads(cached_value)
+        cache_key = '{}:{}'.format(type, resource)
+        if cache_key in self.__cached:
+            cached_value = self.__cached[cache_key]
         else:
-            response = self.http_session.get(self.QUERY[type].format(resource),
-                                             data="", timeout=self.http_timeout_sec)
-
-            if response.status_code != 200:
-                if type == 'db_asn' and response.status_code == 404:
-                    """ If no abuse contact could be found, a 404 is given. """
-                    try:
-                        if response.json()['message'].startswith('No abuse contact found for '):
-                            self.cache_set('{}:{}'.format(type, resource), CACHE_NO_VALUE)
-                            return {}
-                    except ValueError:
-                        pass
-                raise ValueError(STATUS_CODE_ERROR.format(response.status_code))
-            try:
-                response_data = response.json()
-
-                # geolocation was marked as under maintenance by this, see
-                # https://lists.cert.at/pipermail/intelmq-users/2020-March/000140.html
-                status = response_data.get('data_call_status', '')
-                if status.startswith('maintenance'):
-                    warnings.warn('The API call %s is currently under maintenance. '
-                                  'Response: %r. This warning is only given once per bot run.'
-                                  '' % (type, status))
-
-                data = self.REPLY_TO_DATA[type](response_data)
-                self.cache_set('{}:{}'.format(type, resource),
-                               (json.dumps(list(data) if isinstance(data, set) else data) if data else CACHE_NO_VALUE))
-                return data
-            except (KeyError, IndexError):
-                self.cache_set('{}:{}'.format(type, resource), CACHE_NO_VALUE)
-
+            cached_value = self.cache_get(cache_key)
+        if not cached_value:
+            cached_value = self.__lookups.result(cache_key, type, resource)
+            self.__cache_set(cache_key, cached_value)
+        if cached_value == CACHE_NO_VALUE:
             return {}
+        return json.loads(cached_value)
+
+    def __query_api(self, type, resource) -> str:
+        """
+        Queries the API, may run in a thread of the lookup pool.
+
+        Returns:
+            The value for the cache: The data as JSON or CACHE_NO_VALUE
+        """
+        response = self.http_session.get(self.QUERY[type].format(resource),
+                                         data="", timeout=self.http_timeout_sec)
+
+        if response.status_code != 200:
+            if type == 'db_asn' and response.status_code == 404:
+                """ If no abuse contact could be found, a 404 is given. """
+                try:
+                    if response.json()['message'].startswith('No abuse contact found for '):
+                        return CACHE_NO_VALUE
+                except ValueError:
+                    pass
+            raise ValueError(STATUS_CODE_ERROR.format(response.status_code))
+        try:
+            response_data = response.json()
+
+            # geolocation was marked as under maintenance by this, see
+            # https://lists.cert.at/pipermail/intelmq-users/2020-March/000140.html
+            status = response_data.get('data_call_status', '')
+            if status.startswith('maintenance'):
+                warnings.warn('The API call %s is currently under maintenance. '
+                              'Response: %r. This warning is only given once per bot run.'
+                              '' % (type, status))
+
+            data = self.REPLY_TO_DATA[type](response_data)
+            return json.dumps(list(data) if isinstance(data, set) else data) if data else CACHE_NO_VALUE
+        except (KeyError, IndexError):
+            return CACHE_NO_VALUE
 
 
 BOT = RIPEExpertBot
@@ -9,6 +9,7 @@
 Parameters:
     file: string
 """
+import bisect
 import ipaddress
 import os
 import re
@@ -16,9 +17,8 @@
 import datetime
 import operator
 
-from typing import Optional
+from typing import Any, Callable, Optional, Pattern, Union
 from enum import Enum, auto
-from functools import partial
 
 import intelmq.lib.exceptions as exceptions
 from intelmq import HARMONIZATION_CONF_FILE
@@ -27,6 +27,8 @@
 from intelmq.lib.exceptions import MissingDependencyError
 from intelmq.lib.utils import parse_relative
 from intelmq.lib.harmonization import DateTime
+from intelmq.lib.iptree import merge_networks
+from intelmq.lib.message import Event
 
 try:
     import textx.model
@@ -53,14 +55,16 @@ class SieveExpertBot(ExpertBot):
         '==': operator.eq,
         '!=': operator.ne,
         ':contains': lambda lhs, rhs: lhs.find(rhs) >= 0,
-        '=~': lambda lhs, rhs: re.search(rhs, lhs) is not None,
-        '!~': lambda lhs, rhs: re.search(rhs, lhs) is None,
+    }
+
+    _regex_op_map = {
+        '=~': lambda lhs, pattern: pattern.search(lhs) is not None,
+        '!~': lambda lhs, pattern: pattern.search(lhs) is None,
     }
 
     _string_multi_op_map = {
-        ':in': lambda lhs, rhs: lhs in rhs,
         ':containsany': lambda lhs, rhs: any(lhs.find(s) >= 0 for s in rhs),
-        ':regexin': lambda lhs, rhs: any(re.search(s, lhs) is not None for s in rhs),
+        ':regexin': lambda lhs, patterns: any(pattern.search(lhs) is not None for pattern in patterns),
     }
 
     _list_op_map = {
@@ -79,10 +83,6 @@ class SieveExpertBot(ExpertBot):
         '>': operator.gt,
     }
 
-    _numeric_multi_op_map = {
-        ':in': lambda lhs, rhs: lhs in rhs,
-    }
-
     _basic_math_op_map = {
         '+=': operator.add,
         '-=': operator.sub,
@@ -93,16 +93,16 @@ class SieveExpertBot(ExpertBot):
         '!=': operator.ne,
     }
 
-    _cond_map = {
-        'ExistMatch': lambda self, match, event: self.process_exist_match(match.key, match.op, event),
-        'SingleStringMatch': lambda self, match, event: self.process_single_string_match(match.key, match.op, match.value, event),
-        'MultiStringMatch': lambda self, match, event: self.process_multi_string_match(match.key, match.op, match.value, event),
-        'SingleNumericMatch': lambda self, match, event: self.process_single_numeric_match(match.key, match.op, match.value, event),
-        'MultiNumericMatch': lambda self, match, event: self.process_multi_numeric_match(match.key, match.op, match.value, event),
-        'IpRangeMatch': lambda self, match, event: self.process_ip_range_match(match.key, match.range, event),
-        'ListMatch': lambda self, match, event: self.process_list_match(match.key, match.op, match.value, event),
-        'BoolMatch': lambda self, match, event: self.process_bool_match(match.key, match.op, match.value, event),
-        'Expression': lambda self, match, event: self.match_expression(match, event),
+    _match_compilers = {
+        'ExistMatch': lambda self, match: self.compile_exist_match(match.key, match.op),
+        'SingleStringMatch': lambda self, match: self.compile_single_string_match(match.key, match.op, match.value),
+        'MultiStringMatch': lambda self, match: self.compile_multi_string_match(match.key, match.op, match.value),
+        'SingleNumericMatch': lambda self, match: self.compile_single_numeric_match(match.key, match.op, match.value),
+        'MultiNumericMatch': lambda self, match: self.compile_multi_numeric_match(match.key, match.op, match.value),
+        'IpRangeMatch': lambda self, match: self.compile_ip_range_match(match.key, match.range),
+        'ListMatch': lambda self, match: self.compile_list_match(match.key, match.op, match.value),
+        'BoolMatch': lambda self, match: self.compile_bool_match(match.key, match.op, match.value),
+        'Expression': lambda self, match: self.compile_expression(match),
     }
 
     def init(self) -> None:
@@ -112,6 +112,8 @@ def init(self) -> None:
 
         self.metamodel = SieveExpertBot.init_metamodel()
         self.sieve = SieveExpertBot.read_sieve_file(self.file, self.metamodel)
+        # empty rules file results in empty string
+        self.program = self.compile_program(self.sieve.statements if self.sieve else [])
 
     @staticmethod
     def init_metamodel():
@@ -156,215 +158,438 @@ def check(parameters):
             if not os.path.exists(grammarfile):
                 raise FileExistsError(f'Sieve grammar file not found: {grammarfile!r}.')
 
-            metamodel = None
-
-            try:
-                metamodel = metamodel_from_file(grammarfile)
-            except TextXError as e:
-                raise ValueError(f'Could not process sieve grammar file. Error in ({e.line}, {e.col}).')
+            metamodel = SieveExpertBot.init_metamodel()
 
             if not os.path.exists(parameters['file']):
                 raise ValueError(f'File does not exist: {parameters["file"]!r}')
 
             try:
-                metamodel.model_from_file(parameters['file'])
+                sieve = metamodel.model_from_file(parameters['file'])
             except TextXError as e:
                 raise ValueError(f'Could not process sieve file {parameters["file"]!r}. Error in ({e.line}, {e.col}).')
+
+            # The compilation reports invalid regular expressions and relative times.
+            # It does not need an initialized bot, the logger is only used by the compiled program.
+            compiler = SieveExpertBot.__new__(SieveExpertBot)
+            compiler.logger = None
+            compiler.compile_program(sieve.statements if sieve else [])
         except Exception:
             return [['error', f'Validation of Sieve file failed with the following traceback: {traceback.format_exc()!r}']]
 
     def process(self) -> None:
         event = self.receive_message()
-        procedure = Procedure.CONTINUE
-        if self.sieve:  # empty rules file results in empty string
-            for statement in self.sieve.statements:
-                procedure = self.process_statement(statement, event)
-                if procedure == Procedure.KEEP:
-                    self.logger.debug(f'Stop processing based on statement at {self.get_linecol(statement)}: event.')
-                    break
-                elif procedure == Procedure.DROP:
-                    self.logger.debug(f'Dropped event based on statement at {self.get_linecol(statement)}: {event}.')
-                    break
+        procedure = self.program(event)
 
         # forwarding decision
         if procedure != Procedure.DROP:
-            paths = getattr(event, "path", ("_default", ))
-            if hasattr(paths, 'values'):  # PathValueList
-                paths = tuple(path.value for path in paths.values)
-            elif hasattr(paths, 'value'):  # SinglePathValue
-                paths = (paths.value, )
-            # else: default value -> pass
-            for path in paths:
+            for path in getattr(event, "path", ("_default", )):
                 self.send_message(event, path=path)
 
         self.acknowledge_message()
 
-    def process_statement(self, statement, event):
+    # The sieve file is compiled once to nested functions, which are called for every event.
+    # Conditions are compiled to functions returning a boolean, statements to functions
+    # returning a Procedure. Regular expressions, IP networks and value sets are created
+    # by the compilation.
+
+    def compile_program(self, statements) -> Callable[[Event], Procedure]:
+        # Each selector returns the statements to run for an event. Consecutive 'if' statements
+        # testing the same key for equality are selected by the value of the key.
+        selectors = []
+        for group in self.group_statements(statements):
+            compiled = [(self.compile_statement(statement), self.get_linecol(statement)) for statement in group]
+            if len(compiled) == 1:
+                selectors.append(lambda event, compiled=tuple(compiled): compiled)
+                continue
+            key = self.get_equality_test(group[0].if_.expr)[0]
+            table = {}
+            for statement, (compiled_statement, position) in zip(group, compiled):
+                table.setdefault(self.get_equality_test(statement.if_.expr)[1], []).append((compiled_statement, position))
+            selectors.append(self.compile_selector(key, {value: tuple(matches) for value, matches in table.items()}))
+        logger = self.logger
+
+        def program(event):
+            for selector in selectors:
+                for statement, position in selector(event):
+                    procedure = statement(event)
+                    if procedure == Procedure.KEEP:
+                        logger.debug('Stop processing based on statement at %s: %s.', position, event)
+                        return procedure
+                    elif procedure == Procedure.DROP:
+                        logger.debug('Dropped event based on statement at %s: %s.', position, event)
+                        return procedure
+            return Procedure.CONTINUE
+        return program
+
+    @staticmethod
+    def compile_selector(key, table: dict) -> Callable[[Event], tuple]:
+        def selector(event):
+            if key not in event:
+                return ()
+            try:
+                return table.get(event[key], ())
+            except TypeError:  # unhashable, e.g. a list
+                return ()
+        return selector
+
+    @staticmethod
+    def get_equality_test(expr) -> Optional[tuple]:
+        """
+        Returns the key and the value if the expression only tests the equality of a key with a string or a number.
+        """
+        if len(expr.conj) != 1 or len(expr.conj[0].cond) != 1:
+            return None
+        cond = expr.conj[0].cond[0]
+        if cond.neg or cond.match.__class__.__name__ not in ('SingleStringMatch', 'SingleNumericMatch') or cond.match.op != '==':
+            return None
+        return cond.match.key, cond.match.value.value
+
+    @staticmethod
+    def modifies_key(statements, key) -> bool:
+        """ True if one of the statements may change the key. """
+        for statement in statements:
+            if statement.__class__.__name__ == 'Action':
+                if getattr(statement.action, 'key', None) == key:
+                    return True
+            else:
+                clauses = [statement.if_] + list(statement.elif_) + ([statement.else_] if statement.else_ else [])
+                if any(SieveExpertBot.modifies_key(clause.statements, key) for clause in clauses):
+                    return True
+        return False
+
+    @staticmethod
+    def group_statements(statements) -> list:
+        """
+        Groups consecutive statements which can be selected by the value of a key:
+        'if' statements without 'elif' and 'else' testing the equality of the same key,
+        and not changing that key. All other statements are in groups of their own.
+        """
+        groups = []
+        group_key = None
+        for statement in statements:
+            test = None
+            if statement.__class__.__name__ == 'Branching' and not statement.elif_ and not statement.else_:
+                test = SieveExpertBot.get_equality_test(statement.if_.expr)
+                if test and SieveExpertBot.modifies_key(statement.if_.statements, test[0]):
+                    test = None
+            if test and group_key == test[0]:
+                groups[-1].append(statement)
+            else:
+                groups.append([statement])
+            group_key = test[0] if test else None
+        return groups
+
+    def compile_statement(self, statement) -> Callable[[Event], Procedure]:
         name = statement.__class__.__name__
         if name == 'Branching':
-            return self.process_branching(statement, event)
+            return self.compile_branching(statement)
         elif name == 'Action':
-            return self.process_action(statement.action, event)
-
-    def process_branching(self, rule, event) -> Procedure:
-        # process optional 'if' clause
-        if rule.if_:
-            result = self.process_clause(rule.if_, event)
-            if isinstance(result, Procedure):
-                return result
-
-        # process optional 'elif' clauses
-        for clause in rule.elif_:
-            result = self.process_clause(clause, event)
-            if isinstance(result, Procedure):
-                return result
-
-        # process optional 'else' clause
-        if rule.else_:
-            result = self.process_clause(rule.else_, event, True)
-            if isinstance(result, Procedure):
-                return result
-
-        return Procedure.CONTINUE
+            return self.compile_action(statement.action)
+        raise TextXSemanticError(f'Unhandled type: {name}')
 
-    def process_clause(self, clause, event, else_clause=False) -> Optional[Procedure]:
-        if else_clause or self.match_expression(clause.expr, event):
-            self.logger.debug(f'Matched event based on rule at {self.get_linecol(clause)}: {event}.')
+    def compile_statements(self, statements) -> Callable[[Event], Procedure]:
+        compiled = [self.compile_statement(statement) for statement in statements]
 
-            for procedure in (self.process_statement(statement, event) for statement in clause.statements):
+        def run(event):
+            for statement in compiled:
+                procedure = statement(event)
                 if procedure != Procedure.CONTINUE:
                     return procedure
-            if not else_clause:
-                return Procedure.CONTINUE
-        return None
+            return Procedure.CONTINUE
+        return run
+
+    def compile_branching(self, rule) -> Callable[[Event], Procedure]:
+        clauses = [(self.compile_expression(clause.expr), self.compile_statements(clause.statements),
+                    self.get_linecol(clause))
+                   for clause in [rule.if_] + list(rule.elif_)]
+        else_ = None
+        if rule.else_:
+            else_ = (self.compile_statements(rule.else_.statements), self.get_linecol(rule.else_))
+        logger = self.logger
+
+        # 'if' and 'elif' clauses testing the equality of the same key are selected by the value of the key
+        tests = [self.get_equality_test(clause.expr) for clause in [rule.if_] + list(rule.elif_)]
+        if len(tests) > 1 and all(tests) and len({key for key, _ in tests}) == 1:
+            key = tests[0][0]
+            table = {}
+            for (_, value), (_, statements, position) in zip(tests, clauses):
+                table.setdefault(value, (statements, position))
+
+            def indexed_branching(event):
+                match = None
+                if key in event:
+                    try:
+                        match = table.get(event[key])
+                    except TypeError:  # unhashable, e.g. a list
+                        pass
+                if match is None:
+                    match = else_
+                if match is None:
+                    return Procedure.CONTINUE
+                logger.debug('Matched event based on rule at %s: %s.', match[1], event)
+                return match[0](event)
+            return indexed_branching
+
+        def branching(event):
+            for condition, statements, position in clauses:
+                if condition(event):
+                    logger.debug('Matched event based on rule at %s: %s.', position, event)
+                    return statements(event)
+            if else_:
+                logger.debug('Matched event based on rule at %s: %s.', else_[1], event)
+                return else_[0](event)
+            return Procedure.CONTINUE
+        return branching
+
+    def compile_expression(self, expr) -> Callable[[Event], bool]:
+        conjunctions = [self.compile_conjunction(conj) for conj in expr.conj]
+        if len(conjunctions) == 1:
+            return conjunctions[0]
+        return lambda event: any(conjunction(event) for conjunction in conjunctions)
+
+    def compile_conjunction(self, conj) -> Callable[[Event], bool]:
+        conditions = [self.compile_condition(cond) for cond in conj.cond]
+        if len(conditions) == 1:
+            return conditions[0]
+        return lambda event: all(condition(event) for condition in conditions)
+
+    def compile_condition(self, cond) -> Callable[[Event], bool]:
+        match = self._match_compilers[cond.match.__class__.__name__](self, cond.match)
+        if cond.neg:
+            return lambda event: not match(event)
+        return match
 
-    def match_expression(self, expr, event) -> bool:
-        return any(self.process_conjunction(conj, event) for conj in expr.conj)
+    @staticmethod
+    def compile_exist_match(key, op) -> Callable[[Event], bool]:
+        if op == ':notexists':
+            return lambda event: key not in event
+        return lambda event: key in event
+
+    def compile_single_string_match(self, key, op, value) -> Callable[[Event], bool]:
+        missing = op in {'!=', '!~'}
+        if op in self._regex_op_map:
+            function, rhs = self._regex_op_map[op], self.compile_regex(value)
+        else:
+            function, rhs = self._string_op_map[op], value.value
+
+        def match(event):
+            if key not in event:
+                return missing
+            return function(event[key], rhs)
+        return match
+
+    def compile_multi_string_match(self, key, op, value) -> Callable[[Event], bool]:
+        if op == ':in':
+            return self.compile_in_match(key, [v.value for v in value.values])
+        if op == ':regexin':
+            function, rhs = self._string_multi_op_map[op], [self.compile_regex(v) for v in value.values]
+        elif op == ':containsany' and len(value.values) > 1 and all(v.value for v in value.values):
+            function, rhs = self._regex_op_map['=~'], self.compile_substrings([v.value for v in value.values])
+        else:
+            function, rhs = self._string_multi_op_map[op], [v.value for v in value.values]
 
-    def process_conjunction(self, conj, event) -> bool:
-        return all(self.process_condition(cond, event) for cond in conj.cond)
+        def match(event):
+            if key not in event:
+                return False
+            return function(event[key], rhs)
+        return match
 
-    def process_condition(self, cond, event) -> bool:
-        name = cond.match.__class__.__name__
-        return cond.neg ^ self._cond_map[name](self, cond.match, event)
+    def compile_single_numeric_match(self, key, op, value) -> Callable[[Event], bool]:
+        function, rhs = self._numeric_op_map[op], value.value
 
-    @staticmethod
-    def process_exist_match(key, op, event) -> bool:
-        return (key in event) ^ (op == ':notexists')
+        def match(event):
+            if key not in event:
+                return False
+            return function(event[key], rhs)
+        return match
 
-    def process_single_string_match(self, key, op, value, event) -> bool:
-        if key not in event:
-            return op in {'!=', '!~'}
+    def compile_multi_numeric_match(self, key, op, value) -> Callable[[Event], bool]:
+        # ':in' is the only operator
+        return self.compile_in_match(key, [v.value for v in value.values])
 
-        return self._string_op_map[op](event[key], value.value)
+    @staticmethod
+    def compile_in_match(key, values: list) -> Callable[[Event], bool]:
+        value_set = frozenset(values)
 
-    def process_multi_string_match(self, key, op, value, event) -> bool:
-        if key not in event:
-            return False
+        def match(event):
+            if key not in event:
+                return False
+            lhs = event[key]
+            try:
+                return lhs in value_set
+            except TypeError:  # unhashable, e.g. a list
+                return lhs in values
+        return match
 
-        return self._string_multi_op_map[op](event[key], (v.value for v in value.values))
+    def compile_ip_range_match(self, key, ip_range) -> Callable[[Event], bool]:
+        name = ip_range.__class__.__name__
+        if name == 'SingleIpRange':
+            networks = [ipaddress.ip_network(ip_range.value, strict=False)]
+        elif name == 'IpRangeList':
+            networks = [ipaddress.ip_network(val.value, strict=False) for val in ip_range.values]
+        else:
+            raise TextXSemanticError(f'Unhandled type: {name}')
+        contains = self.compile_networks(networks)
+        logger = self.logger
 
-    def process_single_numeric_match(self, key, op, value, event) -> bool:
-        if key not in event:
-            return False
+        def match(event):
+            if key not in event:
+                return False
 
-        return self._numeric_op_map[op](event[key], value.value)
+            try:
+                addr = ipaddress.ip_address(event[key])
+            except ValueError:
+                logger.warning('Could not parse IP address %s=%s in %s.', key, event[key], event)
+                return False
+            return contains(addr)
+        return match
 
-    def process_multi_numeric_match(self, key, op, value, event) -> bool:
-        if key not in event:
-            return False
+    @staticmethod
+    def compile_networks(networks) -> Callable[[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]], bool]:
+        """
+        Merges the networks to sorted, disjoint ranges per IP version, searched with bisect.
+        """
+        tables = merge_networks(networks)
 
-        return self._numeric_multi_op_map[op](event[key], (v.value for v in value.values))
+        def contains(addr):
+            starts, ends = tables[addr.version]
+            address = int(addr)
+            position = bisect.bisect_right(starts, address) - 1
+            return position >= 0 and address <= ends[position]
+        return contains
 
-        if name == 'SingleNumericValue':
-            return self.process_numeric_operator(event[key], op, value.value)
-        elif name == 'NumericValueList':
-            return any(self.process_numeric_operator(event[key], op, val.value) for val in value.values)
-        raise TextXSemanticError(f'Unhandled type: {name}')
+    def compile_list_match(self, key, op, value) -> Callable[[Event], bool]:
+        rhs = value.values
+        if op == ':equals':
+            function = operator.eq
+        else:
+            rhs = set(rhs)
+            list_op = self._list_op_map[op]
 
-    def process_ip_range_match(self, key, ip_range, event) -> bool:
-        if key not in event:
-            return False
+            def function(lhs, rhs):
+                return list_op(set(lhs), rhs)
 
-        try:
-            addr = ipaddress.ip_address(event[key])
-        except ValueError:
-            self.logger.warning(f'Could not parse IP address {key}={event[key]} in {event}.')
-            return False
+        def match(event):
+            if not (key in event and isinstance(event[key], list)):
+                return False
+            return function(event[key], rhs)
+        return match
 
-        name = ip_range.__class__.__name__
+    def compile_bool_match(self, key, op, value) -> Callable[[Event], bool]:
+        function = self._bool_op_map[op]
 
-        if name == 'SingleIpRange':
-            return addr in ipaddress.ip_network(ip_range.value, strict=False)
-        elif name == 'IpRangeList':
-            return any(addr in ipaddress.ip_network(val.value, strict=False) for val in ip_range.values)
-        raise TextXSemanticError(f'Unhandled type: {name}')
+        def match(event):
+            if not (key in event and isinstance(event[key], bool)):
+                return False
+            return function(event[key], value)
+        return match
 
-    def process_list_match(self, key, op, value, event) -> bool:
-        if not (key in event and isinstance(event[key], list)):
-            return False
+    @staticmethod
+    def compile_substrings(substrings: list) -> Pattern:
+        """
+        Compiles a regular expression matching any of the substrings, shaped like a trie of the substrings.
+        Searching it checks all substrings at once in the regular expression engine, similar to Aho-Corasick.
+        """
+        trie = {}
+        for substring in substrings:
+            node = trie
+            for char in substring:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def build(node):
+            if '' in node:  # a shorter substring already matches
+                return ''
+            alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+            return alternatives[0] if len(alternatives) == 1 else '(?:%s)' % '|'.join(alternatives)
 
-        lhs = event[key]
-        rhs = value.values
-        return lhs == rhs if op == ':equals' else self._list_op_map[op](set(lhs), set(rhs))
+        try:
+            return re.compile(build(trie))
+        except (RecursionError, re.error):  # very long substrings
+            return re.compile('|'.join(map(re.escape, substrings)))
 
-    def process_bool_match(self, key, op, value, event):
-        if not (key in event and isinstance(event[key], bool)):
-            return False
+    def compile_regex(self, value) -> Pattern:
+        try:
+            return re.compile(value.value)
+        except re.error as exc:
+            line, col = self.get_linecol(value)
+            raise ValueError(f'Invalid regular expression {value.value!r} in ({line}, {col}): {exc}.')
 
-        return self._bool_op_map[op](event[key], value)
+    def compile_value(self, action) -> Callable[[Event], Any]:
+        """ Returns a function computing the value of an add or update action for an event. """
+        if action.operator == '=':
+            return lambda event: action.value
 
-    def compute_basic_math(self, action, event) -> str:
-        date = DateTime.parse_utc_isoformat(event[action.key], True)
         delta = datetime.timedelta(minutes=parse_relative(action.value))
+        math_op = self._basic_math_op_map[action.operator]
 
-        return self._basic_math_op_map[action.operator](date, delta).isoformat()
+        def compute_basic_math(event):
+            date = DateTime.parse_utc_isoformat(event[action.key], True)
+            return math_op(date, delta).isoformat()
+        return compute_basic_math
 
-    def process_action(self, action, event) -> Procedure:
+    def compile_action(self, action) -> Callable[[Event], Procedure]:
         name = action.__class__.__name__
+        key = getattr(action, 'key', None)
+
         if action == 'drop':
-            return Procedure.DROP
+            return lambda event: Procedure.DROP
         elif action == 'keep':
-            return Procedure.KEEP
+            return lambda event: Procedure.KEEP
         elif name == 'PathAction':
-            event.path = action.path
+            paths = action.path
+            if hasattr(paths, 'values'):  # PathValueList
+                paths = tuple(path.value for path in paths.values)
+            else:  # SinglePathValue
+                paths = (paths.value, )
+
+            def run(event):
+                event.path = paths
         elif name == 'AddAction':
-            if action.key not in event:
-                value = action.value
-                if action.operator != '=':
-                    value = self.compute_basic_math(action, event)
-                event.add(action.key, value)
+            value = self.compile_value(action)
+
+            def run(event):
+                if key not in event:
+                    event.add(key, value(event))
         elif name == 'AddForceAction':
-            value = action.value
-            if action.operator != '=':
-                value = self.compute_basic_math(action, event)
-            event.add(action.key, value, overwrite=True)
+            value = self.compile_value(action)
+
+            def run(event):
+                event.add(key, value(event), overwrite=True)
         elif name == 'UpdateAction':
-            if action.key in event:
-                value = action.value
-                if action.operator != '=':
-                    value = self.compute_basic_math(action, event)
-                event.change(action.key, value)
+            value = self.compile_value(action)
+
+            def run(event):
+                if key in event:
+                    event.change(key, value(event))
         elif name == 'RemoveAction':
-            if action.key in event:
-                del event[action.key]
+            def run(event):
+                if key in event:
+                    del event[key]
         elif name == 'AppendAction':
-            if action.key in event:
-                if isinstance(event[action.key], list):  # silently ignore existing non-list values
-                    event[action.key].append(action.value)
-            else:
-                event[action.key] = [action.value]
+            def run(event):
+                if key in event:
+                    if isinstance(event[key], list):  # silently ignore existing non-list values
+                        event[key].append(action.value)
+                else:
+                    event[key] = [action.value]
         elif name == 'AppendForceAction':
-            if action.key in event:
-                old_value = event[action.key]
-                list_ = old_value if isinstance(old_value, list) else [old_value]
-            else:
-                list_ = []
-
-            list_.append(action.value)
-            event.add(action.key, list_, overwrite=True)
+            def run(event):
+                if key in event:
+                    old_value = event[key]
+                    list_ = old_value if isinstance(old_value, list) else [old_value]
+                else:
+                    list_ = []
+
+                list_.append(action.value)
+                event.add(key, list_, overwrite=True)
+        else:
+            raise TextXSemanticError(f'Unhandled type: {name}')
 
-        return Procedure.CONTINUE
+        def statement(event):
+            run(event)
+            return Procedure.CONTINUE
+        return statement
 
     @staticmethod
     def validate_ip_range(ip_range) -> None:
@@ -8,8 +8,8 @@
 one that makes the count of similar messages go above a threshold
 value.
 
-This bot is not multiprocessing safe. Do not run more than one
-instance on the same Redis cache database.
+With the Redis backend, the counts are incremented atomically, so
+multiple instances can share the Redis cache database.
 
 Parameters:
 
@@ -41,18 +41,32 @@
              is deleted and "threshold" number of new messages will
              result in a new message being sent.
 
+    window: string ["reset", "sliding"], with "reset", the count is
+            deleted after "timeout" seconds without similar messages.
+            With "sliding", only the messages of the last "timeout"
+            seconds are counted. default: "reset"
+
+    backend: string ["redis", "memory"], where the counts are stored.
+             The memory backend can not be used with multiple
+             instances. default: "redis"
+
     add_keys: optional, array of strings to strings, keys to add to
               forwarded messages. Regardless of this setting, the
               field "extra.count" will be set to the number of
               messages seen (which will be the threshold value).
 
 """
+import math
+import time
 from typing import Iterable, Optional
 
 from intelmq.lib.bot import ExpertBot
 from intelmq.lib.exceptions import ConfigurationError
 from intelmq.lib.mixins import CacheMixin
 
+# the sliding window consists of this number of counters, each for timeout / SLIDING_BUCKETS seconds
+SLIDING_BUCKETS = 10
+
 
 class ThresholdExpertBot(ExpertBot, CacheMixin):
     """Check if the number of similar messages during a specified time interval exceeds a set value"""
@@ -65,17 +79,78 @@ class ThresholdExpertBot(ExpertBot, CacheMixin):
     redis_cache_port: int = 6379
     threshold: int = 100
     timeout: int = 3600
+    window: str = "reset"
+    backend: str = "redis"
 
     _message_processed_verb = 'Forwarded'
 
-    _is_multithreadable = False
     bypass = False
+    # counts of the memory backend by hash: (count, expiry) or {bucket: count}
+    _counts: dict = {}
+    _next_purge: float = 0.0
+    _bucket_size: float = 0.0
 
     def init(self):
         if self.timeout <= 0:
             raise ConfigurationError('Timeout', 'Invalid timeout specified, use positive integer seconds.')
         if self.threshold <= 0:
             raise ConfigurationError('Threshold', 'Invalid threshold specified, use positive integer count.')
+        if self.window not in ('reset', 'sliding'):
+            raise ConfigurationError('window', 'Invalid window specified, use "reset" or "sliding".')
+        if self.backend not in ('redis', 'memory'):
+            raise ConfigurationError('backend', 'Invalid backend specified, use "redis" or "memory".')
+        if self.backend == 'memory' and (self.instances_processes > 1 or self.instances_threads > 1):
+            raise ConfigurationError('backend', 'The memory backend can not be used with multiple instances, '
+                                     'as they do not know each other\'s counts.')
+        self._counts = {}
+        self._next_purge = time.time() + self.timeout
+        self._bucket_size = self.timeout / SLIDING_BUCKETS
+
+    def count(self, message_hash: str) -> int:
+        """
+        Counts the message and returns the number of similar messages in the window, including this one.
+        """
+        now = time.time()
+        if self.window == 'sliding':
+            bucket = int(now // self._bucket_size)
+            if self.backend == 'memory':
+                buckets = self._counts.setdefault(message_hash, {})
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+                for old in [old for old in buckets if old <= bucket - SLIDING_BUCKETS]:
+                    del buckets[old]
+                count = sum(buckets.values())
+            else:
+                keys = ['%s.%d' % (message_hash, bucket - i) for i in range(SLIDING_BUCKETS)]
+                # MULTI/EXEC, so that concurrent instances get different counts
+                pipeline = self.cache_get_redis_instance().pipeline()
+                pipeline.incr(keys[0])
+                pipeline.expire(keys[0], math.ceil(self.timeout + self._bucket_size))
+                pipeline.mget(keys)
+                count = sum(int(value) for value in pipeline.execute()[2] if value)
+        elif self.backend == 'memory':
+            count, expiry = self._counts.get(message_hash, (0, 0))
+            count = count + 1 if expiry > now else 1
+            self._counts[message_hash] = (count, now + self.timeout)
+        else:
+            # the expiry is reset with every message
+            count = self.cache_incr(message_hash, ttl=self.timeout)
+
+        if self.backend == 'memory' and self._next_purge <= now:
+            self.__purge(now)
+        return count
+
+    def __purge(self, now: float):
+        """
+        Removes the counts of the memory backend which are out of the window.
+        """
+        if self.window == 'sliding':
+            oldest = int(now // self._bucket_size) - SLIDING_BUCKETS
+            self._counts = {message_hash: buckets for message_hash, buckets in self._counts.items()
+                            if max(buckets) > oldest}
+        else:
+            self._counts = {message_hash: count for message_hash, count in self._counts.items()
+                            if count[1] > now}
+        self._next_purge = now + self.timeout
 
     def process(self):
         message = self.receive_message()
@@ -85,16 +160,13 @@ def process(self):
         else:
             message_hash = message.hash(filter_keys=self.filter_keys,
                                         filter_type=self.filter_type)
-            old_count = int(self.cache_get(message_hash) or 0)
+            count = self.count(message_hash)
             self.logger.debug('Message %s has been seen %i times before.',
-                              message_hash, old_count)
-            # Use Redis "set" instead of "incr" to reset the timeout
-            # every time
-            self.cache_set(message_hash, str(old_count + 1))
-            if old_count + 1 == self.threshold:
+                              message_hash, count - 1)
+            if count == self.threshold:
                 self.logger.debug('Threshold reached, forwarding message.')
                 message.update(self.add_keys)
-                message.add('extra.count', old_count + 1, overwrite=True)
+                message.add('extra.count', count, overwrite=True)
                 self.send_message(message)
             else:
                 self.logger.debug('Dropped message.')
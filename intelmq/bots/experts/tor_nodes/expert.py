@@ -6,13 +6,16 @@
 """
 See README for database download.
 """
+import ipaddress
 import re
 import sys
-import pathlib
 import requests
+from typing import Optional
 
 from intelmq.lib.bot import ExpertBot
-from intelmq.lib.utils import get_bots_settings, create_request_session
+from intelmq.lib.iptree import IPTree, TREE_SUFFIX, open_tree
+from intelmq.lib.utils import (get_bots_settings, create_request_session, DatabaseWatcher,
+                               bots_without_database_reload, write_file_atomically)
 from intelmq.bin.intelmqctl import IntelMQController
 
 
@@ -21,35 +24,56 @@ class TorExpertBot(ExpertBot):
     database: str = "/opt/intelmq/var/lib/bots/tor_nodes/tor_nodes.dat"  # TODO: pathlib.Path
     overwrite: bool = False
 
-    _database = set()
+    database_reload_interval: int = 60
+
+    _watcher = None
 
     def init(self):
+        try:
+            self._watcher = DatabaseWatcher([self.database, self.database + TREE_SUFFIX], self.load_database,
+                                            self.database_reload_interval, self.logger)
+        except IOError:
+            raise ValueError("TOR rule not defined or failed on open.")
+
+    def load_database(self):
+        tree = open_tree(self.database)
+        if tree:
+            self.logger.info("Using the IP tree %r.", tree.filename)
+            return tree
+
         self.logger.info("Loading TOR exit node IPs.")
 
-        try:
-            with open(self.database) as fp:
-                for line in fp:
-                    line = line.strip()
+        database = set()
+        with open(self.database) as fp:
+            for line in fp:
+                line = line.strip()
 
-                    if len(line) == 0 or line[0] == "#":
-                        continue
+                if len(line) == 0 or line[0] == "#":
+                    continue
 
-                    self._database.add(line)
+                database.add(line)
+        return database
 
-        except IOError:
-            raise ValueError("TOR rule not defined or failed on open.")
+    def shutdown(self):
+        if self._watcher:
+            self._watcher.stop()
+            if isinstance(self._watcher.database, IPTree):
+                self._watcher.database.close()
 
     def process(self):
         event = self.receive_message()
+        database = self._watcher.database
 
-        for key in ["source.", "destination."]:
-            if key + 'ip' in event:
-                if key + 'tor_node' not in event:
-                    if event.get(key + 'ip') in self._database:
-                        event.add(key + 'tor_node', True)
-                elif key + 'tor_node' in event and self.overwrite:
-                    if event.get(key + 'ip') in self._database:
-                        event.change(key + 'tor_node', True)
+        keys = [key for key in ["source.", "destination."]
+                if key + 'ip' in event and (key + 'tor_node' not in event or self.overwrite)]
+        if isinstance(database, IPTree):
+            is_tor_node = database.lookup_many([event.get(key + 'ip') for key in keys])
+        else:
+            is_tor_node = [event.get(key + 'ip') in database for key in keys]
+
+        for key, tor_node in zip(keys, is_tor_node):
+            if tor_node:
+                event.add(key + 'tor_node', True, overwrite=True)
 
         self.send_message(event)
         self.acknowledge_message()
@@ -105,17 +129,34 @@ def update_database(cls, verbose=False):
         tor_exits = "\n".join(pattern.findall(response.text))
 
         for database_path in set(bots.values()):
-            database_dir = pathlib.Path(database_path).parent
-            database_dir.mkdir(parents=True, exist_ok=True)
-            with open(database_path, "w") as database:
-                database.write(tor_exits)
+            write_file_atomically(database_path, tor_exits,
+                                  lambda temporary: cls.build_tree(temporary, database_path + TREE_SUFFIX))
 
         if verbose:
             print("Database updated. Reloading affected bots.")
 
         ctl = IntelMQController()
-        for bot in bots.keys():
+        for bot in bots_without_database_reload(runtime_conf, bots, cls.database_reload_interval):
             ctl.bot_reload(bot)
 
+    @staticmethod
+    def build_tree(database: str, tree: Optional[str] = None):
+        """
+        Converts the list of IP addresses to an IP tree, used by the bots instead of the list.
+        By default, the tree is written next to the list.
+        """
+        def addresses():
+            with open(database) as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line or line[0] == "#":
+                        continue
+                    try:
+                        yield str(ipaddress.ip_address(line)), True
+                    except ValueError:
+                        continue
+
+        IPTree.build(tree or database + TREE_SUFFIX, addresses())
+
 
 BOT = TorExpertBot
@@ -11,12 +11,14 @@
 """
 import argparse
 import atexit
+import cProfile
 import csv
 import fcntl
 import inspect
 import io
 import json
 import logging
+import multiprocessing
 import os
 import re
 import signal
@@ -52,6 +54,11 @@ class Bot(object):
     __current_message: Optional[libmessage.Message] = None
     __message_counter_delay: timedelta = timedelta(seconds=2)
     __stats_cache: cache.Cache = None
+    # Profiling of process() requested by intelmqctl profile
+    __profiler: Optional[cProfile.Profile] = None
+    __profile_until: Optional[float] = None
+    __profile_request: Optional[str] = None
+    __profile_timestamp: float = 0.0
 
     # Bot is capable of SIGHUP delaying
     _sighup_delay: bool = True
@@ -66,9 +73,11 @@ class Bot(object):
     accuracy: int = 100
     destination_pipeline_broker: str = "redis"
     destination_pipeline_db: int = 2
+    destination_pipeline_format: str = "json"
     destination_pipeline_host: str = "127.0.0.1"
     destination_pipeline_password: Optional[str] = None
     destination_pipeline_port: int = 6379
+    destination_pipeline_timestamp: bool = False
     destination_queues: dict = {}
     error_dump_message: bool = True
     error_log_exception: bool = True
@@ -82,6 +91,7 @@ class Bot(object):
     http_user_agent: str = "Mozilla/5.0 (Windows NT 6.1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2228.0 Safari/537.36"
     http_verify_cert: Union[bool, str] = True
     https_proxy: Optional[str] = None
+    instances_processes: int = 0
     instances_threads: int = 0
     load_balance: bool = False
     log_processed_messages_count: int = 500
@@ -103,11 +113,14 @@ class Bot(object):
     statistics_host: str = "127.0.0.1"
     statistics_password: Optional[str] = None
     statistics_port: int = 6379
+    strict_input_validation: bool = False
 
     _message_processed_verb: str = 'Processed'
 
     # True for (non-main) threads of a bot instance
     is_multithreaded: bool = False
+    # True for worker processes of a bot instance
+    is_multiprocessed: bool = False
     # True if the bot is thread-safe and it makes sense
     _is_multithreadable: bool = True
     # Collectors with an empty process() should set this to true, prevents endless loops (#1364)
@@ -123,6 +136,8 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
         self.__error_retries_counter: int = 0
         self.__source_pipeline: Optional[Pipeline] = None
         self.__destination_pipeline: Optional[Pipeline] = None
+        # time when the current message has been received, False after acknowledging it
+        self.__process_start: Union[float, bool, None] = None
         self.logger = None
 
         self.__message_counter = {"since": 0,  # messages since last logging
@@ -131,7 +146,9 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                                   "failure": 0,  # total number since the beginning
                                   "stats_timestamp": datetime.now(),  # stamp of last report to redis
                                   "path": defaultdict(int),  # number of messages sent to queues since last report to redis
-                                  "path_total": defaultdict(int)  # number of messages sent to queues since beginning
+                                  "path_total": defaultdict(int),  # number of messages sent to queues since beginning
+                                  "latency_process": utils.Histogram(),  # duration of processing the messages since beginning
+                                  "latency_queue": utils.Histogram(),  # waiting time of received messages in the queue since beginning
                                   }
 
         try:
@@ -149,7 +166,7 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
             self.__load_defaults_configuration()
 
             self.__bot_id_full, self.__bot_id, self.__instance_id = self.__check_bot_id(bot_id)
-            if self.__instance_id:
+            if self.__instance_id and not self.is_multiprocessed:
                 self.is_multithreaded = True
             self.__init_logger()
         except Exception:
@@ -163,6 +180,8 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
             self.logger.info('Bot is starting.')
             self.__load_runtime_configuration()
 
+            # Independent of the broker, the bot itself can be parallelized
+            is_parallelizable = self._is_multithreadable
             broker = self.source_pipeline_broker.title()
             if broker != 'Amqp':
                 self._is_multithreadable = False
@@ -207,6 +226,21 @@ def handle_sighup_signal_threading(signum: int,
                 self.logger.warning('Multithreading is configured, but is not '
                                     'available for interactive runs.')
 
+            """ Multiprocessing """
+            if (self.instances_processes > 1 and not self.__instance_id and
+                    is_parallelizable and not disable_multithreading):
+                exitcode = self.__start_processes(int(self.instances_processes))
+                sys.exit(exitcode)
+            elif self.instances_processes > 1 and not is_parallelizable:
+                self.logger.error('Multiprocessing is configured, but is not '
+                                  'available for this bot. Look at the FAQ '
+                                  'for a list of reasons for this. '
+                                  'https://intelmq.readthedocs.io/en/latest/user/FAQ.html'
+                                  '#multithreading-is-not-available-for-this-bot')
+            elif self.instances_processes > 1 and disable_multithreading:
+                self.logger.warning('Multiprocessing is configured, but is not '
+                                    'available for interactive runs.')
+
             self.__load_harmonization_configuration()
 
             self._parse_common_parameters()
@@ -215,7 +249,7 @@ def handle_sighup_signal_threading(signum: int,
             self.__connect_pipelines()
             self.init()
 
-            if not self.__instance_id:
+            if not self.__instance_id or self.is_multiprocessed:
                 self.__sighup = threading.Event()
                 signal.signal(signal.SIGHUP, self.__handle_sighup_signal)
                 # system calls should not be interrupted, but restarted
@@ -285,6 +319,59 @@ def __handle_sighup(self):
         self.__sighup.clear()
         self.__init__(self.__bot_id_full, sighup_event=self.__sighup)
 
+    def __start_processes(self, num_instances: int) -> int:
+        """
+        Forks the worker processes, forwards SIGHUP, SIGTERM and SIGINT to them
+        and waits until all of them have stopped.
+
+        Returns:
+            exitcode: 0 if all workers stopped cleanly, otherwise the highest
+                exit code of the workers, or 1 if workers were killed by a signal
+        """
+        context = multiprocessing.get_context('fork')
+        processes = []
+
+        def handle_signal_multiprocessing(signum: int, stack: Optional[object]):
+            self.logger.info('Received signal %d, forwarding it to the worker processes.', signum)
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signum)
+
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, handle_signal_multiprocessing)
+        signal.siginterrupt(signal.SIGHUP, False)
+
+        for i in range(num_instances):
+            processname = '%s.%d' % (self.__bot_id, i)
+            processes.append(context.Process(target=self.__run_worker_process,
+                                             args=(processname, ),
+                                             name=processname,
+                                             daemon=False))
+            processes[i].start()
+            self.logger.info('Started worker process %r as process %d.', processname, processes[i].pid)
+        for process in processes:
+            process.join()
+        self.logger.info('All worker processes stopped.')
+        exitcode = 0
+        for process in processes:
+            if process.exitcode < 0:
+                # multiprocessing reports the signal as negative exit code
+                self.logger.error('Worker process %r was killed by signal %d.', process.name, -process.exitcode)
+                exitcode = max(exitcode, 1)
+            elif process.exitcode > 0:
+                self.logger.error('Worker process %r exited with code %d.', process.name, process.exitcode)
+                exitcode = max(exitcode, process.exitcode)
+        return exitcode
+
+    def __run_worker_process(self, bot_id: str):
+        """
+        Entry point of the forked worker processes.
+        """
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        self.__class__.is_multiprocessed = True
+        self.__class__(bot_id).start()
+
     def init(self):
         pass
 
@@ -318,7 +405,23 @@ def start(self, starting: bool = True, error_on_pipeline: bool = True,
                         error_on_pipeline = False
 
                 self.__handle_sighup()
-                self.process()
+                self.__check_profiling()
+                # the duration is measured from receiving the message to acknowledging it,
+                # so that waiting for messages is not included
+                self.__process_start = None
+                process_start = time.perf_counter()
+                if self.__profiler:
+                    self.__profiler.runcall(self.process)
+                else:
+                    self.process()
+                if self.__process_start is None:
+                    # bots without source queue
+                    self.__message_counter["latency_process"].add(time.perf_counter() - process_start)
+                elif self.__process_start is not False:
+                    # the message has not been acknowledged
+                    self.__message_counter["latency_process"].add(time.perf_counter() - self.__process_start)
+                # bots without source queue do not acknowledge
+                self._flush_destination()
                 self.__error_retries_counter = 0  # reset counter
 
             except exceptions.PipelineError as exc:
@@ -478,10 +581,69 @@ def __stats(self, force: bool = False):
                                    self.__message_counter["success"])
             self.__stats_cache.set(".".join((self.__bot_id_full, "stats", "failure")),
                                    self.__message_counter["failure"])
+            # e.g. hits and misses of the local cache of the CacheMixin
+            for name, value in getattr(self, 'cache_statistics', dict)().items():
+                self.__stats_cache.set(".".join((self.__bot_id_full, "stats", name)), value)
+            for kind in ("process", "queue"):
+                histogram = self.__message_counter["latency_" + kind]
+                if histogram.count:
+                    self.__stats_cache.redis.hset(".".join((self.__bot_id_full, "latency", kind)),
+                                                  mapping=histogram.to_dict())
             self.__message_counter["stats_timestamp"] = datetime.now()
         except Exception:
             self.logger.debug('Failed to write statistics to cache, check your `statistics_*` settings.', exc_info=True)
 
+    def __check_profiling(self, stop: bool = False):
+        """
+        Starts or stops profiling process() as requested by `intelmqctl profile`.
+
+        The request is the key `<bot_id>.profile` in the statistics database,
+        holding the timestamp until the bot should profile. It is checked only
+        all self.__message_counter_delay (2 seconds), or with stop=True.
+        When the time is up, the profile is written to the logging path.
+        """
+        if self.__profiler and (stop or time.time() >= self.__profile_until):
+            self.__profiler, profiler = None, self.__profiler
+            if not self.logging_path:
+                self.logger.warning('Profiling finished, but no logging_path is set to write the profile to.')
+                return
+            filename = os.path.join(self.logging_path, '%s.%s.prof' % (self.__bot_id_full,
+                                                                       datetime.now().strftime('%Y%m%dT%H%M%S')))
+            try:
+                profiler.dump_stats(filename)
+            except OSError:
+                self.logger.exception('Could not write the profile to %r.', filename)
+            else:
+                self.logger.info('Profiling finished, wrote profile to %r.', filename)
+            return
+
+        now = time.time()
+        if stop or self.__profiler or not self.__stats_cache or now - self.__profile_timestamp < self.__message_counter_delay.total_seconds():
+            return
+        self.__profile_timestamp = now
+        try:
+            # all threads and worker processes of the bot react to the request
+            request = self.__stats_cache.get('%s.profile' % self.__bot_id)
+        except Exception:
+            self.logger.debug('Failed to read profiling request from cache, check your `statistics_*` settings.', exc_info=True)
+            return
+        if not request or request == self.__profile_request:
+            return
+        self.__profile_request = request
+        until = float(request)
+        if until <= now:
+            return
+        profiler = cProfile.Profile()
+        try:
+            # only one profiler can be active at a time in Python 3.12+
+            profiler.enable()
+            profiler.disable()
+        except ValueError as exc:
+            self.logger.warning('Profiling not possible: %s.', exc)
+            return
+        self.logger.info('Profiling process() for %d seconds.', until - now)
+        self.__profiler, self.__profile_until = profiler, until
+
     def __sleep(self, remaining: Optional[float] = None, log: bool = True):
         """
         Sleep handles interrupts and changed rate_limit-parameter.
@@ -527,6 +689,7 @@ def stop(self, exitcode: int = 1):
                                                               self.__message_counter["since"]))
 
         self.__stats(force=True)
+        self.__check_profiling(stop=True)
         self.__disconnect_pipelines()
 
         if self.logger:
@@ -552,15 +715,27 @@ def __print_log_buffer(self):
     def __check_bot_id(self, name: str):
         res = re.fullmatch(r'([0-9a-zA-Z\-]+)(\.[0-9]+)?', name)
         if res:
-            if not (res.group(2) and threading.current_thread() == threading.main_thread()):
+            if not (res.group(2) and threading.current_thread() == threading.main_thread() and
+                    not self.is_multiprocessed):
                 return name, res.group(1), res.group(2)[1:] if res.group(2) else None
         self.__log_buffer.append(('error',
                                   "Invalid bot id, must match '"
                                   r"[^0-9a-zA-Z\-]+'."))
         self.stop()
 
-    def __connect_pipelines(self):
+    def _pipeline_configuration(self) -> dict:
+        """
+        Returns the parameters of the bot for the pipelines.
+
+        Every worker process gets its own internal queue `<source queue>-internal-<n>`.
+        """
         pipeline_args = {key: getattr(self, key) for key in dir(self) if not inspect.ismethod(getattr(self, key)) and (key.startswith('source_pipeline_') or key.startswith('destination_pipeline'))}
+        if self.is_multiprocessed:
+            pipeline_args['source_pipeline_internal_queue'] = f"{self.source_queue}-internal-{self.__instance_id}"
+        return pipeline_args
+
+    def __connect_pipelines(self):
+        pipeline_args = self._pipeline_configuration()
         if self.source_queue is not None:
             self.logger.debug("Loading source pipeline and queue %r.", self.source_queue)
             self.__source_pipeline = PipelineFactory.create(logger=self.logger,
@@ -575,6 +750,14 @@ def __connect_pipelines(self):
             self.logger.debug("Connected to source queue.")
 
         if self.destination_queues:
+            if self.destination_pipeline_format not in libmessage.MESSAGE_FORMATS:
+                raise exceptions.ConfigurationError('pipeline', 'Invalid destination_pipeline_format %r, '
+                                                    'must be one of %r.' % (self.destination_pipeline_format,
+                                                                            libmessage.MESSAGE_FORMATS))
+            if self.destination_pipeline_format == 'orjson' and libmessage.orjson is None:
+                raise exceptions.MissingDependencyError('orjson')
+            if self.destination_pipeline_format == 'msgpack' and libmessage.msgpack is None:
+                raise exceptions.MissingDependencyError('msgpack')
             self.logger.debug("Loading destination pipeline and queues %r.", self.destination_queues)
             self.__destination_pipeline = PipelineFactory.create(logger=self.logger,
                                                                  direction="destination",
@@ -629,13 +812,19 @@ def send_message(self, *messages, path: str = "_default", auto_add=None,
                 self.__message_counter["since"] = 0
                 self.__message_counter["start"] = datetime.now()
 
-            raw_message = libmessage.MessageFactory.serialize(message)
+            raw_message = libmessage.MessageFactory.serialize(message,
+                                                              message_format=self.destination_pipeline_format,
+                                                              sent=time.time() if self.destination_pipeline_timestamp else None)
             self.__destination_pipeline.send(raw_message, path=path,
                                              path_permissive=path_permissive)
 
     def receive_message(self) -> libmessage.Message:
         """
+        Receives a message from the source pipeline.
 
+        The values of the message are only validated if the parameter
+        `strict_input_validation` is true, otherwise they are trusted as they
+        have been validated by the previous bot already.
 
         If the bot is reloaded when waiting for an incoming message, the received message
         will be rejected to the pipeline in the first place to get to a clean state.
@@ -643,6 +832,7 @@ def receive_message(self) -> libmessage.Message:
         """
         if self.__current_message:
             self.logger.debug("Reusing existing current message as incoming.")
+            self.__process_start = time.perf_counter()
             return self.__current_message
 
         self.logger.debug('Waiting for incoming message.')
@@ -663,8 +853,12 @@ def receive_message(self) -> libmessage.Message:
             return self.receive_message()
 
         try:
-            self.__current_message = libmessage.MessageFactory.unserialize(message,
-                                                                           harmonization=self.harmonization)
+            message = libmessage.Message.unserialize(message)
+            if isinstance(message, dict) and '__sent' in message:
+                self.__message_counter["latency_queue"].add(time.time() - message.pop('__sent'))
+            self.__current_message = libmessage.MessageFactory.from_dict(message,
+                                                                         harmonization=self.harmonization,
+                                                                         validate=self.strict_input_validation)
         except exceptions.InvalidKey as exc:
             # In case a incoming message is malformed an does not conform with the currently
             # loaded harmonization, stop now as this will happen repeatedly without any change
@@ -678,20 +872,61 @@ def receive_message(self) -> libmessage.Message:
                 tmp_msg = self.__current_message
             self.logger.debug('Received message %r.', tmp_msg)
 
+        self.__process_start = time.perf_counter()
         return self.__current_message
 
+    def peek_messages(self, count: int) -> List[libmessage.Message]:
+        """
+        Returns up to count messages following the current one, which the
+        source pipeline has already received, e.g. to prepare lookups for them.
+        They stay in the pipeline and are returned by receive_message later.
+
+        Only the Redis pipeline with source_pipeline_batch_size greater than 1
+        receives messages in advance, otherwise the list is empty.
+        Messages which can not be decoded are skipped.
+        """
+        if not self.__source_pipeline:
+            return []
+        messages = []
+        for message in self.__source_pipeline.peek(count):
+            try:
+                message = libmessage.Message.unserialize(message)
+                message.pop('__sent', None)
+                messages.append(libmessage.MessageFactory.from_dict(message, harmonization=self.harmonization,
+                                                                    validate=False))
+            except Exception:
+                self.logger.debug('Could not decode upcoming message.', exc_info=True)
+        return messages
+
     def acknowledge_message(self):
         """
         Acknowledges that the last message has been processed, if any.
 
         For bots without source pipeline (collectors), this is a no-op.
+        Buffered messages are sent before, so that no message is acknowledged
+        before all resulting messages have been sent.
         """
+        self._flush_destination()
         if self.__source_pipeline:
             self.__source_pipeline.acknowledge()
+        if self.__process_start:
+            self.__message_counter["latency_process"].add(time.perf_counter() - self.__process_start)
+            self.__process_start = False
 
         # free memory of last message
         self.__current_message = None
 
+    def _flush_destination(self):
+        """
+        Sends the messages buffered by the destination pipeline.
+
+        Bots sending messages outside of `process`, e.g. from a timer thread,
+        call this afterwards, as the buffer is otherwise only flushed when
+        acknowledging a message.
+        """
+        if self.__destination_pipeline:
+            self.__destination_pipeline.flush()
+
     def _dump_message(self, error_traceback, message: dict):
         if message is None or getattr(self, 'testing', False):
             return
@@ -810,6 +1045,11 @@ def __init_logger(self):
         """
         Initialize the logger.
         """
+        if self.is_multiprocessed:
+            # Log to the handlers of the parent process' logger
+            self.logger = logging.getLogger(self.__bot_id_full)
+            self.logger.setLevel(self.logging_level)
+            return
         if self.logging_handler == 'syslog':
             syslog = self.logging_syslog
         else:
@@ -946,7 +1186,7 @@ class ParserBot(Bot):
 
     def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                  disable_multithreading: bool = None):
-        super().__init__(bot_id=bot_id)
+        super().__init__(bot_id=bot_id, disable_multithreading=disable_multithreading)
         if self.__class__.__name__ == 'ParserBot':
             self.logger.error('ParserBot can\'t be started itself. '
                               'Possible Misconfiguration.')
@@ -1172,7 +1412,7 @@ class CollectorBot(Bot):
 
     def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                  disable_multithreading: bool = None):
-        super().__init__(bot_id=bot_id)
+        super().__init__(bot_id=bot_id, disable_multithreading=disable_multithreading)
         if self.__class__.__name__ == 'CollectorBot':
             self.logger.error('CollectorBot can\'t be started itself. '
                               'Possible Misconfiguration.')
@@ -1232,7 +1472,7 @@ class ExpertBot(Bot):
 
     def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                  disable_multithreading: bool = None):
-        super().__init__(bot_id=bot_id)
+        super().__init__(bot_id=bot_id, disable_multithreading=disable_multithreading)
 
 
 class OutputBot(Bot):
@@ -1243,7 +1483,7 @@ class OutputBot(Bot):
 
     def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                  disable_multithreading: bool = None):
-        super().__init__(bot_id=bot_id)
+        super().__init__(bot_id=bot_id, disable_multithreading=disable_multithreading)
         if self.__class__.__name__ == 'OutputBot':
             self.logger.error('OutputBot can\'t be started itself. '
                               'Possible Misconfiguration.')
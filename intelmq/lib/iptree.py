@@ -0,0 +1,287 @@
+# SPDX-FileCopyrightText: 2021 Sebastian Wagner
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# -*- coding: utf-8 -*-
+"""
+Longest-prefix-match lookups of IP addresses in a memory-mapped file.
+
+The experts looking up IP addresses in local databases (e.g. ASN lookup, Tor
+nodes) can convert their database into this format with `IPTree.build` in
+their `--update-database` command. Every bot process opens the file read-only
+with `mmap`, so the operating system shares the pages between all processes
+and the database does not need to be parsed on start.
+
+The networks are flattened to a sorted list of non-overlapping address ranges
+when building the file, each range pointing to the value of the most specific
+network containing it. A lookup is a binary search on the start addresses.
+
+File format, all integers are big-endian and unsigned:
+
+* magic `IMQIPT1\\n`, the number of IPv4 ranges, IPv6 ranges and values (4 bytes each)
+* the start addresses of the IPv4 ranges (4 bytes each), then their value indices (4 bytes each)
+* the start addresses of the IPv6 ranges (16 bytes each), then their value indices (4 bytes each)
+* the offsets of the values in the value section (4 bytes each, number of values + 1)
+* the values, JSON-encoded
+
+For small sets of networks without values, `merge_networks` returns the
+merged ranges in memory, to be searched with bisect by the caller.
+"""
+import bisect
+import ipaddress
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+__all__ = ['IPTree', 'TREE_SUFFIX', 'merge_networks', 'open_tree']
+
+MAGIC = b'IMQIPT1\n'
+HEADER = struct.Struct('>8sIII')
+# value index of ranges not covered by any network
+NO_VALUE = 0xFFFFFFFF
+# file name suffix of the trees built by the bots next to their database
+TREE_SUFFIX = '.iptree'
+
+
+class _Column(object):
+    """
+    Read-only sequence of big-endian integers in a buffer, usable with bisect.
+    """
+    __slots__ = ('buffer', 'offset', 'width', 'length')
+
+    def __init__(self, buffer, offset: int, width: int, length: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> int:
+        start = self.offset + index * self.width
+        return int.from_bytes(self.buffer[start:start + self.width], 'big')
+
+
+def _flatten(networks: List[Tuple[int, int, int]], maximum: int) -> Tuple[List[int], List[int]]:
+    """
+    Converts networks (first address, last address, value index) to the start
+    addresses and value indices of non-overlapping ranges.
+    """
+    starts: List[int] = []
+    values: List[int] = []
+
+    def emit(address: int, value: int):
+        if starts and starts[-1] == address:
+            starts.pop()
+            values.pop()
+        if (values[-1] if values else NO_VALUE) != value:
+            starts.append(address)
+            values.append(value)
+
+    # CIDR networks are either nested or disjoint, the enclosing networks are on the stack
+    stack: List[Tuple[int, int]] = []
+
+    def pop():
+        end, _ = stack.pop()
+        if end < maximum:
+            emit(end + 1, stack[-1][1] if stack else NO_VALUE)
+
+    for first, last, value in sorted(networks, key=lambda network: (network[0], -network[1])):
+        while stack and stack[-1][0] < first:
+            pop()
+        stack.append((last, value))
+        emit(first, value)
+    while stack:
+        pop()
+    return starts, values
+
+
+def merge_networks(networks: Iterable[Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network]]
+                   ) -> Dict[int, Tuple[List[int], List[int]]]:
+    """
+    Merges the networks to sorted, disjoint ranges of integers per IP version.
+
+    An address is in one of the networks if it is not greater than the last
+    address of the range with the greatest first address not greater than it:
+
+        starts, ends = merge_networks(networks)[4]
+        position = bisect.bisect_right(starts, address) - 1
+        found = position >= 0 and address <= ends[position]
+
+    Parameters:
+        networks: Network objects or strings, host bits are allowed in strings
+
+    Returns:
+        The first and the last addresses of the ranges by IP version
+
+    Raises:
+        ValueError: If a network is invalid.
+    """
+    parsed = sorted((ipaddress.ip_network(network.strip(), strict=False) if isinstance(network, str) else network
+                     for network in networks),
+                    key=lambda network: (network.version, network.network_address))
+    ranges = {4: [], 6: []}
+    for network in parsed:
+        first, last = int(network.network_address), int(network.broadcast_address)
+        merged = ranges[network.version]
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return {version: ([first for first, _ in merged], [last for _, last in merged])
+            for version, merged in ranges.items()}
+
+
+class IPTree(object):
+    """
+    Read-only memory-mapped longest-prefix-match table of IPv4 and IPv6 networks.
+
+    Usage:
+        IPTree.build('/path/to/file', [('192.0.2.0/24', 'value'), ('2001:db8::/32', 1)])
+        with IPTree('/path/to/file') as tree:
+            tree.lookup('192.0.2.1')  # 'value'
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as handle:
+            self.__map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, count4, count6, count_values = HEADER.unpack_from(self.__map)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            self.__map.close()
+            raise ValueError('%r is not an IP tree file.' % filename)
+        offset = HEADER.size
+        self.__columns = {}
+        for version, width, count in ((4, 4, count4), (6, 16, count6)):
+            starts = _Column(self.__map, offset, width, count)
+            offset += width * count
+            self.__columns[version] = (starts, _Column(self.__map, offset, 4, count))
+            offset += 4 * count
+        self.__offsets = _Column(self.__map, offset, 4, count_values + 1)
+        self.__values_offset = offset + 4 * (count_values + 1)
+        if len(self.__map) < self.__values_offset + (self.__offsets[count_values] if count_values else 0):
+            self.__map.close()
+            raise ValueError('%r is truncated.' % filename)
+
+    def close(self):
+        self.__map.close()
+
+    def __enter__(self) -> 'IPTree':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.__columns[4][0]) + len(self.__columns[6][0])
+
+    def __value(self, index: int) -> Any:
+        if index == NO_VALUE:
+            return None
+        start = self.__values_offset + self.__offsets[index]
+        end = self.__values_offset + self.__offsets[index + 1]
+        return json.loads(self.__map[start:end])
+
+    def lookup(self, ip: str) -> Any:
+        """
+        Returns the value of the most specific network containing the IP address or None.
+
+        Raises:
+            ValueError: If ip is not a valid IP address.
+        """
+        address = ipaddress.ip_address(ip)
+        starts, values = self.__columns[address.version]
+        position = bisect.bisect_right(starts, int(address), 0, len(starts)) - 1
+        if position < 0:
+            return None
+        return self.__value(values[position])
+
+    def lookup_many(self, ips: Iterable[str]) -> List[Any]:
+        """
+        Looks up multiple IP addresses at once, in the given order.
+
+        The addresses are searched in sorted order, so that every search
+        continues at the position of the previous one.
+        """
+        addresses = [ipaddress.ip_address(ip) for ip in ips]
+        results: List[Any] = [None] * len(addresses)
+        decoded = {}
+        positions = {4: 0, 6: 0}
+        for index in sorted(range(len(addresses)), key=lambda index: (addresses[index].version, int(addresses[index]))):
+            address = addresses[index]
+            starts, values = self.__columns[address.version]
+            position = bisect.bisect_right(starts, int(address), positions[address.version], len(starts))
+            positions[address.version] = position
+            if position == 0:
+                continue
+            value_index = values[position - 1]
+            if value_index not in decoded:
+                decoded[value_index] = self.__value(value_index)
+            results[index] = decoded[value_index]
+        return results
+
+    @staticmethod
+    def build(filename: str, networks: Iterable[Tuple[str, Any]]):
+        """
+        Writes the networks with their values to the file.
+
+        The file is written to a temporary file first and then replaces the
+        existing one, so that processes having the old file opened can still
+        use it. If a network is given multiple times, the last value is used.
+
+        Parameters:
+            filename: The path of the tree file
+            networks: Pairs of networks in CIDR notation (or single addresses) and JSON-serializable values
+
+        Raises:
+            ValueError: If a network is invalid.
+        """
+        encoded_values: List[bytes] = []
+        value_indices = {}
+        parsed = {4: {}, 6: {}}
+        for network, value in networks:
+            network = ipaddress.ip_network(network, strict=False)
+            encoded = json.dumps(value, separators=(',', ':')).encode()
+            if encoded not in value_indices:
+                value_indices[encoded] = len(encoded_values)
+                encoded_values.append(encoded)
+            parsed[network.version][(int(network.network_address), int(network.broadcast_address))] = value_indices[encoded]
+
+        sections = {}
+        for version, width in ((4, 4), (6, 16)):
+            starts, values = _flatten([(first, last, value) for (first, last), value in parsed[version].items()],
+                                     2 ** (8 * width) - 1)
+            sections[version] = (b''.join(start.to_bytes(width, 'big') for start in starts) +
+                                 b''.join(value.to_bytes(4, 'big') for value in values), len(starts))
+
+        offsets = [0]
+        for encoded in encoded_values:
+            offsets.append(offsets[-1] + len(encoded))
+
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temporary, 'wb') as handle:
+            handle.write(HEADER.pack(MAGIC, sections[4][1], sections[6][1], len(encoded_values)))
+            handle.write(sections[4][0])
+            handle.write(sections[6][0])
+            handle.write(b''.join(offset.to_bytes(4, 'big') for offset in offsets))
+            handle.write(b''.join(encoded_values))
+        os.replace(temporary, filename)
+
+
+def open_tree(database: str) -> Optional[IPTree]:
+    """
+    Opens the tree built for the database, if it exists and is not older than the database.
+    """
+    filename = database + TREE_SUFFIX
+    try:
+        if os.stat(filename).st_mtime < os.stat(database).st_mtime:
+            return None
+    except FileNotFoundError:
+        return None
+    return IPTree(filename)
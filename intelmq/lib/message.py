@@ -11,8 +11,9 @@
 import hashlib
 import json
 import re
+import sys
 import warnings
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from typing import Any, Dict, Iterable, Optional, Sequence, Union
 
 import intelmq.lib.exceptions as exceptions
@@ -20,12 +21,122 @@
 from intelmq import HARMONIZATION_CONF_FILE
 from intelmq.lib import utils
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 __all__ = ['Event', 'Message', 'MessageFactory', 'Report']
 VALID_MESSSAGE_TYPES = ('Event', 'Message', 'Report')
+MESSAGE_FORMATS = ('json', 'orjson', 'msgpack')
+# Serialized messages in a binary format start with this byte, followed by one byte
+# for the format and one for its version. 0xC1 can neither start an UTF-8 (JSON)
+# text nor does it occur in msgpack.
+BINARY_FORMAT_MARKER = b'\xc1'
+MSGPACK_MARKER = BINARY_FORMAT_MARKER + b'M1'
 # '_' needs to be allowed at the beginning currently because of '__type'. Can be removed with IEP04 implemented.
 HARMONIZATION_KEY_FORMAT = re.compile(r'^[a-z_][a-z_0-9]+(\.[a-z_0-9]+)*$')
 
 
+class HarmonizationField(object):
+    """
+    A single field of a harmonization configuration, with the type class
+    resolved and the regular expressions compiled once.
+    """
+    __slots__ = ('name', 'config', 'type', 'length', 'regex', 'iregex')
+
+    def __init__(self, name: str, config: dict) -> None:
+        self.name = name
+        self.config = config
+        self.type = getattr(intelmq.lib.harmonization, config['type']) if 'type' in config else None
+        self.length = config.get('length')
+        self.regex = re.compile(config['regex']) if 'regex' in config else None
+        self.iregex = re.compile(config['iregex'], re.IGNORECASE) if 'iregex' in config else None
+
+    def is_valid(self, value: Any, subitem: bool = False) -> tuple:
+        if not subitem:
+            validation = self.type.is_valid(value)
+        else:
+            validation = self.type.is_valid_subitem(value)
+        if not validation:
+            return (False, 'is_valid returned False.')
+        if self.length is not None:
+            length = len(str(value))
+            if not length <= self.length:
+                return (False, 'too long: {} > {}.'.format(length, self.length))
+        if self.regex is not None and not self.regex.search(str(value)):
+            return (False, 'regex did not match.')
+        if self.iregex is not None and not self.iregex.search(str(value)):
+            return (False, 'regex (case insensitive) did not match.')
+        return (True, )
+
+    def sanitize(self, value: Any, subitem: bool = False) -> Any:
+        if not subitem:
+            return self.type.sanitize(value)
+        return self.type.sanitize_subitem(value)
+
+
+class HarmonizationSchema(object):
+    """
+    The compiled harmonization configuration of one message type.
+
+    Use HarmonizationSchema.get to obtain an instance, the compiled schemas are
+    cached per process for the given configuration dictionary. The
+    configuration must not be modified after it has been used for a message.
+    """
+    _cache_size = 32
+    _cache = OrderedDict()  # type: OrderedDict
+
+    def __init__(self, config: dict) -> None:
+        for harm_key in config.keys():
+            if not HARMONIZATION_KEY_FORMAT.match(harm_key) and harm_key != '__type':
+                raise exceptions.InvalidKey("Harmonization key %r is invalid." % harm_key)
+        self.config = config
+        self.fields = {key: HarmonizationField(key, value)
+                       for key, value in config.items() if key != '__type'}
+
+    @classmethod
+    def get(cls, config: dict) -> 'HarmonizationSchema':
+        """
+        Returns the compiled schema for the harmonization configuration of a
+        message type, compiling it if it is not yet cached.
+        """
+        cached = cls._cache.get(id(config))
+        # the configuration is stored along with the schema, so its id can't be reused meanwhile
+        if cached is not None and cached[0] is config:
+            return cached[1]
+        schema = cls(config)
+        cls._cache[id(config)] = (config, schema)
+        while len(cls._cache) > cls._cache_size:
+            cls._cache.popitem(last=False)
+        return schema
+
+    def lookup(self, key: str) -> tuple:
+        """
+        Returns a tuple of the field and whether the key is a subitem of the field.
+        Raises KeyError for unknown keys.
+        """
+        try:
+            return self.fields[key], False
+        except KeyError:
+            # Could be done recursively in the future if needed
+            return self.fields[key.split('.')[0]], True
+
+    def intern(self, key: str) -> str:
+        """
+        Returns a shared string object for the key, so that not every message
+        holds its own copies of the key strings.
+        """
+        field = self.fields.get(key)
+        if field is not None:
+            return field.name
+        return sys.intern(key)
+
+
 class MessageFactory(object):
     """
     unserialize: JSON encoded message to object
@@ -34,7 +145,8 @@ class MessageFactory(object):
 
     @staticmethod
     def from_dict(message: dict, harmonization=None,
-                  default_type: Optional[str] = None) -> dict:
+                  default_type: Optional[str] = None,
+                  validate: bool = True) -> dict:
         """
         Takes dictionary Message object, returns instance of correct class.
 
@@ -42,6 +154,7 @@ def from_dict(message: dict, harmonization=None,
             message: the message which should be converted to a Message object
             harmonization: a dictionary holding the used harmonization
             default_type: If '__type' is not present in message, the given type will be used
+            validate: If False, the values are trusted and not validated, see Message
 
         See also:
             MessageFactory.unserialize
@@ -57,11 +170,13 @@ def from_dict(message: dict, harmonization=None,
                                              expected=VALID_MESSSAGE_TYPES,
                                              docs=HARMONIZATION_CONF_FILE)
         del message["__type"]
-        return class_reference(message, auto=True, harmonization=harmonization)
+        return class_reference(message, auto=True, harmonization=harmonization,
+                               validate=validate)
 
     @staticmethod
     def unserialize(raw_message: str, harmonization: dict = None,
-                    default_type: Optional[str] = None) -> dict:
+                    default_type: Optional[str] = None,
+                    validate: bool = True) -> dict:
         """
         Takes JSON-encoded Message object, returns instance of correct class.
 
@@ -69,6 +184,7 @@ def unserialize(raw_message: str, harmonization: dict = None,
             message: the message which should be converted to a Message object
             harmonization: a dictionary holding the used harmonization
             default_type: If '__type' is not present in message, the given type will be used
+            validate: If False, the values are trusted and not validated, see Message
 
         See also:
             MessageFactory.from_dict
@@ -76,16 +192,23 @@ def unserialize(raw_message: str, harmonization: dict = None,
         """
         message = Message.unserialize(raw_message)
         return MessageFactory.from_dict(message, harmonization=harmonization,
-                                        default_type=default_type)
+                                        default_type=default_type,
+                                        validate=validate)
 
     @staticmethod
-    def serialize(message):
+    def serialize(message, message_format: str = 'json',
+                  sent: Optional[float] = None) -> Union[str, bytes]:
         """
         Takes instance of message-derived class and makes JSON-encoded Message.
 
         The class is saved in __type attribute.
+
+        Parameters:
+            message: the message to serialize
+            message_format: the wire format, one of MESSAGE_FORMATS, see Message.serialize
+            sent: the time of sending, see Message.serialize
         """
-        raw_message = Message.serialize(message)
+        raw_message = Message.serialize(message, message_format=message_format, sent=sent)
         return raw_message
 
 
@@ -93,14 +216,29 @@ class Message(dict):
 
     _IGNORED_VALUES = ["", "-", "N/A"]
     _default_value_set = False
+    # the input of the constructor, only set while it is added
+    __input = None
 
     def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
-                 harmonization: dict = None) -> None:
+                 harmonization: dict = None, validate: bool = True) -> None:
+        """
+        Parameters:
+            message: The initial fields and values.
+            auto: unused here
+            harmonization: Harmonization definition to use
+            validate: If False, the values of the given message are trusted,
+                e.g. because they have been produced by another bot, and are
+                neither sanitized nor validated. The keys are still checked.
+                Values added or changed later on are always validated.
+        """
         try:
             classname = message['__type'].lower()
             del message['__type']
         except (KeyError, TypeError):
             classname = self.__class__.__name__.lower()
+        if isinstance(message, dict):
+            # time of sending, only used by the pipeline, see serialize
+            message.pop('__sent', None)
 
         if harmonization is None:
             harmonization = utils.load_configuration(HARMONIZATION_CONF_FILE)
@@ -117,20 +255,27 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
             warnings.warn("Assuming harmonization type 'JSONDict' for harmonization field 'extra'. "
                           "This assumption will be removed in version 3.0.", DeprecationWarning)
             self.harmonization_config['extra']['type'] = 'JSONDict'
-        for harm_key in self.harmonization_config.keys():
-            if not HARMONIZATION_KEY_FORMAT.match(harm_key) and harm_key != '__type':
-                raise exceptions.InvalidKey("Harmonization key %r is invalid." % harm_key)
+        self.__schema = HarmonizationSchema.get(self.harmonization_config)
 
         super().__init__()
         if isinstance(message, dict):
-            self.iterable = message
+            iterable = message
         elif isinstance(message, tuple):
-            self.iterable = dict(message)
+            iterable = dict(message)
         else:
             raise ValueError("Type %r of message can't be handled, must be dict or tuple.", type(message))
-        for key, value in self.iterable.items():
-            if not self.add(key, value, sanitize=False, raise_failure=False):
-                self.add(key, value, sanitize=True)
+        # The input is not kept, it is only used for errors during the initialization
+        self.__input = iterable
+        try:
+            if validate:
+                for key, value in iterable.items():
+                    if not self.add(key, value, sanitize=False, raise_failure=False):
+                        self.add(key, value, sanitize=True)
+            else:
+                for key, value in iterable.items():
+                    self.__add_trusted(key, value)
+        finally:
+            del self.__input
 
     def __setitem__(self, key: str, value: Any) -> None:
         self.add(key, value)
@@ -252,14 +397,14 @@ def add(self, key: str, value: str, sanitize: bool = True,
             value = self.__sanitize_value(key, value)
             if value is None:
                 if raise_failure:
-                    raise exceptions.InvalidValue(key, old_value, object=bytes(json.dumps(self.iterable), 'utf-8'))
+                    raise exceptions.InvalidValue(key, old_value, object=self.__error_object())
                 else:
                     return False
 
         valid_value = self.__is_valid_value(key, value)
         if not valid_value[0]:
             if raise_failure:
-                raise exceptions.InvalidValue(key, value, reason=valid_value[1], object=bytes(json.dumps(self.iterable), 'utf-8'))
+                raise exceptions.InvalidValue(key, value, reason=valid_value[1], object=self.__error_object())
             else:
                 return False
 
@@ -275,12 +420,37 @@ def add(self, key: str, value: str, sanitize: bool = True,
                         continue
                 if key != 'extra' and extravalue in self._IGNORED_VALUES:
                     continue
-                super().__setitem__('{}.{}'.format(key, extrakey),
+                super().__setitem__(sys.intern('{}.{}'.format(key, extrakey)),
                                     extravalue)
         else:
-            super().__setitem__(key, value)
+            super().__setitem__(self.__schema.intern(key), value)
         return True
 
+    def __add_trusted(self, key: str, value: Any):
+        """
+        Adds a value without sanitation and validation, only the key is checked.
+        """
+        if value is None or value in self._IGNORED_VALUES:
+            return
+        if not self.__is_valid_key(key):
+            raise exceptions.InvalidKey(key)
+        field, subitem = self.__schema.lookup(key)
+        if field.config['type'] == 'JSONDict' and not subitem:
+            # the whole field given as JSON string needs to be split up
+            if not self.add(key, value, sanitize=False, raise_failure=False):
+                self.add(key, value, sanitize=True)
+            return
+        super().__setitem__(self.__schema.intern(key), value)
+
+    def __error_object(self) -> bytes:
+        """
+        The message to attach to errors: The input during the initialization,
+        the current content afterwards.
+        """
+        if self.__input is not None:
+            return bytes(json.dumps(self.__input), 'utf-8')
+        return bytes(json.dumps(self), 'utf-8')
+
     def update(self, other: dict):
         for key, value in other.items():
             if not self.add(key, value, sanitize=False, raise_failure=False, overwrite=True):
@@ -301,27 +471,77 @@ def copy(self):
         self['__type'] = class_ref
         retval = getattr(intelmq.lib.message,
                          class_ref)(super().copy(),
-                                    harmonization={self.__class__.__name__.lower(): self.harmonization_config})
+                                    harmonization={self.__class__.__name__.lower(): self.harmonization_config},
+                                    validate=False)
         del self['__type']
         return retval
 
     def deep_copy(self):
         return MessageFactory.unserialize(MessageFactory.serialize(self),
-                                          harmonization={self.__class__.__name__.lower(): self.harmonization_config})
+                                          harmonization={self.__class__.__name__.lower(): self.harmonization_config},
+                                          validate=False)
 
     def __str__(self):
         return self.serialize()
 
-    def serialize(self):
-        self['__type'] = self.__class__.__name__
-        json_dump = utils.decode(json.dumps(self))
-        del self['__type']
-        return json_dump
+    def serialize(self, message_format: str = 'json',
+                  sent: Optional[float] = None) -> Union[str, bytes]:
+        """
+        Serializes the message including its type for the pipeline.
+
+        Parameters:
+            message_format: One of MESSAGE_FORMATS.
+                json: JSON as string, using the standard library (default)
+                orjson: JSON as bytes, using orjson. Readable by all bots, with or without orjson.
+                msgpack: msgpack as bytes, prefixed by MSGPACK_MARKER. Can only be
+                    read by bots of IntelMQ 3.1.0 or newer with msgpack installed.
+            sent: If given, the time of sending as UNIX timestamp, saved in `__sent`.
+                The receiving bot uses it to measure the time the message waited
+                in the queue. Messages are constructed without it.
+
+        Raises:
+            ValueError: if the message_format is unknown
+            intelmq.lib.exceptions.MissingDependencyError: if the library for the format is not installed
+        """
+        message = {**self, '__type': self.__class__.__name__}
+        if sent is not None:
+            message['__sent'] = sent
+        if message_format == 'json':
+            return json.dumps(message)
+        elif message_format == 'orjson':
+            if orjson is None:
+                raise exceptions.MissingDependencyError('orjson')
+            try:
+                return orjson.dumps(message)
+            except TypeError:
+                # e.g. integers exceeding 64 bit
+                return json.dumps(message)
+        elif message_format == 'msgpack':
+            if msgpack is None:
+                raise exceptions.MissingDependencyError('msgpack')
+            return MSGPACK_MARKER + msgpack.packb(message)
+        raise ValueError('Unknown message format %r, must be one of %r.' % (message_format, MESSAGE_FORMATS))
 
     @staticmethod
-    def unserialize(message_string: str):
-        message = json.loads(message_string)
-        return message
+    def unserialize(message_string: Union[str, bytes]) -> dict:
+        """
+        Parses a serialized message of any of the formats in MESSAGE_FORMATS.
+
+        The format is detected by the marker of binary formats, everything else is JSON.
+        """
+        if isinstance(message_string, bytes) and message_string.startswith(BINARY_FORMAT_MARKER):
+            if not message_string.startswith(MSGPACK_MARKER):
+                raise ValueError('Unknown binary message format %r.' % message_string[:len(MSGPACK_MARKER)])
+            if msgpack is None:
+                raise exceptions.MissingDependencyError('msgpack')
+            return msgpack.unpackb(message_string[len(MSGPACK_MARKER):])
+        if orjson is not None:
+            try:
+                return orjson.loads(message_string)
+            except orjson.JSONDecodeError:
+                # orjson is stricter than json, e.g. for NaN or large integers
+                pass
+        return json.loads(message_string)
 
     def __is_valid_key(self, key: str):
         try:
@@ -337,47 +557,18 @@ def __is_valid_key(self, key: str):
     def __is_valid_value(self, key: str, value: str):
         if key == '__type':
             return (True, )
-        config, subitem = self.__get_type_config(key)
-        class_reference = getattr(intelmq.lib.harmonization, config['type'])
-        if not subitem:
-            validation = class_reference().is_valid(value)
-        else:
-            validation = class_reference().is_valid_subitem(value)
-        if not validation:
-            return (False, 'is_valid returned False.')
-        if 'length' in config:
-            length = len(str(value))
-            if not length <= config['length']:
-                return (False, 'too long: {} > {}.'.format(length,
-                                                           config['length']))
-        if 'regex' in config:
-            if not re.search(config['regex'], str(value)):
-                return (False, 'regex did not match.')
-        if 'iregex' in config:
-            if not re.search(config['iregex'], str(value), re.IGNORECASE):
-                return (False, 'regex (case insensitive) did not match.')
-        return (True, )
+        field, subitem = self.__schema.lookup(key)
+        return field.is_valid(value, subitem)
 
     def __sanitize_value(self, key: str, value: str):
-        class_name, subitem = self.__get_type_config(key)
-        class_reference = getattr(intelmq.lib.harmonization, class_name['type'])
-        if not subitem:
-            return class_reference().sanitize(value)
-        else:
-            return class_reference().sanitize_subitem(value)
+        field, subitem = self.__schema.lookup(key)
+        return field.sanitize(value, subitem)
 
     def __get_type_config(self, key: str):
         if key == '__type':
             return None, None
-        try:
-            class_name = self.harmonization_config[key]
-        except KeyError:
-            # Could be done recursively in the future if needed
-            class_name = self.harmonization_config[key.split('.')[0]]
-            subitem = True
-        else:
-            subitem = False
-        return class_name, subitem
+        field, subitem = self.__schema.lookup(key)
+        return field.config, subitem
 
     def __hash__(self):
         return int(self.hash(), 16)
@@ -515,7 +706,7 @@ def __contains__(self, item: str) -> bool:
 class Event(Message):
 
     def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
-                 harmonization: Optional[dict] = None) -> None:
+                 harmonization: Optional[dict] = None, validate: bool = True) -> None:
         """
         Parameters:
             message: Give a report and feed.name, feed.url and
@@ -523,6 +714,7 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 If it's another type, the value is given to dict's init
             auto: unused here
             harmonization: Harmonization definition to use
+            validate: If False, the values of message are not validated, see Message
         """
         if isinstance(message, Report):
             template = {}
@@ -544,13 +736,13 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 template['time.observation'] = message['time.observation']
         else:
             template = message
-        super().__init__(template, auto, harmonization)
+        super().__init__(template, auto, harmonization, validate=validate)
 
 
 class Report(Message):
 
     def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
-                 harmonization: Optional[dict] = None) -> None:
+                 harmonization: Optional[dict] = None, validate: bool = True) -> None:
         """
         Parameters:
             message: Passed along to Message's and dict's init.
@@ -558,6 +750,7 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 has only the fields which are possible in Report, all others are stripped.
             auto: if False (default), time.observation is automatically added.
             harmonization: Harmonization definition to use
+            validate: If False, the values of message are not validated, see Message
         """
         if isinstance(message, Event):
             super().__init__({}, auto, harmonization)
@@ -565,7 +758,7 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 if self._Message__is_valid_key(key):
                     self.add(key, value, sanitize=False)
         else:
-            super().__init__(message, auto, harmonization)
+            super().__init__(message, auto, harmonization, validate=validate)
         if not auto and 'time.observation' not in self:
             time_observation = intelmq.lib.harmonization.DateTime().generate_datetime_now()
             self.add('time.observation', time_observation, sanitize=False)
@@ -4,9 +4,15 @@
 SPDX-License-Identifier: AGPL-3.0-or-later
 
 CacheMixin is used for caching/storing data in redis.
+
+With redis_cache_local_size, the most recently used values are also kept in
+the memory of the bot, for the remaining TTL of the key in Redis. Keys which
+are not in Redis are not remembered, so values set by other bots are found.
 """
 
-from typing import Any, Optional
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import time
 import redis
 import intelmq.lib.utils as utils
 
@@ -18,6 +24,11 @@ class CacheMixin:
     redis_cache_db: int = 9
     redis_cache_ttl: int = 15
     redis_cache_password: Optional[str] = None
+    redis_cache_local_size: int = 0
+    # key -> (value, expiry as monotonic time or None)
+    __local: Optional[OrderedDict] = None
+    __local_hits: int = 0
+    __local_misses: int = 0
 
     def __init__(self, **kwargs):
         if self.redis_cache_host.startswith("/"):
@@ -32,31 +43,163 @@ def __init__(self, **kwargs):
             }
 
         self.__redis = redis.Redis(db=self.redis_cache_db, password=self.redis_cache_password, **kwargs)
+        self.__local = OrderedDict() if self.redis_cache_local_size else None
+        self.__local_hits = self.__local_misses = 0
         super().__init__()
 
+    def __local_get(self, key: str) -> Optional[str]:
+        """
+        The value of the key in the local cache, None if missing or expired.
+        """
+        entry = self.__local.get(key)
+        if entry is not None:
+            value, expiry = entry
+            if expiry is None or expiry > time.monotonic():
+                self.__local.move_to_end(key)
+                self.__local_hits += 1
+                return value
+            del self.__local[key]
+        self.__local_misses += 1
+        return None
+
+    def __local_set(self, key: str, value: Any, ttl: Optional[float]):
+        """
+        Remembers the value for ttl seconds (None: no expiry).
+        Only strings are kept, as other types are returned as strings by Redis.
+        """
+        if self.__local is None:
+            return
+        if not isinstance(value, str) or (ttl is not None and ttl <= 0):
+            self.__local.pop(key, None)
+            return
+        self.__local[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self.__local.move_to_end(key)
+        if len(self.__local) > self.redis_cache_local_size:
+            self.__local.popitem(last=False)
+
+    def __get_remote(self, keys: List[str]) -> List[Optional[str]]:
+        """
+        Gets the values of the keys from Redis with one round trip and keeps them locally.
+        """
+        if self.__local is None:
+            return [utils.decode(value) if isinstance(value, bytes) else value
+                    for value in self.__redis.mget(keys)]
+        pipeline = self.__redis.pipeline(transaction=False)
+        pipeline.mget(keys)
+        for key in keys:
+            pipeline.pttl(key)
+        values, *ttls = pipeline.execute()
+        values = [utils.decode(value) if isinstance(value, bytes) else value for value in values]
+        for key, value, ttl in zip(keys, values, ttls):
+            if value is not None:
+                # -1: no expiry
+                self.__local_set(key, value, ttl / 1000 if ttl >= 0 else None)
+        return values
+
     def cache_exists(self, key: str):
+        if self.__local is not None and self.__local_get(key) is not None:
+            return True
         return self.__redis.exists(key)
 
     def cache_get(self, key: str):
-        retval = self.__redis.get(key)
-        if isinstance(retval, bytes):
-            return utils.decode(retval)
-        return retval
+        return self.cache_get_many([key])[0]
 
-    def cache_set(self, key: str, value: Any, ttl: Optional[int] = None):
-        if self.redis_cache_ttl is None:
+    def cache_get_many(self, keys: Iterable[str]) -> List[Optional[str]]:
+        """
+        Gets the values of multiple keys with one round trip, None for missing keys.
+        """
+        keys = list(keys)
+        if not keys:
+            return []
+        if self.__local is None:
+            return self.__get_remote(keys)
+        values = [self.__local_get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if missing:
+            for index, value in zip(missing, self.__get_remote([keys[index] for index in missing])):
+                values[index] = value
+        return values
+
+    def cache_statistics(self) -> Dict[str, int]:
+        """
+        The hits and misses of the local cache, empty if it is not used.
+        """
+        if self.__local is None:
+            return {}
+        return {'cache_local_hits': self.__local_hits, 'cache_local_misses': self.__local_misses}
+
+    def __ttl(self, ttl: Optional[int]) -> Optional[int]:
+        """
+        The expiry for SET: ttl, or redis_cache_ttl if ttl is None. 0 means no expiry.
+        """
+        if ttl is None:
             ttl = self.redis_cache_ttl
+        return int(ttl) if ttl else None
+
+    def cache_set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """
+        Sets the key, expiring after ttl seconds (default: redis_cache_ttl, 0: never).
+        """
+        local_value = value
+        if isinstance(value, str):
+            value = utils.encode(value)
+        self.__redis.set(key, value, ex=self.__ttl(ttl))
+        self.__local_set(key, local_value, self.__ttl(ttl))
+
+    def cache_set_if_absent(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        """
+        Sets the key only if it does not exist yet, atomically and with one round trip.
+
+        Returns True if the key has been set, False if it existed already.
+        For the ttl see cache_set.
+        """
+        local_value = value
         if isinstance(value, str):
             value = utils.encode(value)
-        # backward compatibility (Redis v2.2)
-        self.__redis.set(key, value)
-        if self.redis_cache_ttl:
-            self.__redis.expire(key, self.redis_cache_ttl)
+        if self.__redis.set(key, value, ex=self.__ttl(ttl), nx=True):
+            self.__local_set(key, local_value, self.__ttl(ttl))
+            return True
+        return False
+
+    def cache_set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None):
+        """
+        Sets multiple keys with one round trip. For the ttl see cache_set.
+        """
+        if not mapping:
+            return
+        ttl = self.__ttl(ttl)
+        pipeline = self.__redis.pipeline(transaction=False)
+        for key, value in mapping.items():
+            if isinstance(value, str):
+                value = utils.encode(value)
+            pipeline.set(key, value, ex=ttl)
+        pipeline.execute()
+        for key, value in mapping.items():
+            self.__local_set(key, value, ttl)
+
+    def cache_incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """
+        Increments the key atomically and returns the new value, the key starts at 0.
+
+        The expiry is (re-)set with every call, for the ttl see cache_set.
+        """
+        ttl = self.__ttl(ttl)
+        if self.__local is not None:
+            self.__local.pop(key, None)
+        pipeline = self.__redis.pipeline()
+        pipeline.incrby(key, amount)
+        if ttl:
+            pipeline.expire(key, ttl)
+        else:
+            pipeline.persist(key)
+        return pipeline.execute()[0]
 
     def cache_flush(self):
         """
         Flushes the currently opened database by calling FLUSHDB.
         """
+        if self.__local is not None:
+            self.__local.clear()
         self.__redis.flushdb()
 
     def cache_get_redis_instance(self):
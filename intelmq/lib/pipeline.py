@@ -4,8 +4,9 @@
 
 # -*- coding: utf-8 -*-
 import time
-from itertools import chain
-from typing import Dict, Optional
+from collections import defaultdict, deque
+from itertools import chain, islice
+from typing import Dict, List, Optional, Union
 import ssl
 
 import redis
@@ -13,6 +14,7 @@
 import intelmq.lib.exceptions as exceptions
 import intelmq.lib.pipeline
 import intelmq.lib.utils as utils
+from intelmq.lib.message import BINARY_FORMAT_MARKER
 
 __all__ = ['Pipeline', 'PipelineFactory', 'Redis', 'Pythonlist', 'Amqp']
 
@@ -102,7 +104,10 @@ def set_queues(self, queues: Optional[str], queues_type: str):
         """
         if queues_type == "source":
             self.source_queue = queues
-            self.internal_queue = None if queues is None else f'{queues}-internal'
+            if queues is None:
+                self.internal_queue = None
+            else:
+                self.internal_queue = self.pipeline_args.get('source_pipeline_internal_queue', f'{queues}-internal')
 
         elif queues_type == "destination":
             type_ = type(queues)
@@ -125,18 +130,46 @@ def send(self, message: str, path: str = "_default",
              path_permissive: bool = False):
         raise NotImplementedError
 
-    def receive(self) -> str:
+    def receive(self) -> Union[str, bytes]:
+        """
+        Returns the next message, decoded to a string.
+        Messages in a binary format (see intelmq.lib.message.MESSAGE_FORMATS) are returned as bytes.
+        """
         if self._has_message:
             raise exceptions.PipelineError("There's already a message, first "
                                            "acknowledge the existing one.")
 
         retval = self._receive()
         self._has_message = True
-        return utils.decode(retval)
+        return self._decode_message(retval)
+
+    @staticmethod
+    def _decode_message(message: bytes) -> Union[str, bytes]:
+        if isinstance(message, bytes) and message.startswith(BINARY_FORMAT_MARKER):
+            return message
+        return utils.decode(message)
 
     def _receive(self) -> bytes:
         raise NotImplementedError
 
+    def peek(self, count: int) -> List[Union[str, bytes]]:
+        """
+        Returns up to count messages following the current one, which have
+        already been received, in the same format as receive.
+        The messages are not removed from the queue.
+
+        Empty for pipelines receiving one message at a time.
+        """
+        return []
+
+    def flush(self):
+        """
+        Sends all buffered messages to the destination queues.
+
+        A no-op for pipelines which do not buffer messages.
+        """
+        pass
+
     def acknowledge(self):
         """
         Acknowledge/delete the current message from the source queue
@@ -182,6 +215,11 @@ class Redis(Pipeline):
     destination_pipeline_db = 2
     source_pipeline_password = None
     destination_pipeline_password = None
+    batch_size = 1
+    send_buffer_size = 1
+    send_buffer_timeout = 1
+    _batch_acknowledged = 0
+    _send_buffer: dict = {}
 
     def load_configurations(self, queues_type):
         self.host = self.pipeline_args.get(f"{queues_type}_pipeline_host", "127.0.0.1")
@@ -192,6 +230,19 @@ def load_configurations(self, queues_type):
         self.socket_timeout = self.pipeline_args.get(f"{queues_type}_pipeline_socket_timeout", None)
         self.load_balance = self.pipeline_args.get("load_balance", False)
         self.load_balance_iterator = 0
+        if queues_type == "source":
+            # Number of messages moved to the internal queue with a single round trip
+            self.batch_size = int(self.pipeline_args.get("source_pipeline_batch_size", 1) or 1)
+            self._batch = deque()
+            self._batch_acknowledged = 0
+        else:
+            # Number of messages sent with a single round trip and the maximum
+            # time in seconds they are kept in the buffer
+            self.send_buffer_size = int(self.pipeline_args.get("destination_pipeline_batch_size", 1) or 1)
+            self.send_buffer_timeout = float(self.pipeline_args.get("destination_pipeline_batch_timeout", 1))
+            self._send_buffer = defaultdict(list)
+            self._send_buffer_count = 0
+            self._send_buffer_since = 0.0
 
     def connect(self):
         redis_version = tuple(int(x) for x in redis.__version__.split('.'))
@@ -215,7 +266,22 @@ def connect(self):
         self.pipe = redis.Redis(db=self.db, password=self.password, **kwargs)
 
     def disconnect(self):
-        pass
+        """
+        Sends the buffered messages and removes already acknowledged messages
+        of the current batch from the internal queue, the others are kept for the next start.
+        """
+        if self.pipe and self._send_buffer:
+            try:
+                self.flush()
+            except Exception:
+                self.logger.warning('Could not send %d buffered message(s).', self._send_buffer_count)
+        if self.pipe and self._batch_acknowledged:
+            try:
+                self._flush_acknowledgements()
+            except exceptions.PipelineError:
+                self.logger.warning('Could not remove %d acknowledged message(s) from the internal queue, '
+                                    'they will be processed again.', self._batch_acknowledged)
+        self._batch = deque()
 
     def set_queues(self, queues, queues_type):
         self.load_configurations(queues_type)
@@ -237,21 +303,55 @@ def send(self, message: str, path: str = "_default",
             self.load_balance_iterator += 1
             self.load_balance_iterator %= len(self.destination_queues[path])
 
+        if self.send_buffer_size > 1:
+            if not self._send_buffer_count:
+                self._send_buffer_since = time.monotonic()
+            for destination_queue in queues:
+                self._send_buffer[destination_queue].append(message)
+            self._send_buffer_count += 1
+            if (self._send_buffer_count >= self.send_buffer_size or
+                    time.monotonic() - self._send_buffer_since >= self.send_buffer_timeout):
+                self.flush()
+            return
+
         for destination_queue in queues:
             try:
                 self.pipe.lpush(destination_queue, message)
             except Exception as exc:
-                if 'Cannot assign requested address' in exc.args[0] or \
-                        "OOM command not allowed when used memory > 'maxmemory'." in exc.args[0]:
-                    raise MemoryError(exc.args[0])
-                elif 'Redis is configured to save RDB snapshots, but is currently not able to persist on disk' in exc.args[0]:
-                    raise IOError(28, 'No space left on device or in memory. Redis can\'t save its snapshots. '
-                                      'Look at redis\'s logs.')
-                raise exceptions.PipelineError(exc)
+                self._raise_send_error(exc)
+
+    def flush(self):
+        """
+        Sends all buffered messages with one round trip. Consecutive messages
+        for the same queue are pushed with a single LPUSH, keeping their order.
+        """
+        if not self._send_buffer:
+            return
+        try:
+            with self.pipe.pipeline(transaction=False) as pipe:
+                for destination_queue, messages in self._send_buffer.items():
+                    pipe.lpush(destination_queue, *messages)
+                pipe.execute()
+        except Exception as exc:
+            self._raise_send_error(exc)
+        self._send_buffer.clear()
+        self._send_buffer_count = 0
+
+    @staticmethod
+    def _raise_send_error(exc: Exception):
+        if 'Cannot assign requested address' in exc.args[0] or \
+                "OOM command not allowed when used memory > 'maxmemory'." in exc.args[0]:
+            raise MemoryError(exc.args[0])
+        elif 'Redis is configured to save RDB snapshots, but is currently not able to persist on disk' in exc.args[0]:
+            raise IOError(28, 'No space left on device or in memory. Redis can\'t save its snapshots. '
+                              'Look at redis\'s logs.')
+        raise exceptions.PipelineError(exc)
 
     def _receive(self) -> bytes:
         if self.source_queue is None:
             raise exceptions.ConfigurationError('pipeline', 'No source queue given.')
+        if self.batch_size > 1:
+            return self._receive_batch()
         try:
             while True:
                 try:
@@ -268,7 +368,59 @@ def _receive(self) -> bytes:
         else:
             return retval
 
+    def _receive_batch(self) -> bytes:
+        """
+        Moves up to batch_size messages to the internal queue in one transaction
+        and hands them out one by one.
+
+        The internal queue is read completely in the same transaction, so
+        messages left there by a previous run are processed first.
+        """
+        if self._batch:
+            return self._batch[0]
+        try:
+            while True:
+                try:
+                    with self.pipe.pipeline() as transaction:
+                        for _ in range(self.batch_size):
+                            transaction.rpoplpush(self.source_queue, self.internal_queue)
+                        transaction.lrange(self.internal_queue, 0, -1)
+                        retval = transaction.execute()[-1]
+                except redis.exceptions.BusyLoadingError:  # Just wait at redis' startup #1334
+                    time.sleep(1)
+                else:
+                    break
+            if not retval:
+                retval = [self.pipe.brpoplpush(self.source_queue,
+                                               self.internal_queue, 0)]
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        # The oldest message is the right-most one in the internal queue
+        self._batch.extend(reversed(retval))
+        return self._batch[0]
+
+    def peek(self, count: int) -> List[Union[str, bytes]]:
+        if self.batch_size <= 1:
+            return []
+        return [self._decode_message(message) for message in islice(self._batch, 1, count + 1)]
+
+    def _flush_acknowledgements(self):
+        """
+        Removes all acknowledged messages of the batch from the internal queue.
+        """
+        try:
+            self.pipe.ltrim(self.internal_queue, 0, -self._batch_acknowledged - 1)
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        self._batch_acknowledged = 0
+
     def _acknowledge(self):
+        if self.batch_size > 1:
+            self._batch.popleft()
+            self._batch_acknowledged += 1
+            if not self._batch:
+                self._flush_acknowledgements()
+            return
         try:
             retval = self.pipe.rpop(self.internal_queue)
         except Exception as exc:
@@ -317,6 +469,17 @@ def _reject_message(self):
 # [Receive]     B RPOP LPUSH   source_queue ->  internal_queue
 # [Send]        LPUSH          message      ->  destination_queue
 # [Acknowledge] RPOP           message      <-  internal_queue
+#
+# With batch_size > 1
+# -------------------
+# [Receive]     MULTI, n * RPOP LPUSH, LRANGE  source_queue ->  internal_queue
+#               B RPOP LPUSH                   if nothing has been moved
+# [Acknowledge] LTRIM          n messages   <-  internal_queue, once the batch is processed
+#
+# With send_buffer_size > 1
+# -------------------------
+# [Send]        buffered, n messages are sent with one LPUSH per destination_queue
+#               before the source message is acknowledged
 
 
 class Pythonlist(Pipeline):
@@ -366,7 +529,7 @@ def _receive(self) -> bytes:
         Does not block unlike the other pipelines.
         """
         if len(self.state[self.internal_queue]) > 0:
-            return utils.decode(self.state[self.internal_queue][0])
+            return self.state[self.internal_queue][0]
 
         try:
             first_msg = self.state[self.source_queue].pop(0)
@@ -376,6 +539,9 @@ def _receive(self) -> bytes:
 
         return first_msg
 
+    def peek(self, count: int) -> List[Union[str, bytes]]:
+        return [self._decode_message(message) for message in self.state[self.source_queue][:count]]
+
     def _acknowledge(self):
         """Removes a message from the internal queue and returns it"""
         self.state.get(self.internal_queue, [None]).pop(0)
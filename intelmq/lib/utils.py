@@ -16,7 +16,9 @@
 parse_logline
 """
 import base64
+import bisect
 import collections
+import concurrent.futures
 import grp
 import gzip
 import io
@@ -30,10 +32,11 @@
 import shutil
 import sys
 import tarfile
+import threading
 import traceback
 import warnings
 import zipfile
-from typing import Any, Dict, Generator, Iterator, Optional, Sequence, Union
+from typing import Any, Callable, Dict, Generator, Hashable, Iterable, Iterator, List, Optional, Sequence, Union
 from pathlib import Path
 import importlib
 import inspect
@@ -56,7 +59,8 @@
 __all__ = ['base64_decode', 'base64_encode', 'decode', 'encode',
            'load_configuration', 'load_parameters', 'log', 'parse_logline',
            'reverse_readline', 'error_message_from_exc', 'parse_relative',
-           'RewindableFileHandle',
+           'RewindableFileHandle', 'Histogram', 'LookupPool', 'DatabaseWatcher',
+           'write_file_atomically', 'bots_without_database_reload',
            'file_name_from_response',
            'list_all_bots', 'get_global_settings',
            ]
@@ -637,6 +641,227 @@ def __next__(self):
         return self.current_line
 
 
+class Histogram(object):
+    """
+    Histogram with fixed buckets, e.g. for latencies in seconds.
+
+    The counts are not cumulative: A bucket counts the values greater than the
+    upper bound of the previous bucket and less than or equal to its own upper bound.
+    The dictionary representation uses the upper bounds as keys (formatted with %g,
+    e.g. '0.001' or 'inf') and has the keys 'count' and 'sum' in addition.
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60, 300, 3600, float('inf'))
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def update(self, other: 'Histogram'):
+        """ Adds the counts of another histogram with the same buckets. """
+        if other.buckets != self.buckets:
+            raise ValueError('Histograms with different buckets can not be combined.')
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Returns the upper bound of the bucket holding the given percentile, None if empty.
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict[str, Union[int, float]]:
+        result = {'%g' % bound: count for bound, count in zip(self.buckets, self.counts)}
+        result['count'] = self.count
+        result['sum'] = self.sum
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        """ The inverse of to_dict, accepts bytes and strings as keys and values (e.g. from redis). """
+        data = {decode(key): decode(value) if isinstance(value, bytes) else value
+                for key, value in data.items()}
+        histogram = cls(sorted(float(key) for key in data if key not in ('count', 'sum')))
+        histogram.counts = [int(data['%g' % bound]) for bound in histogram.buckets]
+        histogram.count = int(data.get('count', sum(histogram.counts)))
+        histogram.sum = float(data.get('sum', 0))
+        return histogram
+
+
+class LookupPool(object):
+    """
+    Runs lookups (e.g. DNS queries) concurrently in a thread pool, ahead of time.
+
+    A bot submits the lookups for the current and the upcoming messages and
+    gets the results for the current one. Lookups with the same key share one
+    call of the function. The results are kept until they are not retained anymore.
+    With max_workers 0, the lookups are run synchronously by `result`.
+    """
+
+    def __init__(self, function: Callable, max_workers: int = 10):
+        self.function = function
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers) if max_workers > 0 else None
+        self.futures: Dict[Hashable, concurrent.futures.Future] = {}
+
+    def submit(self, key: Hashable, *args):
+        """ Starts the lookup in the background, if not already started. """
+        if self.executor and key not in self.futures:
+            self.futures[key] = self.executor.submit(self.function, *args)
+
+    def result(self, key: Hashable, *args) -> Any:
+        """
+        Returns the result of the lookup, waiting for it if necessary.
+        Exceptions of the function are raised.
+        """
+        future = self.futures.get(key)
+        if future is None:
+            return self.function(*args)
+        return future.result()
+
+    def retain(self, keys: Iterable[Hashable]):
+        """ Forgets all lookups except for the given keys. """
+        keys = set(keys)
+        self.futures = {key: future for key, future in self.futures.items() if key in keys}
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        self.futures = {}
+
+
+class DatabaseWatcher(object):
+    """
+    Holds a database loaded from files and reloads it in the background when the files change.
+
+    The files are checked every `interval` seconds (modification time, size
+    and inode). A changed database is loaded by a thread while the bot keeps
+    using the old one, then `database` is replaced at once. The old database
+    is freed when it is no longer referenced, so a bot should get `database`
+    once per message. If loading fails, the old database is kept and the load
+    is retried at the next check. With interval 0, the files are not watched.
+
+    The database files should be replaced atomically (written to a temporary
+    file and renamed), otherwise a partially written file may be loaded.
+    """
+
+    def __init__(self, filenames: Sequence[str], load: Callable[[], Any],
+                 interval: float = 60, logger: Optional[logging.Logger] = None):
+        self.filenames = filenames
+        self.load = load
+        self.logger = logger
+        self.__signature = self.__get_signature()
+        self.database = load()
+        self.__stop = threading.Event()
+        self.__thread = None
+        if interval > 0:
+            self.__thread = threading.Thread(target=self.__run, args=(interval, ),
+                                             name='database-watcher', daemon=True)
+            self.__thread.start()
+
+    def __get_signature(self) -> tuple:
+        signature = []
+        for filename in self.filenames:
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        return tuple(signature)
+
+    def check(self) -> bool:
+        """
+        Reloads the database if the files changed.
+
+        Returns:
+            True if the database has been reloaded.
+        """
+        signature = self.__get_signature()
+        if signature == self.__signature:
+            return False
+        try:
+            database = self.load()
+        except Exception:
+            if self.logger:
+                self.logger.exception('Reloading the database from %s failed, keeping the old one.',
+                                      ', '.join(map(repr, self.filenames)))
+            return False
+        self.database = database
+        self.__signature = signature
+        if self.logger:
+            self.logger.info('Reloaded the database from %s.', ', '.join(map(repr, self.filenames)))
+        return True
+
+    def __run(self, interval: float):
+        while not self.__stop.wait(interval):
+            self.check()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread:
+            self.__thread.join(timeout=5)
+            self.__thread = None
+
+
+def write_file_atomically(path: str, data: Union[bytes, str, Callable[[str], None]],
+                          before_replace: Optional[Callable[[str], None]] = None):
+    """
+    Replaces a file atomically, so that a DatabaseWatcher never loads a partially written file.
+
+    The data is written to `path` + '.tmp', which is then renamed to `path`.
+    Missing parent directories are created.
+
+    Parameters:
+        path: The file to write.
+        data: The content, or a function writing the content to the file name given as argument.
+        before_replace: Called with the name of the complete temporary file before it is renamed,
+            e.g. to build files derived from it.
+    """
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    temporary = path + '.tmp'
+    if callable(data):
+        data(temporary)
+    else:
+        with open(temporary, 'wb' if isinstance(data, bytes) else 'w') as handle:
+            handle.write(data)
+    if before_replace:
+        before_replace(temporary)
+    os.replace(temporary, path)
+
+
+def bots_without_database_reload(runtime_conf: dict, bot_ids: Iterable[str], default_interval: float) -> List[str]:
+    """
+    Returns the bots which must be reloaded after their database has been updated.
+
+    The other bots watch the database with a DatabaseWatcher and reload it themselves.
+
+    Parameters:
+        runtime_conf: The bots' settings, as returned by get_bots_settings.
+        bot_ids: The bots using the updated database.
+        default_interval: The bots' default of the parameter `database_reload_interval`.
+    """
+    return [bot_id for bot_id in bot_ids
+            if not runtime_conf[bot_id]["parameters"].get("database_reload_interval", default_interval)]
+
+
 def object_pair_hook_bots(*args, **kwargs) -> Dict:
     """
     A object_pair_hook function for the BOTS file to be used in the json's dump functions.
@@ -752,7 +977,8 @@ def send(self, *args, **kwargs):
         return super().send(*args, **kwargs)
 
 
-def create_request_session(bot: type = None) -> requests.Session:
+def create_request_session(bot: type = None,
+                           pool_maxsize: int = requests.adapters.DEFAULT_POOLSIZE) -> requests.Session:
     """
     Creates a requests.Session object preconfigured with the parameters
     set by the Bot.set_request_parameters and given by the bot instance.
@@ -761,6 +987,7 @@ def create_request_session(bot: type = None) -> requests.Session:
 
     Parameters:
         bot_instance: An instance of a Bot
+        pool_maxsize: Number of connections kept open per host, for concurrent requests
 
     Returns:
         session: A preconfigured instance of requests.Session
@@ -808,7 +1035,7 @@ def create_request_session(bot: type = None) -> requests.Session:
     else:
         timeout = defaults.get('http_timeout_sec', 30)
 
-    adapter = TimeoutHTTPAdapter(max_retries=max_retries, timeout=timeout)
+    adapter = TimeoutHTTPAdapter(max_retries=max_retries, timeout=timeout, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
 
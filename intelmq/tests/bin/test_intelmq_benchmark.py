@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2021 Sebastian Wagner
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# -*- coding: utf-8 -*-
+import unittest
+
+import intelmq.bin.intelmq_benchmark as intelmq_benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    A TestCase for the benchmark with the in-memory pipeline.
+    """
+
+    def test_percentile(self):
+        self.assertEqual(intelmq_benchmark.percentile([], 50), 0.0)
+        self.assertEqual(intelmq_benchmark.percentile([1, 2, 3], 50), 2)
+        self.assertEqual(intelmq_benchmark.percentile(list(range(101)), 99), 99)
+
+    def test_parse_parameter(self):
+        self.assertEqual(intelmq_benchmark.parse_parameter('overwrite=true'), ('overwrite', True))
+        self.assertEqual(intelmq_benchmark.parse_parameter('field=source.ip'), ('field', 'source.ip'))
+
+    def test_chain(self):
+        benchmark = intelmq_benchmark.Benchmark(['intelmq.bots.experts.taxonomy.expert',
+                                                 'intelmq.bots.experts.url2fqdn.expert'],
+                                                runtime_file='/nonexistent', trace_memory=True)
+        result = benchmark.run(intelmq_benchmark.synthetic_messages(20))
+        self.assertEqual(result['messages'], 20)
+        self.assertEqual(result['total']['messages_out'], 20)
+        self.assertEqual([bot['bot_id'] for bot in result['bots']],
+                         ['taxonomy-expert-0', 'url2fqdn-expert-1'])
+        for bot in result['bots']:
+            self.assertEqual(bot['messages_in'], 20)
+            self.assertEqual(bot['failures'], 0)
+            self.assertLessEqual(bot['latency_p50'], bot['latency_p99'])
+            self.assertIsInstance(bot['memory_peak'], int)
+        self.assertGreater(result['peak_rss'], 0)
+        self.assertIn('taxonomy-expert-0', intelmq_benchmark.format_text(result))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -10,7 +10,8 @@
 import json
 import unittest
 import os
-from unittest import TestCase
+import tempfile
+from unittest import TestCase, mock
 from intelmq.lib.exceptions import MissingDependencyError
 
 try:
@@ -19,7 +20,7 @@
     time_machine = None
 
 import intelmq.lib.test as test
-from intelmq.bots.experts.aggregate.expert import AggregateExpertBot
+from intelmq.bots.experts.aggregate.expert import AggregateExpertBot, INDEX_KEY, MIGRATED_KEY
 
 EXAMPLE_OUTPUT = {'__type': 'Event',
                     'classification.identifier': 'ddos',
@@ -65,5 +66,102 @@ def test_cache(self):
         self.assertMessageEqual(0, EXAMPLE_OUTPUT)
 
 
+class TestAggregateExpertBotIndex(test.BotTestCase, TestCase):
+    """
+    Tests the index of open aggregates.
+    """
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = AggregateExpertBot
+        cls.use_cache = True
+        cls.sysconfig = {'threshold': 2}
+
+    def setUp(self):
+        super().setUp()
+        self.cache.flushdb()
+
+    def test_cleanup_index(self):
+        self.input_message = {'__type': 'Event', 'classification.type': 'scanner',
+                              'time.observation': '2015-01-01T00:00:00+00:00'}
+        self.prepare_bot()
+        data = dict(EXAMPLE_OUTPUT)
+        del data['extra.count'], data['extra.time_end']
+        start = (datetime.now() - timedelta(hours=2)).isoformat()
+        for key in ('aggregate.expired', 'aggregate.dropped', 'aggregate.open'):
+            self.cache.hset(key, mapping={'d': json.dumps(data), 's': start, 'f': start,
+                                          'l': '2015-01-01T00:59:00+00:00',
+                                          'c': 1 if key == 'aggregate.dropped' else 25})
+        # a legacy aggregate without index entry and two indexed ones
+        self.cache.zadd(INDEX_KEY, {'aggregate.dropped': 0,
+                                    'aggregate.open': datetime.now().timestamp() + 60})
+        # the index has been migrated on initialization already
+        self.assertTrue(self.cache.exists(MIGRATED_KEY))
+        self.bot.index_legacy_aggregates()
+        self.assertIsNone(self.cache.zscore(INDEX_KEY, 'aggregate.expired'))
+        self.cache.delete(MIGRATED_KEY)
+        self.bot.index_legacy_aggregates()
+        self.assertIsNotNone(self.cache.zscore(INDEX_KEY, 'aggregate.expired'))
+        self.bot._AggregateExpertBot__next_cleanup = 0
+        # the sent aggregates are flushed before they are deleted
+        flush_destination = self.bot._flush_destination
+        existing = []
+
+        def flush():
+            existing.append(self.cache.exists('aggregate.expired'))
+            flush_destination()
+
+        self.bot._flush_destination = flush
+        self.run_bot(prepare=False)
+        self.assertEqual(existing[0], 1)
+
+        self.assertOutputQueueLen(1)
+        output = json.loads(self.get_output_queue()[0])
+        self.assertEqual(output['extra.count'], 25)
+        self.assertEqual(output['time.source'][:19], start[:19])
+        self.assertEqual(self.cache.zcard(INDEX_KEY), 2)
+        self.assertIsNotNone(self.cache.zscore(INDEX_KEY, 'aggregate.open'))
+        self.assertFalse(self.cache.exists('aggregate.expired', 'aggregate.dropped'))
+
+    def test_memory_backend(self):
+        scanner = {'__type': 'Event', 'classification.type': 'scanner',
+                   'time.observation': '2015-01-01T00:00:00+00:00'}
+        ddos = dict(scanner, **{'classification.type': 'ddos'})
+        with tempfile.TemporaryDirectory() as directory:
+            parameters = {'backend': 'memory', 'memory_max_windows': 1,
+                          'memory_checkpoint_file': os.path.join(directory, 'aggregate.json')}
+            self.input_message = [scanner, ddos, scanner]
+            self.prepare_bot(parameters=parameters)
+            # Redis is only checked for open aggregates after the limit of windows was reached
+            cache_exists = mock.Mock(wraps=self.bot.cache_exists)
+            self.bot.cache_exists = cache_exists
+            self.run_bot(iterations=3, prepare=False)
+            self.assertEqual(cache_exists.call_count, 1)
+            # the second window exceeds the limit and is stored in Redis
+            self.assertOutputQueueLen(0)
+            self.assertEqual(self.cache.zcard(INDEX_KEY), 1)
+            with open(parameters['memory_checkpoint_file']) as handle:
+                self.assertEqual([window['c'] for window in json.load(handle).values()], [2])
+
+            self.input_message = ddos
+            self.prepare_bot(parameters=parameters)
+            windows = self.bot._AggregateExpertBot__windows
+            self.assertEqual(len(windows), 1)
+            for window in windows.values():
+                window['e'] = 0
+            self.bot._AggregateExpertBot__next_cleanup = 0
+            self.bot._AggregateExpertBot__next_checkpoint = float('inf')
+            self.run_bot(prepare=False, stop_bot=False)
+            # the checkpoint is saved right after sending the aggregate
+            with open(parameters['memory_checkpoint_file']) as handle:
+                self.assertEqual(json.load(handle), {})
+
+        self.assertOutputQueueLen(1)
+        output = json.loads(self.get_output_queue()[0])
+        self.assertEqual((output['classification.type'], output['extra.count']), ('scanner', 2))
+        ddos_key = self.cache.zrange(INDEX_KEY, 0, -1)[0]
+        self.assertEqual(self.cache.hget(ddos_key, 'c'), b'2')
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -7,6 +7,8 @@
 Testing asn_lookup with a faked local database
 """
 
+import shutil
+import tempfile
 import unittest
 
 import pkg_resources
@@ -62,5 +64,34 @@ def test_ipv6_lookup(self):
         self.assertMessageEqual(0, EXAMPLE_OUTPUT6)
 
 
+class TestASNLookupExpertBotTree(test.BotTestCase, unittest.TestCase):
+    """
+    A TestCase for the lookups in an IP tree built from the database, does not need pyasn.
+    """
+
+    @classmethod
+    def set_bot(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        database = shutil.copy(ASN_DB, cls.directory.name)
+        ASNLookupExpertBot.build_tree(database)
+        cls.bot_reference = ASNLookupExpertBot
+        cls.sysconfig = {'database': database}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.directory.cleanup()
+
+    def test_ipv4_lookup(self):
+        self.input_message = EXAMPLE_INPUT
+        self.run_bot()
+        self.assertMessageEqual(0, EXAMPLE_OUTPUT)
+
+    def test_ipv6_lookup(self):
+        self.input_message = EXAMPLE_INPUT6
+        self.run_bot()
+        self.assertMessageEqual(0, EXAMPLE_OUTPUT6)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
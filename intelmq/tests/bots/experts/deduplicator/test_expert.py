@@ -4,10 +4,17 @@
 
 # -*- coding: utf-8 -*-
 
+import hashlib
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 
+import intelmq.lib.exceptions as exceptions
 import intelmq.lib.message as message
 import intelmq.lib.test as test
+from intelmq.bots.experts.deduplicator._lib import TimedBloomFilter
 from intelmq.bots.experts.deduplicator.expert import DeduplicatorExpertBot
 
 INPUT1 = {"__type": "Event",
@@ -89,6 +96,99 @@ def test_bypass(self):
         self.run_bot()
         self.assertMessageEqual(0, msg)
 
+    def test_bloom_filter_incomplete(self):
+        """ Test if a new bloom filter consults redis and is saved on shutdown. """
+        msg_hash = message.MessageFactory.from_dict(INPUT1.copy(), harmonization=self.harmonization).hash()
+        input2_hash = message.MessageFactory.from_dict(INPUT2.copy(), harmonization=self.harmonization).hash()
+        self.cache.set(msg_hash, 'hash')
+        self.cache.expire(msg_hash, 3600)
+        self.cache.delete(input2_hash)
+        self.addCleanup(self.cache.delete, input2_hash)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.bloom')
+            self.input_message = [INPUT1, INPUT2]
+            self.run_bot(iterations=2, parameters={'bloom_filter_capacity': 1000,
+                                                   'bloom_filter_file': filename})
+            self.assertOutputQueueLen(1)
+            self.assertMessageEqual(0, INPUT2)
+            bloom = TimedBloomFilter.load(filename, 1000, 0.001, 86400)
+        self.assertIn(input2_hash, bloom)
+
+    def test_bloom_filter_complete(self):
+        """ Test if a complete bloom filter answers for new messages without redis. """
+        msg_hash = message.MessageFactory.from_dict(INPUT1.copy(), harmonization=self.harmonization).hash()
+        input2_hash = message.MessageFactory.from_dict(INPUT2.copy(), harmonization=self.harmonization).hash()
+        self.cache.set(msg_hash, 'hash')
+        self.cache.expire(msg_hash, 3600)
+        self.cache.set(input2_hash, 'hash')
+        self.cache.expire(input2_hash, 3600)
+        self.addCleanup(self.cache.delete, input2_hash)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.bloom')
+            bloom = TimedBloomFilter(1000, 0.001, 86400)
+            bloom.add(msg_hash)
+            # the filter is complete one TTL after saving it
+            with mock.patch('time.time', return_value=time.time() - 86400):
+                bloom.save(filename)
+            self.input_message = [INPUT1, INPUT2]
+            # the hash of INPUT2 is in redis, but not in the filter
+            self.run_bot(iterations=2, parameters={'bloom_filter_capacity': 1000,
+                                                   'bloom_filter_file': filename})
+        self.assertOutputQueueLen(1)
+        self.assertMessageEqual(0, INPUT2)
+
+    def test_bloom_filter_loaded_incomplete(self):
+        """ Test if a loaded bloom filter consults Redis for hashes seen after saving it. """
+        msg_hash = message.MessageFactory.from_dict(INPUT1.copy(), harmonization=self.harmonization).hash()
+        self.cache.set(msg_hash, 'hash')
+        self.cache.expire(msg_hash, 3600)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.bloom')
+            bloom = TimedBloomFilter(1000, 0.001, 86400)
+            bloom.since -= 86400
+            bloom.save(filename)
+            self.input_message = INPUT1
+            self.run_bot(parameters={'bloom_filter_capacity': 1000,
+                                     'bloom_filter_file': filename}, stop_bot=False)
+            # it is saved again on shutdown only
+            self.assertFalse(os.path.exists(filename))
+        self.assertOutputQueueLen(0)
+
+    def test_bloom_filter_instances(self):
+        """ Test if the bloom filter is refused for multiple instances. """
+        with self.assertRaises(exceptions.ConfigurationError):
+            self.run_bot(parameters={'bloom_filter_capacity': 1000,
+                                     'instances_threads': 2})
+
+
+class TestTimedBloomFilter(unittest.TestCase):
+    """
+    A TestCase for the bloom filter of the DeduplicatorExpertBot.
+    """
+
+    def test_contains(self):
+        bloom = TimedBloomFilter(1000, 0.001, 3600)
+        hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(1000)]
+        # the capacity is distributed over the time periods
+        for value in hashes[:250]:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in hashes[:250]))
+        self.assertLess(sum(value in bloom for value in hashes[250:]), 5)
+        self.assertFalse(bloom.is_complete())
+
+    def test_rotation(self):
+        with mock.patch('time.time', return_value=1000):
+            bloom = TimedBloomFilter(1000, 0.001, 400)
+            bloom.add('a' * 64)
+        with mock.patch('time.time', return_value=1399):
+            self.assertIn('a' * 64, bloom)
+            self.assertFalse(bloom.is_complete())
+            self.assertEqual([start for start, _ in bloom.filters], [1000, 1300])
+        with mock.patch('time.time', return_value=1400):
+            self.assertTrue(bloom.is_complete())
+        with mock.patch('time.time', return_value=1500):
+            self.assertNotIn('a' * 64, bloom)
+            self.assertEqual([start for start, _ in bloom.filters], [1300, 1500])
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -4,10 +4,16 @@
 
 # -*- coding: utf-8 -*-
 import os.path
+import shutil
+import tempfile
 import unittest
 
 import intelmq.lib.test as test
+from intelmq.lib.utils import write_file_atomically
 from intelmq.bots.experts.domain_suffix.expert import DomainSuffixExpertBot
+from intelmq.bots.experts.domain_suffix._lib import PublicSuffixList, SuffixLookup
+
+SUFFIX_FILE = os.path.join(os.path.dirname(__file__), 'public_suffix_list.dat')
 
 
 EXAMPLE_INPUT1 = {"__type": "Event",
@@ -68,7 +74,7 @@ class TestDomainSuffixExpertBot(test.BotTestCase, unittest.TestCase):
     @classmethod
     def set_bot(cls):
         cls.bot_reference = DomainSuffixExpertBot
-        cls.sysconfig = {'suffix_file': os.path.join(os.path.dirname(__file__), 'public_suffix_list.dat'),
+        cls.sysconfig = {'suffix_file': SUFFIX_FILE,
                          'field': 'fqdn',
                          }
 
@@ -92,6 +98,44 @@ def test_wildcard(self):
         self.run_bot()
         self.assertMessageEqual(0, WILDCARD_OUTPUT)
 
+    def test_reload(self):
+        """ The bot uses the updated suffix file without restart. """
+        with tempfile.TemporaryDirectory() as directory:
+            suffix_file = os.path.join(directory, 'public_suffix_list.dat')
+            shutil.copy(SUFFIX_FILE, suffix_file)
+            self.input_message = EXAMPLE_INPUT1
+            self.prepare_bot(parameters={'suffix_file': suffix_file})
+            write_file_atomically(suffix_file, '// ===BEGIN ICANN DOMAINS===\ncom\nnet\n// ===END ICANN DOMAINS===\n')
+            self.assertTrue(self.bot._watcher.check())
+            self.run_bot(prepare=False)
+        self.assertMessageEqual(0, dict(EXAMPLE_OUTPUT1, **{'source.domain_suffix': 'com',
+                                                            'destination.domain_suffix': 'net'}))
+
+
+class TestSuffixLookup(unittest.TestCase):
+    """
+    Tests the fallback public suffix list and the memoized lookups.
+    """
+
+    def setUp(self):
+        with open(SUFFIX_FILE, encoding='UTF-8') as handle:
+            self.lookup = SuffixLookup(PublicSuffixList(source=handle), cache_size=3)
+
+    def test_publicsuffix(self):
+        self.assertEqual(self.lookup.psl.publicsuffix('www.example.net'), 'example.net')
+        self.assertEqual(self.lookup.psl.publicsuffix('a.www.example.net'), 'example.net')
+        self.assertEqual(self.lookup.psl.publicsuffix('Sub.Example.COM'), 'example.com')
+        self.assertEqual(self.lookup.psl.publicsuffix('xn--fiqs8s'), 'xn--fiqs8s')
+        self.assertIsNone(self.lookup.psl.publicsuffix('example.invalid'))
+        self.assertIsNone(self.lookup.psl.publicsuffix(''))
+
+    def test_batch(self):
+        domains = ['sub.example.com', None, 'www.example.org', 'sub.example.com', 'example.mm']
+        self.assertEqual(list(self.lookup.publicsuffixes(domains)),
+                         ['example.com', None, 'org', 'example.com', 'example.mm'])
+        info = self.lookup.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 4, 3))
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -7,7 +7,9 @@
 Testing GethostbynameExpertBot.
 """
 
+import socket
 import unittest
+import unittest.mock as mock
 
 import intelmq.lib.test as test
 from intelmq.bots.experts.gethostbyname.expert import GethostbynameExpertBot
@@ -102,5 +104,37 @@ def test_gaierrors_int(self):
         # We only need to check for no errors
 
 
+class TestGethostbynameExpertBotConcurrent(test.BotTestCase, unittest.TestCase):
+    """
+    Concurrent lookups with a mocked resolver.
+    """
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = GethostbynameExpertBot
+        cls.sysconfig = {'concurrent_lookups': 2}
+
+    def test_concurrent(self):
+        addresses = {'example.com': '192.0.2.1', 'example.org': '192.0.2.2', 'example.net': '192.0.2.3'}
+
+        def gethostbyname(fqdn):
+            if fqdn not in addresses:
+                raise socket.gaierror(-2, 'Name or service not known')
+            return addresses[fqdn]
+
+        resolver = mock.Mock(side_effect=gethostbyname)
+        self.input_message = [EXAMPLE_INPUT, NONEXISTING_INPUT, EXAMPLE_URL_INPUT,
+                              {'__type': 'Event', 'source.fqdn': 'example.net'}]
+        with mock.patch('socket.gethostbyname', resolver):
+            self.run_bot(iterations=4)
+        self.assertMessageEqual(0, dict(EXAMPLE_OUTPUT, **{'source.ip': '192.0.2.1', 'destination.ip': '192.0.2.2'}))
+        self.assertMessageEqual(1, NONEXISTING_INPUT)
+        self.assertMessageEqual(2, dict(EXAMPLE_URL_OUTPUT, **{'source.ip': '192.0.2.1'}))
+        self.assertMessageEqual(3, {'__type': 'Event', 'source.fqdn': 'example.net', 'source.ip': '192.0.2.3'})
+        # every name is queried only once
+        self.assertEqual(sorted(call.args[0] for call in resolver.call_args_list),
+                         ['example.com', 'example.invalid', 'example.net', 'example.org'])
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -144,6 +144,19 @@ def test_maximum_matches(self):
         del out['classification.identifier']
         self.assertMessageEqual(0, out)
 
+    def test_index(self):
+        """ Only rules testing fields of the event are evaluated, rules with the same conditions are merged. """
+        config_path = resource_filename('intelmq',
+                                        'tests/bots/experts/modify/index.conf')
+        self.input_message = EVENT_TEMPL
+        self.prepare_bot(parameters={'configuration_path': config_path})
+        self.assertEqual(self.bot.candidates(self.bot.new_event(EVENT_TEMPL.copy())), [0, 4])
+        self.assertEqual(self.bot.candidates(self.bot.new_event({'feed.name': 'Other Feed'})), [1, 4])
+        self.assertEqual(self.bot.candidates(self.bot.new_event({'malware.name': 'x', 'protocol.application': 'http'})), [2, 4])
+        self.run_bot(prepare=False)
+        self.assertMessageEqual(0, {**EVENT_TEMPL, 'comment': 'spamhaus', 'classification.identifier': 'Spamhaus Cert',
+                                    'extra.identifier': True, 'extra.no_protocol': True})
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
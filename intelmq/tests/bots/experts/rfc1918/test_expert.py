@@ -52,6 +52,20 @@
                           "destination.fqdn": "fooexample.com",
                               "time.observation": "2015-01-01T00:00:00+00:00",
                 }
+INPUT_IPV6 = {"__type": "Event",
+              "source.ip": "2001:db8::1",
+              "destination.ip": "2001:db9::1",
+              "time.observation": "2015-01-01T00:00:00+00:00",
+              }
+OUTPUT_IPV6 = {"__type": "Event",
+               "destination.ip": "2001:db9::1",
+               "time.observation": "2015-01-01T00:00:00+00:00",
+               }
+INPUT_EXTRA = {"__type": "Event",
+               "source.ip": "93.184.216.34",
+               "destination.ip": "198.51.99.1",
+               "time.observation": "2015-01-01T00:00:00+00:00",
+               }
 
 
 class TestRFC1918ExpertBot(test.BotTestCase, unittest.TestCase):
@@ -112,6 +126,41 @@ def test_different_domain(self):
         self.run_bot()
         self.assertMessageEqual(0, INPUT_DIFFERENT_DOMAIN)
 
+    def test_ipv6(self):
+        self.input_message = INPUT_IPV6
+        self.run_bot(parameters={"fields": "destination.ip,source.ip",
+                                 "policy": "del,del"})
+        self.assertMessageEqual(0, OUTPUT_IPV6)
+
+    def test_extra_networks(self):
+        """ Operator-supplied networks are checked as well, as list or comma-separated string """
+        self.input_message = INPUT_EXTRA
+        self.run_bot()
+        self.assertMessageEqual(0, INPUT_EXTRA)
+        for extra_networks in ("10.0.0.0/8, 93.184.216.0/24", ["10.0.0.0/8", "93.184.216.0/24"]):
+            self.input_message = INPUT_EXTRA
+            self.run_bot(parameters={"extra_networks": extra_networks})
+            self.assertOutputQueueLen(0)
+        self.input_message = INPUT_EXTRA
+        self.run_bot(parameters={"extra_networks": "198.51.99.0/24",
+                                 "fields": "destination.ip,source.ip",
+                                 "policy": "del,drop"})
+        self.assertMessageEqual(0, OUTPUT1)
+
+    def test_subdomain(self):
+        self.run_bot()
+        self.assertTrue(self.bot.is_subdomain("sub.test"))
+        self.assertTrue(self.bot.is_subdomain("a.b.example.org"))
+        self.assertFalse(self.bot.is_subdomain("test"))
+        self.assertFalse(self.bot.is_subdomain("example.com"))
+        self.assertFalse(self.bot.is_subdomain("example.com.test.org"))
+
+    def test_check(self):
+        self.assertIsNone(RFC1918ExpertBot.check({"fields": "source.ip", "policy": "drop",
+                                                  "extra_networks": "10.0.0.0/8"}))
+        self.assertEqual(RFC1918ExpertBot.check({"fields": "source.ip", "policy": "drop",
+                                                 "extra_networks": "10.0.0.0/33"})[0][0], "error")
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -263,5 +263,47 @@ def test_index_error(self):
         self.run_bot()
         self.assertMessageEqual(0, INDEX_ERROR)
 
+@test.skip_redis()
+class TestRIPEExpertBotConcurrent(test.BotTestCase, unittest.TestCase):
+    """
+    Concurrent lookups with a mocked API.
+    """
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = RIPEExpertBot
+        cls.sysconfig = {'concurrent_lookups': 2,
+                         'query_ripe_db_asn': True,
+                         'query_ripe_db_ip': True,
+                         'query_ripe_stat_ip': False,
+                         'query_ripe_stat_asn': False,
+                         'redis_cache_db': 4,
+                         'query_ripe_stat_geolocation': False,
+                         }
+        cls.use_cache = True
+
+    @requests_mock.Mocker()
+    def test_concurrent(self, mocker):
+        self.cache.flushdb()
+        for resource, contact in (('as35492', 'abuse@example.net'), ('192.0.2.1', 'abuse@example.com'),
+                                  ('192.0.2.2', 'abuse@example.org')):
+            mocker.get('https://rest.db.ripe.net/abuse-contact/%s.json' % resource,
+                       json={'abuse-contacts': {'email': contact}})
+        self.input_message = [{'__type': 'Event', 'source.ip': '192.0.2.1', 'destination.asn': 35492},
+                              {'__type': 'Event', 'source.ip': '192.0.2.2', 'destination.ip': '192.0.2.1'},
+                              {'__type': 'Event', 'source.asn': 35492}]
+        self.run_bot(iterations=3)
+        self.assertMessageEqual(0, {'__type': 'Event', 'source.ip': '192.0.2.1', 'destination.asn': 35492,
+                                    'source.abuse_contact': 'abuse@example.com',
+                                    'destination.abuse_contact': 'abuse@example.net'})
+        self.assertMessageEqual(1, {'__type': 'Event', 'source.ip': '192.0.2.2', 'destination.ip': '192.0.2.1',
+                                    'source.abuse_contact': 'abuse@example.org',
+                                    'destination.abuse_contact': 'abuse@example.com'})
+        self.assertMessageEqual(2, {'__type': 'Event', 'source.asn': 35492,
+                                    'source.abuse_contact': 'abuse@example.net'})
+        # every resource is queried only once
+        self.assertEqual(mocker.call_count, 3)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -6,6 +6,7 @@
 from __future__ import unicode_literals
 
 import unittest
+from unittest import mock
 import os
 import intelmq.lib.test as test
 from intelmq.bots.experts.sieve.expert import SieveExpertBot
@@ -547,6 +548,48 @@ def test_numeric_invalid_key(self):
         exception = context.exception
         self.assertRegex(str(exception), r'.*Incompatible type: FQDN\.$')
 
+    def test_string_invalid_regex(self):
+        """ Tests that regular expressions are compiled on initialization. """
+        self.sysconfig['file'] = os.path.join(os.path.dirname(__file__),
+                                              'test_sieve_files/test_string_invalid_regex.sieve')
+
+        self.input_message = EXAMPLE_INPUT.copy()
+        with self.assertRaises(ValueError) as context:
+            self.run_bot()
+        self.assertRegex(str(context.exception), r"^Invalid regular expression '\(example' in \(1, 19\)")
+
+        with mock.patch('intelmq.lib.utils.load_configuration', new=self.mocked_config):
+            checks = SieveExpertBot.check({'file': self.sysconfig['file']})
+            self.assertEqual(len(checks), 1)
+            self.assertEqual(checks[0][0], 'error')
+            self.assertRegex(checks[0][1], r"Invalid regular expression .*\(example.* in \(1, 19\)")
+            self.assertIsNone(SieveExpertBot.check({'file': os.path.join(os.path.dirname(__file__),
+                                                                         'test_sieve_files/test_equality_dispatch.sieve')}))
+
+    def test_equality_dispatch(self):
+        """ Test if statements selected by the value of a key. """
+        self.sysconfig['file'] = os.path.join(os.path.dirname(__file__),
+                                              'test_sieve_files/test_equality_dispatch.sieve')
+
+        self.input_message = {**EXAMPLE_INPUT, 'feed.name': 'a', 'source.port': 80}
+        self.prepare_bot()
+        # the fourth statement changes the key of the group
+        self.assertEqual([len(group) for group in self.bot.group_statements(self.bot.sieve.statements)],
+                         [3, 1, 1, 1])
+        self.run_bot(prepare=False)
+        self.assertMessageEqual(0, {**EXAMPLE_INPUT, 'feed.name': 'a', 'source.port': 80,
+                                    'comment': 'a', 'extra.a': True})
+
+        self.input_message = {**EXAMPLE_INPUT, 'feed.name': 'c', 'source.port': 443}
+        self.run_bot()
+        self.assertMessageEqual(0, {**EXAMPLE_INPUT, 'feed.name': 'b', 'source.port': 443,
+                                    'comment': 'b', 'extra.https': True})
+
+        self.input_message = {**EXAMPLE_INPUT, 'feed.name': 'b'}
+        self.run_bot()
+        self.assertMessageEqual(0, {**EXAMPLE_INPUT, 'feed.name': 'b', 'comment': 'b',
+                                    'extra.b': True, 'extra.other_port': True})
+
     def test_exists_match(self):
         """ Test :exists match """
         self.sysconfig['file'] = os.path.join(os.path.dirname(__file__), 'test_sieve_files/test_exists_match.sieve')
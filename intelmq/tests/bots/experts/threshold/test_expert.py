@@ -5,6 +5,7 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import unittest.mock as mock
 import time
 
 import intelmq.lib.test as test
@@ -108,6 +109,45 @@ def test_add_field(self):
         self.assertMessageEqual(0, {**EVENTS_OUT[PARAMETERS['threshold'] - 1],
                                     **{'comment': 'Threshold reached'}})
 
+    def test_memory_backend(self):
+        """
+        Thirty identical messages, counted in memory.
+        """
+        self.input_message = EVENTS_IN
+        self.run_bot(parameters={'backend': 'memory'},
+                     iterations=len(self.input_message))
+        self.assertOutputQueueLen(1)
+        self.assertMessageEqual(0, EVENTS_OUT[PARAMETERS['threshold'] - 1])
+
+    def test_windows(self):
+        """
+        Messages every 6 seconds with a timeout of 10 seconds.
+        """
+        for window, backend, expected in (('reset', 'redis', [1, 2, 3, 4]),
+                                          ('reset', 'memory', [1, 2, 3, 4]),
+                                          ('sliding', 'redis', [1, 2, 2, 2]),
+                                          ('sliding', 'memory', [1, 2, 2, 2])):
+            with self.subTest(window=window, backend=backend):
+                self.cache.flushdb()
+                self.prepare_bot(parameters={'window': window, 'backend': backend, 'timeout': 10})
+                counts = []
+                for now in (1000, 1006, 1012, 1018):
+                    with mock.patch('time.time', return_value=now):
+                        counts.append(self.bot.count('hash'))
+                self.assertEqual(counts, expected)
+                self.run_bot(prepare=False)
+
+    def test_sliding_window(self):
+        """
+        Thirty identical messages in a sliding window.
+        """
+        self.cache.flushdb()
+        self.input_message = EVENTS_IN
+        self.run_bot(parameters={'window': 'sliding', 'timeout': 60},
+                     iterations=len(self.input_message))
+        self.assertOutputQueueLen(1)
+        self.assertMessageEqual(0, EVENTS_OUT[PARAMETERS['threshold'] - 1])
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -7,12 +7,16 @@
 Testing tor node lookup
 """
 
+import shutil
+import tempfile
 import unittest
 
 import pkg_resources
 
 import intelmq.lib.test as test
 from intelmq.bots.experts.tor_nodes.expert import TorExpertBot
+from intelmq.lib.iptree import IPTree, TREE_SUFFIX
+from intelmq.lib.utils import write_file_atomically
 
 TOR_DB = pkg_resources.resource_filename('intelmq', 'tests/bots/experts/tor_nodes/tor_nodes.dat')
 EXAMPLE_INPUT = {"__type": "Event",
@@ -70,5 +74,47 @@ def test_existing_overwrite(self):
         self.sysconfig['overwrite'] = False
         self.assertMessageEqual(0, EXAMPLE_OUTPUT)
 
+
+class TestTorExpertBotTree(TestTorExpertBot):
+    """
+    Runs the same tests with an IP tree built from the database.
+    """
+
+    @classmethod
+    def set_bot(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        database = shutil.copy(TOR_DB, cls.directory.name)
+        TorExpertBot.build_tree(database)
+        cls.bot_reference = TorExpertBot
+        cls.sysconfig = {'database': database}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.directory.cleanup()
+
+    def test_tree(self):
+        self.input_message = EXAMPLE_INPUT
+        self.prepare_bot()
+        self.assertIsInstance(self.bot._watcher.database, IPTree)
+        self.run_bot(prepare=False)
+        self.assertMessageEqual(0, EXAMPLE_OUTPUT)
+
+    def test_reload(self):
+        """ The bot reloads the database after an update, without restart. """
+        database = self.sysconfig['database']
+        self.input_message = EXAMPLE_EMPTY
+        self.prepare_bot()
+        write_file_atomically(database, '10.0.0.1\n',
+                              lambda temporary: TorExpertBot.build_tree(temporary, database + TREE_SUFFIX))
+        try:
+            self.assertTrue(self.bot._watcher.check())
+            self.run_bot(prepare=False)
+            self.assertMessageEqual(0, dict(EXAMPLE_EMPTY, **{'source.tor_node': True}))
+        finally:
+            shutil.copy(TOR_DB, database)
+            TorExpertBot.build_tree(database)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -7,12 +7,23 @@
 Tests the Bot class itself.
 """
 
+import json
+import os
+import pstats
+import signal
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 import intelmq.lib.test as test
 from intelmq.tests.lib import test_parser_bot
 
 
+class DummySingleThreadParserBot(test_parser_bot.DummyParserBot):
+    _is_multithreadable = False
+
+
 class TestDummyParserBot(test.BotTestCase, unittest.TestCase):
     """ Testing generic functionalities of Bot base class. """
 
@@ -72,12 +83,151 @@ def test_invalid_value_on_input_message(self):
         https://github.com/certtools/intelmq/issues/1765
         """
         self.input_message = b'{"source.asn": 0, "__type": "Event"}'
-        self.run_bot(iterations=1, allowed_error_count=1)
+        self.run_bot(iterations=1, allowed_error_count=1,
+                     parameters={'strict_input_validation': True})
         self.assertLogMatches(r'.*intelmq\.lib\.exceptions\.InvalidValue:.*')
         self.assertEqual(self.pipe.state['test-bot-input-internal'], [])
         self.assertEqual(self.pipe.state['test-bot-input'], [])
         self.assertEqual(self.pipe.state['test-bot-output'], [])
 
+    def test_profiling(self):
+        """
+        Test if the bot profiles process() when requested and writes the profile on stop.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        with tempfile.TemporaryDirectory() as logging_path:
+            self.prepare_bot(parameters={'logging_path': logging_path})
+            self.bot._Bot__stats_cache = mock.Mock()
+            self.bot._Bot__stats_cache.get.return_value = repr(time.time() + 60)
+            self.run_bot(prepare=False)
+            self.bot._Bot__stats_cache.get.assert_called_once_with('test-bot.profile')
+            self.assertLogMatches('Profiling process\\(\\) for [0-9]+ seconds.', levelname='INFO')
+            self.assertLogMatches('Profiling finished, wrote profile to .*', levelname='INFO')
+            filenames = os.listdir(logging_path)
+            self.assertEqual(len(filenames), 1)
+            self.assertRegex(filenames[0], r'^test-bot\.[0-9T]+\.prof$')
+            stats = pstats.Stats(os.path.join(logging_path, filenames[0]))
+            self.assertIn('process', {function for _, _, function in stats.stats})
+
+
+    def test_latency(self):
+        """
+        Test if the bot records the latencies and sends the time of sending.
+        """
+        self.input_message = dict(test_parser_bot.EXAMPLE_SHORT, __sent=time.time() - 2)
+        self.run_bot(parameters={'destination_pipeline_timestamp': True})
+        counter = self.bot._Bot__message_counter
+        self.assertEqual(counter['latency_process'].count, 1)
+        self.assertEqual(counter['latency_queue'].count, 1)
+        self.assertGreaterEqual(counter['latency_queue'].sum, 2)
+        for event in self.get_output_queue():
+            self.assertLessEqual(json.loads(event)['__sent'], time.time())
+
+    def test_latency_process_excludes_waiting(self):
+        """
+        Test that waiting for a message is not recorded as processing time.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.prepare_bot()
+        receive = self.pipe.receive
+
+        def delayed_receive():
+            time.sleep(0.5)
+            return receive()
+
+        self.pipe.receive = delayed_receive
+        self.run_bot(prepare=False)
+        histogram = self.bot._Bot__message_counter['latency_process']
+        self.assertEqual(histogram.count, 1)
+        self.assertLess(histogram.sum, 0.5)
+
+    def test_worker_process(self):
+        """
+        Test the bot id and the internal queue of a worker process.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.run_bot()
+        self.assertNotIn('source_pipeline_internal_queue', self.bot._pipeline_configuration())
+        with mock.patch.object(test_parser_bot.DummyParserBot, 'is_multiprocessed', True), \
+                mock.patch('intelmq.lib.utils.load_configuration', new=self.mocked_config), \
+                mock.patch('intelmq.lib.utils.get_global_settings', test.mocked_get_global_settings):
+            worker = test_parser_bot.DummyParserBot('test-bot.1')
+            self.assertEqual(worker._Bot__bot_id_full, 'test-bot.1')
+            self.assertEqual(worker._Bot__bot_id, 'test-bot')
+            self.assertFalse(worker.is_multithreaded)
+            self.assertEqual(worker._pipeline_configuration()['source_pipeline_internal_queue'],
+                             'test-bot-queue-internal-1')
+
+    def start_processes(self, worker) -> int:
+        """
+        Starts two worker processes running the function worker(bot, bot_id).
+        """
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        with mock.patch.object(test_parser_bot.DummyParserBot, '_Bot__run_worker_process', worker):
+            exitcode = self.bot._Bot__start_processes(2)
+        self.loglines_buffer = self.log_stream.getvalue()
+        self.loglines = self.loglines_buffer.splitlines()
+        return exitcode
+
+    def test_processes_exitcode(self):
+        """
+        Test that a worker killed by a signal results in a non-zero exit code.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.run_bot()
+
+        def worker(bot, bot_id):
+            if bot_id == 'test-bot.0':
+                os.kill(os.getpid(), signal.SIGKILL)
+
+        self.assertEqual(self.start_processes(worker), 1)
+        self.assertLogMatches("Worker process 'test-bot.0' was killed by signal 9.", levelname='ERROR')
+        self.assertNotRegexpMatchesLog(r"ERROR - Worker process 'test-bot\.1'")
+
+    def test_processes_sigterm(self):
+        """
+        Test that a SIGTERM is forwarded to the worker processes.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.run_bot()
+
+        def worker(bot, bot_id):
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if bot_id == 'test-bot.1':
+                time.sleep(0.5)  # until the parent process has started both workers
+                os.kill(os.getppid(), signal.SIGTERM)
+            time.sleep(10)
+
+        start = time.time()
+        self.assertEqual(self.start_processes(worker), 1)
+        self.assertLess(time.time() - start, 10)
+        self.assertLogMatches("Received signal 15, forwarding it to the worker processes.", levelname='INFO')
+        for bot_id in ('test-bot.0', 'test-bot.1'):
+            self.assertLogMatches("Worker process '%s' was killed by signal 15." % bot_id, levelname='ERROR')
+
+
+class TestNotMultithreadableBot(test.BotTestCase, unittest.TestCase):
+    """ Testing the parallelization of bots which are not thread-safe. """
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = DummySingleThreadParserBot
+        # the error message ends with a URL
+        cls.allowed_error_count = 1
+
+    def test_no_processes(self):
+        """
+        Test that no worker processes are started for bots which are not multithreadable.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        with mock.patch.object(DummySingleThreadParserBot, '_Bot__start_processes') as start_processes:
+            self.run_bot(parameters={'instances_processes': 2})
+        start_processes.assert_not_called()
+        self.assertLogMatches('Multiprocessing is configured, but is not available for this bot.*',
+                              levelname='ERROR')
+        self.assertOutputQueueLen(2)
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
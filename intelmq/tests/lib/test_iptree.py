@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: 2021 Sebastian Wagner
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# -*- coding: utf-8 -*-
+"""
+Tests the memory-mapped IP tree.
+"""
+import ipaddress
+import os
+import tempfile
+import time
+import unittest
+
+from intelmq.lib.iptree import IPTree, TREE_SUFFIX, merge_networks, open_tree
+
+NETWORKS = [('0.0.0.0/0', 'default'),
+            ('10.0.0.0/8', 'ten'),
+            ('10.1.0.0/16', 'ten-one'),
+            ('10.1.2.0/24', ['nested', 24]),
+            ('10.2.0.0/16', 'ten-two'),
+            ('255.255.255.255', 'broadcast'),
+            ('2001:db8::/32', 6),
+            ('2001:db8:1::/48', None),
+            ]
+
+
+class TestIPTree(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'tree')
+        IPTree.build(self.filename, NETWORKS)
+        self.tree = IPTree(self.filename)
+
+    def tearDown(self):
+        self.tree.close()
+        self.directory.cleanup()
+
+    def test_lookup(self):
+        self.assertEqual(self.tree.lookup('192.0.2.1'), 'default')
+        self.assertEqual(self.tree.lookup('10.0.255.255'), 'ten')
+        self.assertEqual(self.tree.lookup('10.1.1.1'), 'ten-one')
+        self.assertEqual(self.tree.lookup('10.1.2.0'), ['nested', 24])
+        self.assertEqual(self.tree.lookup('10.1.2.255'), ['nested', 24])
+        self.assertEqual(self.tree.lookup('10.1.3.0'), 'ten-one')
+        self.assertEqual(self.tree.lookup('10.2.0.0'), 'ten-two')
+        self.assertEqual(self.tree.lookup('11.0.0.0'), 'default')
+        self.assertEqual(self.tree.lookup('255.255.255.254'), 'default')
+        self.assertEqual(self.tree.lookup('255.255.255.255'), 'broadcast')
+
+    def test_lookup_ipv6(self):
+        self.assertIsNone(self.tree.lookup('::1'))
+        self.assertEqual(self.tree.lookup('2001:db8::1'), 6)
+        self.assertIsNone(self.tree.lookup('2001:db8:1::1'))
+        self.assertEqual(self.tree.lookup('2001:db8:2::1'), 6)
+        self.assertIsNone(self.tree.lookup('2001:db9::'))
+
+    def test_lookup_many(self):
+        ips = ['2001:db8::1', '10.1.2.3', '192.0.2.1', '10.1.2.3', '::1', '10.0.0.1']
+        self.assertEqual(self.tree.lookup_many(ips), [self.tree.lookup(ip) for ip in ips])
+        self.assertEqual(self.tree.lookup_many([]), [])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.tree.lookup('10.0.0.256')
+        with open(self.filename, 'wb') as handle:
+            handle.write(b'192.0.2.0/24\t1\n')
+        with self.assertRaises(ValueError):
+            IPTree(self.filename)
+
+    def test_replace(self):
+        """ The opened file can still be used after it has been replaced. """
+        IPTree.build(self.filename, [('10.0.0.0/8', 'new')])
+        self.assertEqual(self.tree.lookup('10.1.1.1'), 'ten-one')
+        with IPTree(self.filename) as tree:
+            self.assertEqual(tree.lookup('10.1.1.1'), 'new')
+            self.assertEqual(len(tree), 2)
+
+    def test_open_tree(self):
+        database = os.path.join(self.directory.name, 'database')
+        self.assertIsNone(open_tree(database))
+        with open(database, 'w'):
+            pass
+        IPTree.build(database + TREE_SUFFIX, NETWORKS)
+        with open_tree(database) as tree:
+            self.assertEqual(tree.lookup('10.0.0.1'), 'ten')
+        # the database has been changed after the tree has been built
+        os.utime(database, (time.time() + 10, time.time() + 10))
+        self.assertIsNone(open_tree(database))
+
+
+class TestMergeNetworks(unittest.TestCase):
+
+    def test_merge(self):
+        merged = merge_networks(['10.1.0.0/16', ' 10.0.0.1/8', '11.0.0.0/8', '192.0.2.0/24',
+                                 ipaddress.ip_network('2001:db8::/32')])
+        self.assertEqual(merged[4], ([int(ipaddress.ip_address('10.0.0.0')), int(ipaddress.ip_address('192.0.2.0'))],
+                                     [int(ipaddress.ip_address('11.255.255.255')), int(ipaddress.ip_address('192.0.2.255'))]))
+        self.assertEqual(merged[6], ([int(ipaddress.ip_address('2001:db8::'))],
+                                     [int(ipaddress.ip_address('2001:db8:ffff:ffff:ffff:ffff:ffff:ffff'))]))
+        self.assertEqual(merge_networks([]), {4: ([], []), 6: ([], [])})
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            merge_networks(['10.0.0.0/33'])
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -370,6 +370,42 @@ def test_factory_serialize(self):
         self.assertDictEqual(json.loads(expected),
                              json.loads(actual))
 
+    @unittest.skipIf(message.orjson is None, 'orjson is not installed.')
+    def test_factory_serialize_orjson(self):
+        """ Test if messages serialized with orjson are plain JSON. """
+        report = self.new_report(auto=True)
+        report.add('feed.name', 'Exämple')
+        actual = message.MessageFactory.serialize(report, message_format='orjson')
+        self.assertIsInstance(actual, bytes)
+        self.assertDictEqual({'__type': 'Report', 'feed.name': 'Exämple'}, json.loads(actual))
+        self.assertEqual(report, message.MessageFactory.unserialize(actual, harmonization=HARM))
+
+    @unittest.skipIf(message.msgpack is None, 'msgpack is not installed.')
+    def test_factory_serialize_msgpack(self):
+        """ Test if messages serialized with msgpack carry the marker. """
+        report = self.new_report(auto=True)
+        report.add('feed.name', 'Exämple')
+        actual = message.MessageFactory.serialize(report, message_format='msgpack')
+        self.assertTrue(actual.startswith(message.MSGPACK_MARKER))
+        self.assertEqual(report, message.MessageFactory.unserialize(actual, harmonization=HARM))
+
+    def test_factory_serialize_sent(self):
+        """ Test if the time of sending is serialized, but not part of the message. """
+        report = self.new_report(auto=True)
+        report.add('feed.name', 'Example')
+        actual = message.MessageFactory.serialize(report, sent=1600000000.5)
+        self.assertDictEqual({'__type': 'Report', 'feed.name': 'Example', '__sent': 1600000000.5},
+                             json.loads(actual))
+        self.assertNotIn('__sent', message.MessageFactory.serialize(report))
+        self.assertDictEqual(report, message.MessageFactory.unserialize(actual, harmonization=HARM))
+
+    def test_factory_serialize_invalid_format(self):
+        """ Test if an unknown message format is rejected. """
+        with self.assertRaises(ValueError):
+            message.MessageFactory.serialize(self.new_report(), message_format='xml')
+        with self.assertRaises(ValueError):
+            message.MessageFactory.unserialize(message.BINARY_FORMAT_MARKER + b'X1{}')
+
     def test_deep_copy_content(self):
         """ Test if deep_copy does return the same items. """
         report = self.new_report(examples=True)
@@ -377,10 +413,10 @@ def test_deep_copy_content(self):
                             set(report.items()))
 
     def test_deep_copy_items(self):
-        """ Test if deep_copy does not return the same objects. """
+        """ Test if deep_copy does not return the same objects. Keys are shared. """
         report = self.new_report(examples=True)
-        self.assertNotEqual(set(map(id, report.deep_copy())),
-                            set(map(id, report)))
+        self.assertNotEqual(set(map(id, report.deep_copy().values())),
+                            set(map(id, report.values())))
 
     def test_deep_copy_object(self):
         """ Test if depp_copy does not return the same object. """
@@ -603,6 +639,22 @@ def test_event_init(self):
         with self.assertRaises(exceptions.InvalidValue):
             message.MessageFactory.unserialize(event, harmonization=HARM)
 
+    def test_event_init_trusted(self):
+        """ Test if values are not validated with validate=False, but keys are. """
+        event = '{"__type": "Event", "source.asn": "foo", "extra.foo": "bar", "source.ip": ""}'
+        event = message.MessageFactory.unserialize(event, harmonization=HARM, validate=False)
+        self.assertEqual(event.to_dict(), {'source.asn': 'foo', 'extra.foo': 'bar'})
+        with self.assertRaises(exceptions.InvalidValue):
+            event.change('source.asn', 'bar')
+        with self.assertRaises(exceptions.InvalidKey):
+            message.MessageFactory.unserialize('{"__type": "Event", "foo.bar": 1}',
+                                               harmonization=HARM, validate=False)
+
+    def test_event_init_trusted_jsondict(self):
+        """ Test if a complete JSONDict field is split up with validate=False. """
+        event = message.Event({'extra': '{"foo": "bar"}'}, harmonization=HARM, validate=False)
+        self.assertEqual(event.to_dict(), {'extra.foo': 'bar'})
+
     def test_malware_hash_md5(self):
         """ Test if MD5 is checked correctly. """
         event = self.new_event()
@@ -763,6 +815,38 @@ def test_invalid_harm_key(self):
         with self.assertRaises(exceptions.InvalidKey):
             message.Event(harmonization={'event': {'foo.bar.': {}}})
 
+    def test_harmonization_schema_cache(self):
+        """ Test if the compiled harmonization schema is reused for the same configuration. """
+        event1 = message.Event(harmonization=HARM)
+        event2 = message.Event(harmonization=HARM)
+        self.assertIs(event1._Message__schema, event2._Message__schema)
+        harm = {'event': {'source.fqdn': {'type': 'FQDN', 'iregex': '^EXAMPLE'}}}
+        event3 = message.Event(harmonization=harm)
+        self.assertIsNot(event1._Message__schema, event3._Message__schema)
+        self.assertEqual(event3.is_valid('source.fqdn', 'example.com', sanitize=False), True)
+        self.assertEqual(event3.is_valid('source.fqdn', 'foo.example.com', sanitize=False), False)
+
+    def test_shared_keys(self):
+        """ Test if messages share the key strings and do not keep their input. """
+        event1 = message.MessageFactory.unserialize('{"__type": "Event", "source.ip": "192.0.2.1", "extra.foo": 1}',
+                                                    harmonization=HARM)
+        event2 = message.MessageFactory.unserialize('{"__type": "Event", "source.ip": "192.0.2.1", "extra.foo": 1}',
+                                                    harmonization=HARM)
+        for key1, key2 in zip(sorted(event1.keys()), sorted(event2.keys())):
+            self.assertIs(key1, key2)
+        self.assertFalse(hasattr(event1, 'iterable'))
+
+    def test_invalid_value_object(self):
+        """ Test if InvalidValue holds the input during initialization and the content afterwards. """
+        with self.assertRaises(exceptions.InvalidValue) as context:
+            message.Event({'source.ip': '192.0.2.1', 'source.asn': 'foo'}, harmonization=HARM)
+        self.assertEqual(json.loads(context.exception.object),
+                         {'source.ip': '192.0.2.1', 'source.asn': 'foo'})
+        event = message.Event({'source.ip': '192.0.2.1'}, harmonization=HARM)
+        with self.assertRaises(exceptions.InvalidValue) as context:
+            event.add('source.asn', 'foo')
+        self.assertEqual(json.loads(context.exception.object), {'source.ip': '192.0.2.1'})
+
     def test_invalid_extra_key_name(self):
         """ Test if error is raised if an extra field name is invalid. """
         event = message.Event(harmonization=HARM)
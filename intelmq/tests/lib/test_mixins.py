@@ -0,0 +1,113 @@
+# SPDX-FileCopyrightText: 2021 Sebastian Wagner
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+# -*- coding: utf-8 -*-
+"""
+Tests the mixins for bots.
+"""
+import os
+import time
+import unittest
+
+import intelmq.lib.test as test
+from intelmq.lib.mixins import CacheMixin
+
+
+class DummyCache(CacheMixin):
+    redis_cache_host = os.getenv('INTELMQ_PIPELINE_HOST', 'localhost')
+    redis_cache_db = 4
+    redis_cache_password = os.environ.get('INTELMQ_TEST_REDIS_PASSWORD')
+    redis_cache_ttl = 10
+
+
+class DummyLocalCache(DummyCache):
+    redis_cache_local_size = 2
+
+
+@test.skip_redis()
+class TestCacheMixin(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = DummyCache()
+        self.redis = self.cache.cache_get_redis_instance()
+        self.redis.delete('mixin-a', 'mixin-b', 'mixin-c')
+
+    def tearDown(self):
+        self.redis.delete('mixin-a', 'mixin-b', 'mixin-c')
+
+    def test_set_ttl(self):
+        self.cache.cache_set('mixin-a', 'value')
+        self.assertEqual(self.cache.cache_get('mixin-a'), 'value')
+        self.assertEqual(self.redis.ttl('mixin-a'), 10)
+        self.cache.cache_set('mixin-a', 'value', ttl=100)
+        self.assertEqual(self.redis.ttl('mixin-a'), 100)
+        self.cache.cache_set('mixin-a', 'value', ttl=0)
+        self.assertEqual(self.redis.ttl('mixin-a'), -1)
+
+    def test_set_if_absent(self):
+        self.assertTrue(self.cache.cache_set_if_absent('mixin-a', 'first'))
+        self.assertFalse(self.cache.cache_set_if_absent('mixin-a', 'second'))
+        self.assertEqual(self.cache.cache_get('mixin-a'), 'first')
+        self.assertEqual(self.redis.ttl('mixin-a'), 10)
+
+    def test_many(self):
+        self.assertEqual(self.cache.cache_get_many([]), [])
+        self.cache.cache_set_many({'mixin-a': 'a', 'mixin-b': 1}, ttl=100)
+        self.assertEqual(self.cache.cache_get_many(['mixin-a', 'mixin-c', 'mixin-b']),
+                         ['a', None, '1'])
+        self.assertEqual(self.redis.ttl('mixin-b'), 100)
+
+    def test_incr(self):
+        self.assertEqual(self.cache.cache_incr('mixin-a'), 1)
+        self.assertEqual(self.cache.cache_incr('mixin-a', 2, ttl=100), 3)
+        self.assertEqual(self.redis.ttl('mixin-a'), 100)
+        self.cache.cache_set('mixin-b', '5', ttl=100)
+        self.assertEqual(self.cache.cache_incr('mixin-b', ttl=0), 6)
+        self.assertEqual(self.redis.ttl('mixin-b'), -1)
+
+
+@test.skip_redis()
+class TestCacheMixinLocal(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = DummyLocalCache()
+        self.redis = self.cache.cache_get_redis_instance()
+        self.redis.delete('mixin-a', 'mixin-b', 'mixin-c')
+
+    def tearDown(self):
+        self.redis.delete('mixin-a', 'mixin-b', 'mixin-c')
+
+    def test_local(self):
+        self.cache.cache_set('mixin-a', 'value')
+        self.redis.delete('mixin-a')
+        self.assertEqual(self.cache.cache_get('mixin-a'), 'value')
+        self.assertTrue(self.cache.cache_exists('mixin-a'))
+        self.assertEqual(self.cache.cache_statistics(), {'cache_local_hits': 2, 'cache_local_misses': 0})
+
+    def test_remote_ttl(self):
+        self.redis.set('mixin-a', 'value', px=100)
+        self.assertEqual(self.cache.cache_get_many(['mixin-a', 'mixin-b']), ['value', None])
+        self.redis.set('mixin-b', 'other')
+        # missing keys are not remembered
+        self.assertEqual(self.cache.cache_get_many(['mixin-a', 'mixin-b']), ['value', 'other'])
+        time.sleep(0.15)
+        self.assertIsNone(self.cache.cache_get('mixin-a'))
+        self.assertEqual(self.cache.cache_statistics(), {'cache_local_hits': 1, 'cache_local_misses': 4})
+
+    def test_size(self):
+        self.cache.cache_set_many({'mixin-a': 'a', 'mixin-b': 'b', 'mixin-c': 'c'})
+        self.redis.delete('mixin-a', 'mixin-b', 'mixin-c')
+        self.assertEqual(self.cache.cache_get_many(['mixin-a', 'mixin-b', 'mixin-c']), [None, 'b', 'c'])
+
+    def test_not_local(self):
+        self.cache.cache_set('mixin-a', 1)
+        self.assertEqual(self.cache.cache_incr('mixin-a'), 2)
+        self.assertEqual(self.cache.cache_get('mixin-a'), '2')
+        self.cache.cache_set('mixin-b', 'value', ttl=0)
+        self.cache.cache_flush()
+        self.assertIsNone(self.cache.cache_get('mixin-b'))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -11,6 +11,7 @@
 
 import intelmq.lib.bot as bot
 import intelmq.lib.test as test
+import intelmq.lib.message as message
 import intelmq.lib.utils as utils
 
 RAW = """# ignore this
@@ -145,6 +146,12 @@ def test_event(self):
         self.run_bot()
         self.assertMessageEqual(0, EXAMPLE_EVENT)
 
+    @unittest.skipIf(message.orjson is None, 'orjson is not installed.')
+    def test_event_orjson(self):
+        """ Test DummyParserBot with orjson as message format. """
+        self.run_bot(parameters={'destination_pipeline_format': 'orjson'})
+        self.assertMessageEqual(0, EXAMPLE_EVENT)
+
     def test_missing_raw(self):
         """ Test DummyParserBot with missing raw. """
         self.input_message = EXAMPLE_EMPTY_REPORT
@@ -20,6 +20,7 @@
 import intelmq.lib.pipeline as pipeline
 import intelmq.lib.test as test
 import intelmq.lib.exceptions as exceptions
+from intelmq.lib.message import BINARY_FORMAT_MARKER
 
 SAMPLES = {'normal': [b'Lorem ipsum dolor sit amet',
                       'Lorem ipsum dolor sit amet'],
@@ -55,6 +56,12 @@ def test_creation_from_dict(self):
         self.pipe.set_queues(d1, 'destination')
         self.assertEqual(d2, self.pipe.destination_queues)
 
+    def test_internal_queue(self):
+        self.assertEqual(self.pipe.internal_queue, 'test-bot-input-internal')
+        self.pipe.pipeline_args['source_pipeline_internal_queue'] = 'test-bot-input-internal-1'
+        self.pipe.set_queues('test-bot-input', 'source')
+        self.assertEqual(self.pipe.internal_queue, 'test-bot-input-internal-1')
+
 
 class TestPythonlist(unittest.TestCase):
 
@@ -69,6 +76,11 @@ def test_receive(self):
         self.pipe.state['test-bot-input'] = [SAMPLES['normal'][0]]
         self.assertEqual(SAMPLES['normal'][1], self.pipe.receive())
 
+    def test_peek(self):
+        self.pipe.state['test-bot-input'] = [SAMPLES['normal'][0], SAMPLES['unicode'][0]]
+        self.assertEqual(self.pipe.receive(), SAMPLES['normal'][1])
+        self.assertEqual(self.pipe.peek(5), [SAMPLES['unicode'][1]])
+
     def test_send(self):
         self.pipe.send(SAMPLES['normal'][1])
         self.assertEqual(SAMPLES['normal'][0],
@@ -83,6 +95,14 @@ def test_send_unicode(self):
         self.assertEqual(SAMPLES['unicode'][0],
                          self.pipe.state['test-bot-output'][0])
 
+    def test_receive_binary(self):
+        """ Messages in a binary format are not decoded. """
+        binary = BINARY_FORMAT_MARKER + b'M1\xff'
+        self.pipe.state['test-bot-input'] = [binary]
+        self.assertEqual(binary, self.pipe.receive())
+        self.pipe.reject_message()
+        self.assertEqual(binary, self.pipe.receive())
+
     def test_count(self):
         self.pipe.send(SAMPLES['normal'][0])
         self.pipe.send(SAMPLES['normal'][1])
@@ -209,6 +229,162 @@ def tearDown(self):
         self.clear()
 
 
+@test.skip_redis()
+class TestRedisBatch(TestRedis):
+    """
+    The same tests as for TestRedis, but with batched receiving and acknowledging
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.pipe.pipeline_args['source_pipeline_batch_size'] = 3
+        self.pipe.set_queues('test', 'source')
+
+    def test_batch_order(self):
+        self.clear()
+        for i in range(5):
+            self.pipe.send(str(i))
+        received = []
+        for i in range(5):
+            received.append(self.pipe.receive())
+            self.pipe.acknowledge()
+        self.assertEqual(received, ['0', '1', '2', '3', '4'])
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-internal'),
+                         {'test': 0, 'test-internal': 0})
+
+    def test_peek(self):
+        self.clear()
+        for i in range(4):
+            self.pipe.send(str(i))
+        self.assertEqual(self.pipe.receive(), '0')
+        self.assertEqual(self.pipe.peek(5), ['1', '2'])
+        self.assertEqual(self.pipe.peek(1), ['1'])
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.receive(), '1')
+        self.assertEqual(self.pipe.peek(5), ['2'])
+
+    def test_batch_internal_queue(self):
+        """ The whole batch is kept in the internal queue until all messages are acknowledged. """
+        self.clear()
+        for i in range(4):
+            self.pipe.send(str(i))
+        self.assertEqual(self.pipe.receive(), '0')
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-internal'),
+                         {'test': 1, 'test-internal': 3})
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.receive(), '1')
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.count_queued_messages('test-internal'), {'test-internal': 3})
+        self.assertEqual(self.pipe.receive(), '2')
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-internal'),
+                         {'test': 1, 'test-internal': 0})
+
+    def test_batch_recovery(self):
+        """ Unacknowledged messages are received again after a restart. """
+        self.clear()
+        for i in range(3):
+            self.pipe.send(str(i))
+        self.pipe.receive()
+        self.pipe.acknowledge()
+        self.pipe.receive()
+        self.pipe.disconnect()
+        self.pipe.set_queues('test', 'source')
+        self.pipe.connect()
+        self.assertEqual(self.pipe.count_queued_messages('test-internal'), {'test-internal': 2})
+        self.pipe._has_message = False
+        self.assertEqual(self.pipe.receive(), '1')
+
+
+@test.skip_redis()
+class TestRedisSendBuffer(TestRedis):
+    """
+    The same tests as for TestRedis, but with buffered sending
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.pipe.pipeline_args['destination_pipeline_batch_size'] = 3
+        self.pipe.pipeline_args['destination_pipeline_batch_timeout'] = 60
+        self.pipe.set_queues(['test', 'test-2'], 'destination')
+
+    def clear(self):
+        super().clear()
+        self.pipe.clear_queue('test-2')
+
+    def send(self, message):
+        self.pipe.send(message)
+        self.pipe.flush()
+
+    def test_send_receive(self):
+        self.clear()
+        self.send(SAMPLES['normal'][0])
+        self.assertEqual(SAMPLES['normal'][1], self.pipe.receive())
+
+    def test_send_receive_unicode(self):
+        self.clear()
+        self.send(SAMPLES['unicode'][1])
+        self.assertEqual(SAMPLES['unicode'][1], self.pipe.receive())
+
+    def test_has_message(self):
+        self.assertFalse(self.pipe._has_message)
+        self.send(SAMPLES['normal'][0])
+        self.pipe.receive()
+        self.assertTrue(self.pipe._has_message)
+
+    def test_reject(self):
+        self.send(SAMPLES['normal'][0])
+        self.pipe.receive()
+        self.pipe.reject_message()
+        self.assertEqual(SAMPLES['normal'][1], self.pipe.receive())
+
+    def test_acknowledge(self):
+        self.send(SAMPLES['normal'][0])
+        self.pipe.receive()
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.count_queued_messages('test')['test'], 0)
+        self.assertEqual(self.pipe.count_queued_messages('test-internal')['test-internal'], 0)
+
+    def test_bad_encoding_and_pop(self):
+        self.send(SAMPLES['badencoding'])
+        try:
+            self.pipe.receive()
+        except exceptions.DecodingError:
+            pass
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.count_queued_messages('test-bot-input')['test-bot-input'], 0)
+        self.assertEqual(self.pipe.count_queued_messages('test-bot-input-internal')['test-bot-input-internal'], 0)
+
+    def test_buffer_size(self):
+        """ The buffer is sent when it's full, in the original order. """
+        self.clear()
+        self.pipe.send('0')
+        self.pipe.send('1')
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-2'),
+                         {'test': 0, 'test-2': 0})
+        self.pipe.send('2')
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-2'),
+                         {'test': 3, 'test-2': 3})
+        received = []
+        for i in range(3):
+            received.append(self.pipe.receive())
+            self.pipe.acknowledge()
+        self.assertEqual(received, ['0', '1', '2'])
+
+    def test_buffer_timeout(self):
+        self.clear()
+        self.pipe.send_buffer_timeout = 0
+        self.pipe.send('0')
+        self.assertEqual(self.pipe.count_queued_messages('test'), {'test': 1})
+
+    def test_disconnect(self):
+        """ Buffered messages are sent on disconnect. """
+        self.clear()
+        self.pipe.send('0')
+        self.pipe.disconnect()
+        self.assertEqual(self.pipe.count_queued_messages('test'), {'test': 1})
+
+
 @test.skip_exotic()
 class TestAmqp(unittest.TestCase):
 
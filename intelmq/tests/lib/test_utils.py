@@ -15,6 +15,7 @@
 import io
 import os
 import tempfile
+import time
 import unittest
 import unittest.mock
 import requests
@@ -230,6 +231,121 @@ def test_seconds_to_human(self):
         self.assertEqual(utils.seconds_to_human(64.2, precision=1),
                          '1.0m 4.2s')
 
+    def test_histogram(self):
+        """ Test Histogram """
+        histogram = utils.Histogram((0.1, 1, float('inf')))
+        self.assertIsNone(histogram.percentile(50))
+        for value in (0.05, 0.1, 0.5, 0.7, 2):
+            histogram.add(value)
+        self.assertEqual(histogram.counts, [2, 2, 1])
+        self.assertAlmostEqual(histogram.mean(), 0.67)
+        self.assertEqual(histogram.percentile(40), 0.1)
+        self.assertEqual(histogram.percentile(50), 1)
+        self.assertEqual(histogram.percentile(99), float('inf'))
+        as_dict = histogram.to_dict()
+        self.assertEqual(as_dict['0.1'], 2)
+        self.assertEqual(as_dict['inf'], 1)
+        self.assertEqual(as_dict['count'], 5)
+        restored = utils.Histogram.from_dict({key.encode(): str(value).encode() for key, value in as_dict.items()})
+        self.assertEqual(restored.to_dict(), as_dict)
+        restored.update(histogram)
+        self.assertEqual(restored.counts, [4, 4, 2])
+        with self.assertRaises(ValueError):
+            restored.update(utils.Histogram())
+
+    def test_lookup_pool(self):
+        """ Test LookupPool """
+        calls = []
+
+        def lookup(value):
+            calls.append(value)
+            if value < 0:
+                raise ValueError(value)
+            return value * 2
+
+        pool = utils.LookupPool(lookup, 2)
+        for key in (1, 2, 1):
+            pool.submit(key, key)
+        self.assertEqual(pool.result(1, 1), 2)
+        self.assertEqual(pool.result(2, 2), 4)
+        self.assertEqual(sorted(calls), [1, 2])
+        pool.retain([2])
+        self.assertEqual(list(pool.futures), [2])
+        pool.submit(-1, -1)
+        with self.assertRaises(ValueError):
+            pool.result(-1, -1)
+        pool.shutdown()
+        self.assertEqual(pool.futures, {})
+
+        synchronous = utils.LookupPool(lookup, 0)
+        synchronous.submit(3, 3)
+        self.assertEqual(synchronous.futures, {})
+        self.assertEqual(synchronous.result(3, 3), 6)
+
+    def test_database_watcher(self):
+        """ Test DatabaseWatcher """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'database')
+            with open(filename, 'w') as handle:
+                handle.write('1')
+
+            def load():
+                with open(filename) as handle:
+                    return int(handle.read())
+
+            watcher = utils.DatabaseWatcher([filename], load, interval=0)
+            self.assertEqual(watcher.database, 1)
+            self.assertFalse(watcher.check())
+            with open(filename + '.tmp', 'w') as handle:
+                handle.write('invalid')
+            os.replace(filename + '.tmp', filename)
+            self.assertFalse(watcher.check())
+            self.assertEqual(watcher.database, 1)
+            with open(filename + '.tmp', 'w') as handle:
+                handle.write('2')
+            os.replace(filename + '.tmp', filename)
+            self.assertTrue(watcher.check())
+            self.assertEqual(watcher.database, 2)
+            watcher.stop()
+
+            with open(filename + '.tmp', 'w') as handle:
+                handle.write('3')
+            watcher = utils.DatabaseWatcher([filename], load, interval=0.01)
+            os.replace(filename + '.tmp', filename)
+            for _ in range(100):
+                if watcher.database == 3:
+                    break
+                time.sleep(0.01)
+            watcher.stop()
+            self.assertEqual(watcher.database, 3)
+
+    def test_write_file_atomically(self):
+        """ Test write_file_atomically """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'sub', 'database')
+            utils.write_file_atomically(filename, b'1')
+            with open(filename) as handle:
+                self.assertEqual(handle.read(), '1')
+            calls = []
+
+            def write(temporary):
+                calls.append(temporary)
+                with open(temporary, 'w') as handle:
+                    handle.write('22')
+
+            utils.write_file_atomically(filename, write, lambda temporary: calls.append(os.path.getsize(temporary)))
+            self.assertEqual(calls, [filename + '.tmp', 2])
+            self.assertEqual(os.listdir(os.path.dirname(filename)), ['database'])
+            self.assertEqual(os.path.getsize(filename), 2)
+
+    def test_bots_without_database_reload(self):
+        """ Test bots_without_database_reload """
+        runtime_conf = {'default': {'parameters': {}},
+                        'watching': {'parameters': {'database_reload_interval': 10}},
+                        'not-watching': {'parameters': {'database_reload_interval': 0}}}
+        self.assertEqual(utils.bots_without_database_reload(runtime_conf, runtime_conf, 60), ['not-watching'])
+        self.assertEqual(utils.bots_without_database_reload(runtime_conf, runtime_conf, 0), ['default', 'not-watching'])
+
     def test_version_smaller(self):
         """ Test version_smaller """
         self.assertTrue(utils.version_smaller((1, 0, 0), (1, 1, 0)))
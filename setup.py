@@ -89,6 +89,7 @@
             'intelmq_psql_initdb = intelmq.bin.intelmq_psql_initdb:main',
             'intelmq.bots.experts.sieve.validator = intelmq.bots.experts.sieve.validator:main',
             'intelmqsetup = intelmq.bin.intelmqsetup:main',
+            'intelmq-benchmark = intelmq.bin.intelmq_benchmark:main',
         ] + BOTS,
     },
 )